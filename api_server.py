@@ -13,7 +13,10 @@ import urllib.error
 import socket
 import config
 import logging
+import threading
 from time import time
+from quality_ladder import get_quality_ladder
+from rate_limiter import RateLimitExceeded, session_scope
 
 # Improvement 6: Structured Logging
 logging.basicConfig(
@@ -43,24 +46,62 @@ def check_rate_limit():
 # Initialize chatbot and emotion analyzer (singleton instances)
 chatbot = None
 emotion_analyzer = None
+therapy_system = None
+memory_system = None
+db = None
+_chatbot_lock = threading.Lock()
+_db_lock = threading.Lock()
+_warmup_thread = None
 
 def get_chatbot():
     """Get or create chatbot instance without crashing on import errors"""
     global chatbot
     if chatbot is None:
-        try:
-            # Lazy import to avoid failing API boot when deps are missing
-            from crew_bot import EmotionalSupportCrew  # type: ignore
-        except Exception as e:
-            print(f"Error importing crew_bot module: {e}")
-            return None
-        try:
-            chatbot = EmotionalSupportCrew()
-        except Exception as e:
-            print(f"Error initializing chatbot: {e}")
-            return None
+        with _chatbot_lock:
+            if chatbot is None:
+                try:
+                    # Lazy import to avoid failing API boot when deps are missing
+                    from crew_bot import EmotionalSupportCrew  # type: ignore
+                except Exception as e:
+                    print(f"Error importing crew_bot module: {e}")
+                    return None
+                try:
+                    chatbot = EmotionalSupportCrew()
+                except Exception as e:
+                    print(f"Error initializing chatbot: {e}")
+                    return None
     return chatbot
 
+def get_db():
+    """Get or open the shared Database (per-thread connections inside); None if unavailable"""
+    global db
+    if db is None:
+        with _db_lock:
+            if db is None:
+                try:
+                    from database import ArchiveJob
+                    from sharding import open_database
+                    db = open_database(config.DB_PATH)
+                    if config.ARCHIVE_ENABLED:
+                        ArchiveJob(db).start()
+                except Exception as e:
+                    print(f"Error opening database: {e}")
+                    return None
+    return db
+
+def _warm_up():
+    bot = get_chatbot()
+    if bot:
+        bot.warm_up()
+
+def start_warmup():
+    """Build the chatbot in a background thread so readiness probes never wait on it"""
+    global _warmup_thread
+    with _chatbot_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=_warm_up, name="chatbot-warmup", daemon=True)
+            _warmup_thread.start()
+
 def get_emotion_analyzer():
     """Get or create emotion analyzer instance without crashing on import errors"""
     global emotion_analyzer
@@ -77,6 +118,77 @@ def get_emotion_analyzer():
             return None
     return emotion_analyzer
 
+def get_therapy_system():
+    """Get or create the rule-based TherapySystem without crashing on import errors"""
+    global therapy_system
+    if therapy_system is None:
+        try:
+            from therapy_agent_system import TherapySystem
+            therapy_system = TherapySystem()
+        except Exception as e:
+            print(f"Error loading therapy system: {e}")
+            return None
+    return therapy_system
+
+def deterministic_response(message):
+    """Rule-based answer used as the hedge against a slow LLM"""
+    analyzer = get_emotion_analyzer()
+    emotion, intensity, coping = "neutral", 0.5, None
+    if analyzer:
+        analysis = analyzer.analyze_text(message)
+        emotion = analysis.get('primary_emotion', 'neutral')
+        intensity = abs(analysis.get('sentiment', {}).get('polarity', 0))
+        coping = analysis.get('coping_suggestion')
+
+    therapist = get_therapy_system()
+    if therapist is None:
+        from free_ai_backends import FallbackResponses
+        text = FallbackResponses().generate(message, emotion)
+        return {"response": text, "emotion": emotion, "coping_suggestion": coping, "is_crisis": False}
+
+    result = therapist.process_input(message, emotion, intensity)
+    return {
+        "response": result.get("response"),
+        "emotion": "crisis" if result.get("is_crisis") else emotion,
+        "coping_suggestion": coping,
+        "is_crisis": result.get("is_crisis", False)
+    }
+
+def canned_response(message):
+    """Cheapest tier: keyword emotion plus FallbackResponses text"""
+    lowered = message.lower()
+    if any(keyword in lowered for keyword in config.CRISIS_KEYWORDS):
+        return {"response": config.CRISIS_RESPONSE, "emotion": "crisis",
+                "coping_suggestion": None, "is_crisis": True}
+    emotion = next((e for e, words in config.EMOTION_KEYWORDS.items()
+                    if any(w in lowered for w in words)), "neutral")
+    from free_ai_backends import FallbackResponses
+    return {
+        "response": FallbackResponses().generate(message, emotion),
+        "emotion": emotion,
+        "coping_suggestion": (config.COPING_STRATEGIES.get(emotion) or [None])[0],
+        "is_crisis": False
+    }
+
+def available_tiers(bot):
+    """Quality-ladder tiers that can be served right now"""
+    tiers = ["rules", "canned"]
+    if bot is not None:
+        tiers[:0] = ["crew", "llm"] if bot.crew_available() else ["llm"]
+    return tiers
+
+def respond_at_tier(bot, message, tier):
+    """Serve ``message`` at the given quality-ladder tier"""
+    if tier in ("crew", "llm"):
+        use_crew = tier == "crew"
+        if config.HEDGE_ENABLED:
+            return bot.get_response_hedged(message, lambda: deterministic_response(message),
+                                           use_crew=use_crew)
+        return bot.get_response(message, use_crew=use_crew)
+    if tier == "rules":
+        return {**deterministic_response(message), "response_source": "deterministic"}
+    return {**canned_response(message), "response_source": "deterministic"}
+
 def check_groq_status():
     """Verify Groq API configuration status.
     
@@ -108,11 +220,16 @@ def health_check():
     groq_stat = check_groq_status()
     status["groq"] = groq_stat.get("status", "unknown")
 
-    # Check chatbot status
+    # Check chatbot status without blocking on engine imports
     try:
-        bot = get_chatbot()
-        status["chatbot"] = "ready" if bot else "not_initialized"
-        
+        start_warmup()
+        bot = chatbot
+        warming = bot is None and _warmup_thread.is_alive()
+        if warming:
+            status["chatbot"] = "warming_up"
+        else:
+            status["chatbot"] = "ready" if bot else "not_initialized"
+
         # Check if actually using an engine
         if bot:
             if bot.llm or bot.groq_client:
@@ -122,7 +239,7 @@ def health_check():
                 status["status"] = "degraded"
                 status["message"] = "Chatbot initialized but no LLM engine active."
         
-        if not bot and status["groq"] != "configured":
+        if not bot and not warming and status["groq"] != "configured":
             status["status"] = "degraded"
             status["message"] = "API OK; Groq not configured. Please add GROQ_API_KEY."
     except Exception as e:
@@ -169,6 +286,41 @@ def flight_check():
             "message": f"Error initializing chatbot: {str(e)}"
         }
 
+    # LLM backend circuit breakers
+    try:
+        from circuit_breaker import breaker_states
+        checks["services"]["llm_backends"] = breaker_states()
+    except Exception as e:
+        print(f"Error reading breaker states: {e}")
+
+    # Client-side provider quotas
+    try:
+        from rate_limiter import rate_limit_stats
+        checks["services"]["rate_limits"] = rate_limit_stats()
+    except Exception as e:
+        print(f"Error reading rate limit stats: {e}")
+
+    # Single-flight coalescing of identical in-flight prompts
+    try:
+        from single_flight import single_flight_stats
+        checks["services"]["single_flight"] = single_flight_stats()
+    except Exception as e:
+        print(f"Error reading single-flight stats: {e}")
+
+    # Adaptive quality ladder (only present when QUALITY_LADDER_ENABLED)
+    ladder = get_quality_ladder()
+    checks["services"]["quality_ladder"] = ladder.snapshot() if ladder else {"status": "disabled"}
+
+    # Response cache metrics (only present when RESPONSE_CACHE_ENABLED)
+    try:
+        from response_cache import cache_stats
+        checks["services"]["response_cache"] = {
+            "status": "enabled" if config.RESPONSE_CACHE_ENABLED else "disabled",
+            "namespaces": cache_stats()
+        }
+    except Exception as e:
+        print(f"Error reading cache stats: {e}")
+
     # Overall
     all_ready = (
         checks["services"].get("api_server", {}).get("status") == "online"
@@ -198,25 +350,50 @@ def chat():
         if not message:
             return jsonify({"error": "Message is required"}), 400
         
-        # Get chatbot instance
+        # Get chatbot instance (the quality ladder can answer without one)
         bot = get_chatbot()
-        if bot is None:
+        ladder = get_quality_ladder()
+        if bot is None and ladder is None:
             return jsonify({
                 "response": "I apologize, but I'm having trouble connecting to the AI service right now. Please verify the Groq API configuration.",
                 "error": "Chatbot initialization failed"
             }), 500
         
         # Get chatbot response (CrewAI returns the structured dict)
-        response_data = bot.get_response(message)
+        session_id = data.get('session_id') or request.remote_addr
+        tier = ladder.choose(available_tiers(bot)) if ladder else None
+        try:
+            with session_scope(session_id):
+                if ladder:
+                    with ladder.track(tier) as outcome:
+                        response_data = respond_at_tier(bot, message, tier)
+                        # A hedged rules answer on an LLM tier means the LLM missed its SLO
+                        outcome["ok"] = not response_data.get("error") and (
+                            tier not in ("crew", "llm") or response_data.get("response_source", "llm") == "llm"
+                        )
+                elif config.HEDGE_ENABLED:
+                    response_data = bot.get_response_hedged(message, lambda: deterministic_response(message))
+                else:
+                    response_data = bot.get_response(message)
+        except RateLimitExceeded as e:
+            # Backpressure: fail fast with a retry hint instead of a slow fallback
+            retry_after = max(1, int(e.retry_after + 0.999))
+            logger.warning(f"Provider quota saturated ({e.provider}); retry after {retry_after}s")
+            response = jsonify({
+                "error": "We're getting a lot of messages right now. Please try again in a moment.",
+                "retry_after": retry_after
+            })
+            response.headers["Retry-After"] = str(retry_after)
+            return response, 429
         
-        # Persistence Logic
+        # Persistence Logic: only signed-in users have a conversation to append to
         database = get_db()
-        if database:
+        user_id = session_user_id()
+        conv_id = None
+        if database and user_id is not None:
             try:
-                # We use a default user_id of 1 if no session is provided 
-                user_id = 1 
-                conv_id = 1 # Simple default for testing/prototype
-                
+                conv_id = conversation_for(database, user_id, data.get('conversation_id'))
+
                 # Save user message
                 database.save_message(
                     conv_id, "user", message, 
@@ -234,7 +411,10 @@ def chat():
             "response": response_data.get("response", "I'm here for you. Can you tell me more?"),
             "emotion": response_data.get("emotion"),
             "is_crisis": response_data.get("is_crisis", False),
-            "coping_suggestion": response_data.get("coping_suggestion")
+            "coping_suggestion": response_data.get("coping_suggestion"),
+            "response_source": response_data.get("response_source", "llm"),
+            "quality_tier": tier,
+            "conversation_id": conv_id
         })
         
     except Exception as e:
@@ -244,6 +424,89 @@ def chat():
             "error": str(e)
         }), 500
 
+def session_user_id():
+    """User ID from an ``Authorization: Bearer <session token>`` header, if valid"""
+    from auth import verify_session_token
+    header = request.headers.get("Authorization", "")
+    if not header.startswith("Bearer "):
+        return None
+    claims = verify_session_token(header[len("Bearer "):].strip())
+    return claims["uid"] if claims else None
+
+def conversation_for(database, user_id, requested):
+    """The caller's conversation to append to: ``requested`` if they own it, else a new one"""
+    try:
+        conv_id = int(requested)
+    except (TypeError, ValueError):
+        conv_id = None
+    if conv_id is not None and database.get_conversation_owner(conv_id) == user_id:
+        return conv_id
+    return database.create_conversation(user_id)
+
+@app.route('/api/login', methods=['POST'])
+def login():
+    """Check credentials once and hand out a signed session token"""
+    if not check_rate_limit():
+        return jsonify({"error": "Too many requests. Please take a deep breath and try again later."}), 429
+
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict) or not data.get('username') or not data.get('password'):
+        return jsonify({"error": "Username and password are required"}), 400
+    database = get_db()
+    if database is None:
+        return jsonify({"error": "Database unavailable"}), 503
+    try:
+        user = database.authenticate_user(data['username'], data['password'])
+    except RateLimitExceeded as e:
+        retry_after = max(1, int(e.retry_after + 0.999))
+        response = jsonify({"error": "Too many sign-ins right now. Please try again in a moment.",
+                            "retry_after": retry_after})
+        response.headers["Retry-After"] = str(retry_after)
+        return response, 429
+    if user is None:
+        return jsonify({"error": "Invalid username or password"}), 401
+    return jsonify({
+        "user_id": user["user_id"],
+        "username": user["username"],
+        "session_token": user["session_token"],
+        "expires_in": config.SESSION_TIMEOUT
+    })
+
+@app.route('/api/history', methods=['GET'])
+def history():
+    """
+    One page of the caller's stored chat history, newest first by page
+
+    Needs a session token for the user owning ``conversation_id``; the
+    keyset cursor for the next older page comes back in ``before``.
+    """
+    if not check_rate_limit():
+        return jsonify({"error": "Too many requests. Please take a deep breath and try again later."}), 429
+    user_id = session_user_id()
+    if user_id is None:
+        return jsonify({"error": "Authentication required"}), 401
+    database = get_db()
+    if database is None:
+        return jsonify({"error": "Database unavailable"}), 503
+    try:
+        conv_id = int(request.args['conversation_id'])
+        limit = max(1, min(int(request.args.get('limit', config.HISTORY_PAGE_SIZE)), 500))
+        before = request.args.get('before')
+        if before:
+            timestamp_ms, message_id = before.split(',')
+            before = (int(timestamp_ms), int(message_id))
+    except (KeyError, ValueError):
+        return jsonify({"error": "Invalid pagination parameters"}), 400
+    # Someone else's conversation looks the same as a missing one
+    if database.get_conversation_owner(conv_id) != user_id:
+        return jsonify({"error": "Conversation not found"}), 404
+
+    messages, older = database.get_message_page(conv_id, limit, before)
+    return jsonify({
+        "messages": [m._asdict() for m in messages],
+        "before": f"{older[0]},{older[1]}" if older else None
+    })
+
 @app.route('/api/therapy', methods=['POST'])
 def therapy_session():
     """Advanced therapy endpoint with multi-agent system and long-term memory"""
@@ -256,17 +519,11 @@ def therapy_session():
             return jsonify({"error": "Message is required"}), 400
 
         # Lazy-load therapy system
-        global therapy_system
-        if therapy_system is None:
-            try:
-                from therapy_agent_system import TherapySystem
-                therapy_system = TherapySystem()
-            except Exception as e:
-                print(f"Error loading therapy system: {e}")
-                return jsonify({
-                    "response": "I'm here for you. Can you tell me more about what you're feeling?",
-                    "error": "Therapy system unavailable, using fallback"
-                }), 200
+        if get_therapy_system() is None:
+            return jsonify({
+                "response": "I'm here for you. Can you tell me more about what you're feeling?",
+                "error": "Therapy system unavailable, using fallback"
+            }), 200
 
         # Lazy-load memory system
         global memory_system
@@ -378,4 +635,5 @@ def reset_conversation():
 if __name__ == '__main__':
     print("Starting Flask API server on http://localhost:5000")
     print("Cloud Inference enabled via Groq API.")
+    start_warmup()
     app.run(debug=True, port=5000, host='0.0.0.0')
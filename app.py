@@ -8,7 +8,8 @@ import plotly.graph_objects as go
 import pandas as pd
 from crew_bot import EmotionalSupportCrew
 from emotion_analyzer import EmotionAnalyzer
-from database import Database
+from sharding import open_database
+from rate_limiter import RateLimitExceeded
 import config
 
 # Page configuration
@@ -75,7 +76,7 @@ def init_session_state():
     if 'emotion_analyzer' not in st.session_state:
         st.session_state.emotion_analyzer = EmotionAnalyzer()
     if 'db' not in st.session_state:
-        st.session_state.db = Database()
+        st.session_state.db = open_database()
     if 'current_conversation_id' not in st.session_state:
         st.session_state.current_conversation_id = None
     if 'messages' not in st.session_state:
@@ -98,7 +99,12 @@ def login_page():
 
             if submit:
                 if username and password:
-                    user_data = st.session_state.db.authenticate_user(username, password)
+                    try:
+                        user_data = st.session_state.db.authenticate_user(username, password)
+                    except RateLimitExceeded as e:
+                        # Password hashing is saturated; nothing was checked yet
+                        st.warning(f"We're very busy right now. Please try again in {max(1, round(e.retry_after))} seconds.")
+                        return
                     if user_data:
                         st.session_state.authenticated = True
                         st.session_state.user_data = user_data
@@ -127,9 +133,13 @@ def login_page():
                 elif len(new_password) < 6:
                     st.error("Password must be at least 6 characters long")
                 else:
-                    user_id = st.session_state.db.create_user(
-                        new_username, new_email, new_password, new_full_name
-                    )
+                    try:
+                        user_id = st.session_state.db.create_user(
+                            new_username, new_email, new_password, new_full_name
+                        )
+                    except RateLimitExceeded as e:
+                        st.warning(f"We're very busy right now. Please try again in {max(1, round(e.retry_after))} seconds.")
+                        return
                     if user_id:
                         st.success("Account created successfully! Please login.")
                     else:
@@ -244,22 +254,22 @@ def mood_tracker():
     # Time period selector
     days = st.selectbox("Time Period", [7, 14, 30, 60, 90], index=2)
 
-    # Get mood history
-    mood_history = st.session_state.db.get_mood_history(user_id, days)
+    # Get per-day mood aggregates (served from the daily rollup)
+    mood_history = st.session_state.db.get_daily_mood(user_id, days)
 
     if mood_history:
         # Convert to DataFrame
         df = pd.DataFrame(mood_history)
-        df['logged_at'] = pd.to_datetime(df['logged_at'])
+        df['day'] = pd.to_datetime(df['day'])
 
         # Mood timeline chart
         st.subheader("Mood Timeline")
         fig = go.Figure()
         fig.add_trace(go.Scatter(
-            x=df['logged_at'],
-            y=df['mood_score'],
+            x=df['day'],
+            y=df['avg_mood'],
             mode='lines+markers',
-            name='Mood Score',
+            name='Daily Average Mood',
             line=dict(color='#4CAF50', width=2),
             marker=dict(size=8)
         ))
@@ -286,14 +296,14 @@ def mood_tracker():
         # Statistics
         col1, col2, col3 = st.columns(3)
         with col1:
-            avg_mood = df['mood_score'].mean()
+            avg_mood = (df['avg_mood'] * df['count']).sum() / df['count'].sum()
             st.metric("Average Mood", f"{avg_mood:.2f}")
         with col2:
-            total_entries = len(df)
+            total_entries = int(df['count'].sum())
             st.metric("Total Entries", total_entries)
         with col3:
             if len(df) > 1:
-                trend = df['mood_score'].iloc[-1] - df['mood_score'].iloc[0]
+                trend = df['avg_mood'].iloc[-1] - df['avg_mood'].iloc[0]
                 st.metric("Trend", f"{trend:.2f}", delta=f"{trend:.2f}")
 
     else:
@@ -369,9 +379,10 @@ def profile_settings():
                     st.write(f"Messages: {conv['message_count']}")
                     if st.button(f"Load Conversation", key=f"load_{conv['conversation_id']}"):
                         # Load conversation
-                        messages = st.session_state.db.get_conversation_history(conv['conversation_id'])
+                        # Only the latest page; long histories stay on disk
+                        messages, _ = st.session_state.db.get_message_page(conv['conversation_id'])
                         st.session_state.messages = [
-                            {"role": msg['role'], "content": msg['content'], "emotion": msg['emotion']}
+                            {"role": msg.role, "content": msg.content, "emotion": msg.emotion}
                             for msg in messages
                         ]
                         st.session_state.current_conversation_id = conv['conversation_id']
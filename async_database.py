@@ -0,0 +1,249 @@
+"""
+Async facade over Database for event-loop callers
+
+sqlite3 calls block, so every method here runs on a small dedicated
+thread pool (Database already keeps one connection per thread) and the
+event loop only ever awaits a future. Message and mood inserts that
+arrive while a write is in progress are committed together: one drain
+job takes everything queued, runs it inside Database.batch(), and
+resolves each caller's future with its own result or exception. With a
+ShardedDatabase each shard's share is committed, and settled, on its own.
+"""
+import asyncio
+import contextlib
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import config
+from database import Database, MessageRow
+
+
+def _settle(settled: List[Tuple[asyncio.Future, Any, Optional[BaseException]]]):
+    for future, result, error in settled:
+        if future.done():
+            # The awaiting task was cancelled; the write happened anyway
+            continue
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+
+class AsyncDatabase:
+    """
+    Awaitable versions of the Database (or ShardedDatabase) methods
+
+    Args:
+        db: Database to wrap (default sharding.open_database())
+        workers: Pool threads, one connection each (default config.DB_ASYNC_WORKERS)
+        max_batch: Most inserts sharing one commit (default config.DB_ASYNC_MAX_BATCH)
+    """
+
+    def __init__(self, db=None, workers: Optional[int] = None, max_batch: Optional[int] = None):
+        if db is None:
+            from sharding import open_database
+            db = open_database()
+            self._owns_db = True
+        else:
+            self._owns_db = False
+        self.db = db
+        self.max_batch = max_batch or config.DB_ASYNC_MAX_BATCH
+        self._pool = ThreadPoolExecutor(workers or config.DB_ASYNC_WORKERS, thread_name_prefix="db-async")
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[asyncio.Future, Callable, Any, tuple]] = []
+        self._draining = False
+        self._closed = False
+        self.batches = 0
+        self.rows_batched = 0
+
+    async def _run(self, fn, *args, **kwargs):
+        """Run a blocking call on the pool"""
+        if self._closed:
+            raise ConnectionError("AsyncDatabase is closed")
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._pool, functools.partial(fn, *args, **kwargs))
+        except RuntimeError:
+            # close() shut the pool down after the check above
+            raise ConnectionError("AsyncDatabase is closed")
+        return await future
+
+    def _conversation_shard(self, conversation_id: int) -> Optional[Database]:
+        """Pool thread: the Database whose commit stores this conversation's messages"""
+        if isinstance(self.db, Database):
+            return self.db
+        return self.db.shard_for_conversation(conversation_id)
+
+    def _user_shard(self, user_id: int) -> Database:
+        """Pool thread: the Database whose commit stores this user's mood logs"""
+        if isinstance(self.db, Database):
+            return self.db
+        return self.db.shard_for_user(user_id)
+
+    async def _write(self, route, method, *args):
+        """
+        Queue an insert for the next shared commit and wait for it
+
+        ``route(args[0])`` names the Database that commits the row, so
+        writes are only batched with others landing in the same file.
+        """
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            # Checked under the lock close() takes, so the pool is still up for the drain job
+            if self._closed:
+                raise ConnectionError("AsyncDatabase is closed")
+            self._pending.append((future, route, method, args))
+            if not self._draining:
+                self._draining = True
+                self._pool.submit(self._drain)
+        return await future
+
+    def _drain(self):
+        """Pool thread: commit queued inserts in batches until none are left"""
+        while True:
+            with self._lock:
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                if not batch:
+                    self._draining = False
+                    return
+            settled = []
+            groups: Dict[Optional[Database], list] = {}
+            for future, route, method, args in batch:
+                try:
+                    target = route(args[0])
+                except Exception as e:
+                    settled.append((future, None, e))
+                    continue
+                groups.setdefault(target, []).append((future, method, args))
+            for target, entries in groups.items():
+                settled.extend(self._commit(target, entries))
+            self.batches += 1
+            self.rows_batched += len(batch)
+            by_loop: Dict[asyncio.AbstractEventLoop, list] = {}
+            for entry in settled:
+                by_loop.setdefault(entry[0].get_loop(), []).append(entry)
+            for loop, entries in by_loop.items():
+                try:
+                    loop.call_soon_threadsafe(_settle, entries)
+                except RuntimeError:
+                    pass  # loop already closed; nobody is waiting
+
+    @staticmethod
+    def _commit(target: Optional[Database], entries: list) -> list:
+        """Run ``entries`` under one commit on ``target``; pair each future with its outcome"""
+        settled = []
+        try:
+            # No target: an unknown conversation, whose insert raises on its own
+            with target.batch() if target is not None else contextlib.nullcontext():
+                for future, method, args in entries:
+                    try:
+                        settled.append((future, method(*args), None))
+                    except Exception as e:
+                        settled.append((future, None, e))
+        except Exception as e:
+            # This commit failed, so none of its entries are stored
+            return [(future, None, e) for future, _, _ in entries]
+        return settled
+
+    # User Management
+    async def create_user(self, username: str, email: str, password: str, full_name: str = None) -> Optional[int]:
+        return await self._run(self.db.create_user, username, email, password, full_name)
+
+    async def authenticate_user(self, username: str, password: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self.db.authenticate_user, username, password)
+
+    # Pure HMAC check, no I/O: safe to call on the loop
+    verify_session = staticmethod(Database.verify_session)
+
+    async def get_user_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return await self._run(self.db.get_user_by_id, user_id)
+
+    # Conversation Management
+    async def create_conversation(self, user_id: int) -> int:
+        return await self._run(self.db.create_conversation, user_id)
+
+    async def get_conversation_owner(self, conversation_id: int) -> Optional[int]:
+        return await self._run(self.db.get_conversation_owner, conversation_id)
+
+    async def save_message(self, conversation_id: int, role: str, content: str,
+                           emotion: str = None, sentiment_polarity: float = None,
+                           sentiment_subjectivity: float = None):
+        await self._write(self._conversation_shard, self.db.save_message, conversation_id, role, content,
+                          emotion, sentiment_polarity, sentiment_subjectivity)
+
+    async def get_conversation_history(self, conversation_id: int) -> List[Dict[str, Any]]:
+        return await self._run(self.db.get_conversation_history, conversation_id)
+
+    async def get_message_page(self, conversation_id: int, limit: Optional[int] = None,
+                               before: Optional[Tuple[int, int]] = None
+                               ) -> Tuple[List[MessageRow], Optional[Tuple[int, int]]]:
+        return await self._run(self.db.get_message_page, conversation_id, limit, before)
+
+    async def iter_conversation(self, conversation_id: int, chunk_size: int = 500,
+                                after: Optional[Tuple[int, int]] = None) -> AsyncIterator[List[MessageRow]]:
+        """Stream a conversation oldest-first in chunks, each fetched by its own keyset pool call"""
+        def chunk(after):
+            return next(iter(self.db.iter_conversation(conversation_id, chunk_size, after)), [])
+
+        while True:
+            rows = await self._run(chunk, after)
+            if not rows:
+                return
+            yield rows
+            after = rows[-1].key
+
+    async def get_user_conversations(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+        return await self._run(self.db.get_user_conversations, user_id, limit)
+
+    async def search_messages(self, user_id: int, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        return await self._run(self.db.search_messages, user_id, query, limit)
+
+    # Mood Tracking
+    async def log_mood(self, user_id: int, mood_score: float, primary_emotion: str = None, notes: str = None):
+        await self._write(self._user_shard, self.db.log_mood, user_id, mood_score, primary_emotion, notes)
+
+    async def get_mood_history(self, user_id: int, days: int = 30) -> List[Dict[str, Any]]:
+        return await self._run(self.db.get_mood_history, user_id, days)
+
+    async def get_emotion_statistics(self, user_id: int, days: int = 30) -> Dict[str, int]:
+        return await self._run(self.db.get_emotion_statistics, user_id, days)
+
+    async def get_daily_mood(self, user_id: int, days: int = 30) -> List[Dict[str, Any]]:
+        return await self._run(self.db.get_daily_mood, user_id, days)
+
+    # Maintenance
+    async def check_message_counters(self, repair: bool = False) -> List[Dict[str, Any]]:
+        return await self._run(self.db.check_message_counters, repair)
+
+    async def rebuild_mood_rollups(self):
+        await self._run(self.db.rebuild_mood_rollups)
+
+    async def rebuild_search_index(self):
+        await self._run(self.db.rebuild_search_index)
+
+    async def archive_old_messages(self, older_than_days: Optional[float] = None,
+                                   max_rows: Optional[int] = None) -> Dict[str, int]:
+        return await self._run(self.db.archive_old_messages, older_than_days, max_rows)
+
+    async def archive_stats(self) -> Dict[str, Any]:
+        return await self._run(self.db.archive_stats)
+
+    async def write_stats(self):
+        return await self._run(self.db.write_stats)
+
+    async def close(self):
+        """Finish queued writes, stop the pool, and close the Database if we opened it"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+
+        def shutdown():
+            self._pool.shutdown(wait=True)
+            if self._owns_db:
+                self.db.close()
+
+        await asyncio.get_running_loop().run_in_executor(None, shutdown)
@@ -0,0 +1,214 @@
+"""
+Async inference layer for OpenAI-compatible chat backends
+
+Runs LLM calls on an event loop instead of pinning a worker thread per
+request. Each backend gets a bounded semaphore and every call carries an
+absolute deadline that covers both queueing and the HTTP round trip.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional
+
+import config
+from http_transport import get_async_transport
+
+
+def deadline_after(seconds: float) -> float:
+    """Return an absolute deadline ``seconds`` from now (monotonic clock)"""
+    return time.monotonic() + seconds
+
+
+def remaining(deadline: Optional[float], default: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds left before ``deadline``
+
+    Args:
+        deadline: Absolute monotonic deadline, or None for no deadline
+        default: Upper bound applied even when a deadline is set
+
+    Returns:
+        Remaining seconds (capped by ``default``), or ``default`` if no deadline
+
+    Raises:
+        TimeoutError: If the deadline has already passed
+    """
+    if deadline is None:
+        return default
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("Deadline exceeded")
+    return min(left, default) if default is not None else left
+
+
+class BackendLimiter:
+    """
+    Per-backend concurrency limit, shared by every event loop in the process
+
+    The API server runs short-lived loops, so an asyncio.Semaphore (bound
+    to one loop) would only limit each request against itself. Slots are
+    counted under a thread lock instead; a caller that has to wait parks
+    on a future of its own loop and is woken thread-safely when a slot is
+    handed to it.
+    """
+
+    def __init__(self, name: str, max_concurrency: Optional[int] = None):
+        self.name = name
+        self.max_concurrency = max_concurrency or config.LLM_MAX_CONCURRENCY
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        # [loop, future, granted] per parked caller, oldest first
+        self._waiters: deque = deque()
+
+    async def _acquire(self, timeout: Optional[float]):
+        with self._lock:
+            if self.in_flight < self.max_concurrency and not self._waiters:
+                self.in_flight += 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = [loop, loop.create_future(), False]
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+        except BaseException:
+            with self._lock:
+                if waiter[2]:
+                    # Handed a slot just as we gave up: pass it on
+                    self._release_locked()
+                else:
+                    self._waiters.remove(waiter)
+            raise
+
+    def _release_locked(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            waiter[2] = True
+            try:
+                waiter[0].call_soon_threadsafe(_wake, waiter[1])
+                return
+            except RuntimeError:
+                continue  # its loop is gone
+        self.in_flight -= 1
+
+    def _release(self):
+        with self._lock:
+            self._release_locked()
+
+    async def run(self, coro_factory, deadline: Optional[float] = None):
+        """
+        Run ``coro_factory()`` once a slot is free, within ``deadline``
+
+        Args:
+            coro_factory: Zero-argument callable returning a coroutine
+            deadline: Absolute monotonic deadline for queueing plus execution
+
+        Returns:
+            Result of the coroutine
+
+        Raises:
+            TimeoutError: If the deadline passes while queued or running
+        """
+        try:
+            await self._acquire(remaining(deadline))
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{self.name}: timed out waiting for a slot")
+        try:
+            return await asyncio.wait_for(coro_factory(), remaining(deadline))
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{self.name}: deadline exceeded")
+        finally:
+            self._release()
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def run_sync(coro, timeout: Optional[float] = None):
+    """
+    Run ``coro`` to completion from synchronous code
+
+    Uses one long-lived background loop rather than ``asyncio.run`` per
+    call, so keep-alive connections in http_transport are reused across
+    requests instead of being stranded on a closed loop.
+
+    Raises:
+        TimeoutError: If ``timeout`` elapses (the coroutine is cancelled)
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-loop", daemon=True).start()
+    future = asyncio.run_coroutine_threadsafe(coro, _loop)
+    try:
+        return future.result(timeout)
+    except FutureTimeout:
+        # Not the builtin before Python 3.11
+        future.cancel()
+        raise TimeoutError(f"Timed out after {timeout}s") from None
+
+
+async def post_json(url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+                    timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    POST a JSON payload without blocking the event loop
+
+    Goes through the shared keep-alive pool in http_transport.
+
+    Args:
+        url: Target URL (http or https)
+        payload: JSON-serializable request body
+        headers: Extra request headers
+        timeout: Seconds allowed for the whole exchange
+
+    Returns:
+        Decoded JSON response
+
+    Raises:
+        ConnectionError: On HTTP error status
+        TimeoutError: If ``timeout`` elapses
+    """
+    return await get_async_transport().post_json(url, payload, headers, timeout)
+
+
+async def chat_completion(api_url: str, api_key: str, model: str, messages: List[Dict[str, str]],
+                          limiter: BackendLimiter, deadline: Optional[float] = None,
+                          timeout: Optional[float] = None,
+                          on_usage: Optional[Callable[[Dict[str, Any]], None]] = None, **params) -> str:
+    """
+    Run one OpenAI-compatible chat completion under ``limiter``
+
+    Args:
+        api_url: Full ``/chat/completions`` URL
+        api_key: Bearer token (may be empty for local servers)
+        model: Model name
+        messages: Chat messages
+        limiter: Concurrency limiter for this backend
+        deadline: Absolute monotonic deadline propagated from the caller
+        timeout: Per-call timeout in seconds (defaults to ``config.LLM_TIMEOUT``)
+        on_usage: Called with the response's ``usage`` object (empty if the
+            provider sent none), e.g. to settle a token quota
+        **params: Extra completion parameters (temperature, max_tokens, ...)
+
+    Returns:
+        Assistant message content
+    """
+    payload = {"model": model, "messages": messages, **params}
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+    per_call = timeout if timeout is not None else config.LLM_TIMEOUT
+
+    async def call():
+        result = await post_json(api_url, payload, headers, remaining(deadline, per_call))
+        if on_usage is not None:
+            on_usage(result.get("usage") or {})
+        return result["choices"][0]["message"]["content"].strip()
+
+    return await limiter.run(call, deadline)
@@ -0,0 +1,159 @@
+"""
+Password hashing off the request path, and signed session tokens
+
+bcrypt is deliberately slow, so hashing and checking run on a small
+dedicated pool with a bounded backlog: a login burst queues there (or is
+turned away with a retry hint) instead of stalling chat traffic. Once a
+user has authenticated they get an HMAC-signed session token that is
+verified in microseconds without touching bcrypt or the database.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import bcrypt
+
+import config
+from rate_limiter import RateLimitExceeded
+
+
+class PasswordHasher:
+    """
+    Bounded worker pool for bcrypt
+
+    bcrypt releases the GIL while hashing, so threads give real
+    parallelism here without the cost of a process pool.
+
+    Args:
+        max_workers: Concurrent bcrypt operations
+        max_pending: Extra operations allowed to queue behind them
+        max_wait: Seconds a caller may wait for a queue slot
+        rounds: bcrypt cost factor for new hashes
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 max_wait: Optional[float] = None, rounds: Optional[int] = None):
+        self.max_workers = max_workers or config.AUTH_HASH_WORKERS
+        pending = config.AUTH_HASH_MAX_PENDING if max_pending is None else max_pending
+        self.max_wait = config.AUTH_HASH_MAX_WAIT if max_wait is None else max_wait
+        self.rounds = rounds or config.BCRYPT_ROUNDS
+        self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(self.max_workers + pending)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.max_wait):
+            raise RateLimitExceeded("password hashing", self.max_wait)
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def hash(self, password: str) -> bytes:
+        """
+        Hash a new password
+
+        Raises:
+            RateLimitExceeded: If the hashing backlog is full
+        """
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(self.rounds))
+
+    def verify(self, password: str, hashed: bytes) -> bool:
+        """
+        Check a password against its bcrypt hash
+
+        A malformed hash (e.g. the "!" placeholder given to bulk-imported
+        users) never matches.
+
+        Raises:
+            RateLimitExceeded: If the hashing backlog is full
+        """
+        if isinstance(hashed, str):
+            hashed = hashed.encode('utf-8')
+        try:
+            return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed)
+        except ValueError:
+            return False
+
+
+_hasher: Optional[PasswordHasher] = None
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher() -> PasswordHasher:
+    """Process-wide password hasher"""
+    global _hasher
+    with _hasher_lock:
+        if _hasher is None:
+            _hasher = PasswordHasher()
+        return _hasher
+
+
+_secret: Optional[bytes] = None
+
+
+def _session_secret() -> bytes:
+    global _secret
+    if _secret is None:
+        if config.SESSION_SECRET:
+            _secret = config.SESSION_SECRET.encode('utf-8')
+        else:
+            print("⚠️ SESSION_SECRET not set; session tokens will not survive a restart")
+            _secret = secrets.token_bytes(32)
+    return _secret
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def issue_session_token(user_id: int, ttl: Optional[float] = None) -> str:
+    """
+    Sign a session token for ``user_id``
+
+    Args:
+        user_id: Authenticated user
+        ttl: Lifetime in seconds (default config.SESSION_TIMEOUT)
+
+    Returns:
+        ``<payload>.<signature>``, both base64url without padding
+    """
+    expires = int(time.time() + (config.SESSION_TIMEOUT if ttl is None else ttl))
+    payload = _b64encode(json.dumps({"uid": user_id, "exp": expires}, separators=(",", ":")).encode())
+    signature = hmac.new(_session_secret(), payload.encode("ascii"), hashlib.sha256).digest()
+    return f"{payload}.{_b64encode(signature)}"
+
+
+def verify_session_token(token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Verify a session token without touching bcrypt or the database
+
+    Returns:
+        Claims (``uid``, ``exp``) if the signature is valid and unexpired, else None
+    """
+    if not token or token.count(".") != 1:
+        return None
+    payload, signature = token.split(".")
+    try:
+        # A non-ASCII token cannot be one we signed (UnicodeEncodeError is a ValueError)
+        expected = hmac.new(_session_secret(), payload.encode("ascii"), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, TypeError):
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims
@@ -0,0 +1,372 @@
+"""
+Streaming bulk export and import for the chatbot database
+
+Exports walk each table with a single cursor and fetchmany, so memory
+stays constant however large the database is. Files use the logical
+columns (role and emotion names, UTC timestamp strings with
+milliseconds) rather than the dictionary-encoded storage, and archived
+messages are decoded back into the messages export (an import stores
+them hot; the archive job moves them again later). Imports go through
+executemany in large transactions with the secondary indexes and
+triggers dropped for the duration; indexes are rebuilt once at the end
+and the trigger-maintained data (conversation counters, mood rollups,
+search index) is recomputed in bulk.
+
+    python bulk_io.py export-ndjson exports/
+    python bulk_io.py import-ndjson exports/ --db data/copy.db
+    python bulk_io.py seed --messages 10000000 --db data/bench.db
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import config
+from database import DAY_MS, ENCODED_COLUMNS, Database
+
+EXPORT_TABLES = ("users", "conversations", "messages", "mood_logs")
+SECRET_COLUMNS = {"users": ("password_hash",)}
+
+
+def table_columns(db: Database, table: str) -> List[Tuple[str, str, str]]:
+    """(logical name, declared type, SELECT expression) for each column of ``table``"""
+    decoded = {physical: (logical, kind) for logical, (physical, kind) in ENCODED_COLUMNS.get(table, {}).items()}
+    columns = []
+    for row in db.conn.execute(f"PRAGMA table_info({table})"):
+        name, declared = row[1], row[2].upper()
+        if name not in decoded:
+            columns.append((name, declared, name))
+            continue
+        logical, kind = decoded[name]
+        if kind == "ms":
+            expr = f"strftime('%Y-%m-%d %H:%M:%f', {name} / 1000.0, 'unixepoch')"
+        else:
+            expr = f"(SELECT name FROM {kind} WHERE {kind}.{name} = {table}.{name})"
+        columns.append((logical, "TEXT", expr))
+    return columns
+
+
+def iter_rows(db: Database, table: str, batch_rows: int = 10000, include_secrets: bool = False,
+              include_archived: bool = False) -> Iterator[Tuple[List[str], List[tuple]]]:
+    """
+    Stream a table in primary-key order
+
+    Args:
+        db: Source database
+        table: One of EXPORT_TABLES
+        batch_rows: Rows fetched per round trip
+        include_secrets: Keep password hashes in the users table
+        include_archived: For messages, follow the hot rows with the
+            archived ones, decoded one blob at a time
+
+    Yields:
+        (column names, batch of row tuples); the column list is the same for every batch
+    """
+    skip = () if include_secrets else SECRET_COLUMNS.get(table, ())
+    columns = [column for column in table_columns(db, table) if column[0] not in skip]
+    names = [name for name, _, _ in columns]
+    # bcrypt hashes are stored as bytes in a TEXT column
+    text = [i for i, (_, kind, _) in enumerate(columns) if kind == "TEXT"]
+    db._sync_writes()
+    cursor = db.reader.cursor()
+    cursor.row_factory = None
+    cursor.execute(f"SELECT {', '.join(expr for _, _, expr in columns)} FROM {table} ORDER BY rowid")
+    while True:
+        batch = cursor.fetchmany(batch_rows)
+        if not batch:
+            break
+        if text:
+            batch = [tuple(v.decode("ascii") if i in text and isinstance(v, bytes) else v
+                           for i, v in enumerate(row)) for row in batch]
+        yield names, batch
+    if include_archived and table == "messages":
+        yield from _archived_messages(db, names, batch_rows)
+
+
+def _archived_messages(db: Database, names: List[str], batch_rows: int) -> Iterator[Tuple[List[str], List[tuple]]]:
+    """Archived messages as ``messages`` export rows, in archive order"""
+    batch: List[tuple] = []
+    archive_id = 0
+    while True:
+        blob = db.reader.execute("""
+            SELECT archive_id, conversation_id, codec, payload FROM message_archive
+            WHERE archive_id > ? ORDER BY archive_id LIMIT 1
+        """, (archive_id,)).fetchone()
+        if blob is None:
+            break
+        archive_id, conversation_id, codec, payload = blob
+        for message in db._unpack_archive(codec, payload):
+            record = dict(message._asdict(), conversation_id=conversation_id,
+                          timestamp=_ms_text(message.timestamp_ms))
+            batch.append(tuple(record[name] for name in names))
+            if len(batch) == batch_rows:
+                yield names, batch
+                batch = []
+    if batch:
+        yield names, batch
+
+
+def _ms_text(ms: int) -> str:
+    """Same text as the SQL export expression for ``ms`` columns"""
+    return datetime.fromtimestamp(ms // 1000, timezone.utc).strftime("%Y-%m-%d %H:%M:%S") + f".{ms % 1000:03d}"
+
+
+def export_ndjson(db: Database, out_dir: str, tables: Sequence[str] = EXPORT_TABLES,
+                  include_secrets: bool = False) -> Dict[str, int]:
+    """
+    Write ``<out_dir>/<table>.ndjson``, one JSON object per row
+
+    Returns:
+        Rows written per table
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    counts = {}
+    for table in tables:
+        counts[table] = 0
+        with open(os.path.join(out_dir, f"{table}.ndjson"), "w", encoding="utf-8") as f:
+            for names, batch in iter_rows(db, table, include_secrets=include_secrets, include_archived=True):
+                f.writelines(json.dumps(dict(zip(names, row)), ensure_ascii=False) + "\n" for row in batch)
+                counts[table] += len(batch)
+    return counts
+
+
+_ARROW_TYPES = {"INTEGER": "int64", "REAL": "float64", "BOOLEAN": "bool", "BLOB": "binary"}
+
+
+def export_parquet(db: Database, out_dir: str, tables: Sequence[str] = EXPORT_TABLES,
+                   batch_rows: int = 50000, include_secrets: bool = False) -> Dict[str, int]:
+    """
+    Write ``<out_dir>/<table>.parquet``, one row group per batch
+
+    Requires pyarrow.
+
+    Returns:
+        Rows written per table
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet export needs pyarrow: pip install pyarrow") from e
+
+    os.makedirs(out_dir, exist_ok=True)
+    counts = {}
+    for table in tables:
+        declared = {name: kind for name, kind, _ in table_columns(db, table)}
+        counts[table] = 0
+        writer = None
+        try:
+            for names, batch in iter_rows(db, table, batch_rows, include_secrets, include_archived=True):
+                if writer is None:
+                    schema = pa.schema([(name, getattr(pa, _ARROW_TYPES.get(declared[name], "string"))())
+                                        for name in names])
+                    writer = pq.ParquetWriter(os.path.join(out_dir, f"{table}.parquet"), schema)
+                columns = list(zip(*batch))
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(col, type=schema.field(name).type) for name, col in zip(names, columns)],
+                    schema=schema))
+                counts[table] += len(batch)
+        finally:
+            if writer is not None:
+                writer.close()
+    return counts
+
+
+@contextlib.contextmanager
+def deferred_indexes(db: Database, tables: Sequence[str] = EXPORT_TABLES):
+    """
+    Drop secondary indexes and triggers on ``tables``, recreate them on exit
+
+    Rebuilding an index once after a load is much cheaper than updating it
+    row by row. Trigger-maintained data is recomputed on exit as well.
+    """
+    conn = db.conn
+    placeholders = ", ".join("?" for _ in tables)
+    objects = conn.execute(f"""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND tbl_name IN ({placeholders}) AND sql IS NOT NULL
+    """, tuple(tables)).fetchall()
+    with conn:
+        for kind, name, _ in objects:
+            conn.execute(f"DROP {kind.upper()} IF EXISTS {name}")
+    try:
+        yield
+    finally:
+        with conn:
+            # Indexes first, then triggers
+            for kind, _, sql in sorted(objects, key=lambda o: o[0] != "index"):
+                conn.execute(sql)
+        db.check_message_counters(repair=True)
+        db.rebuild_mood_rollups()
+        db.rebuild_search_index()
+
+
+def bulk_load(db: Database, sources: Iterable[Tuple[str, Sequence[str], Iterable[Sequence]]],
+              batch_rows: int = 50000, commit_rows: int = 1000000) -> Dict[str, int]:
+    """
+    Insert rows with executemany in large transactions, indexes deferred
+
+    Args:
+        db: Target database
+        sources: (table, column names, row tuples) in dependency order;
+            columns may be logical (``emotion``) or physical (``emotion_id``)
+        batch_rows: Rows per executemany call
+        commit_rows: Rows per transaction
+
+    Returns:
+        Rows inserted per table
+    """
+    conn = db.conn
+    counts: Dict[str, int] = {}
+    db._sync_writes()
+    # The file is rebuilt from the source if the load is interrupted
+    conn.execute("PRAGMA synchronous = OFF")
+    try:
+        with deferred_indexes(db):
+            for table, columns, rows in sources:
+                physical, encode = db.encode_columns(table, list(columns))
+                sql = (f"INSERT INTO {table} ({', '.join(physical)}) "
+                       f"VALUES ({', '.join('?' for _ in physical)})")
+                counts[table] = uncommitted = 0
+                rows = iter(rows)
+                while True:
+                    batch = [encode(row) for _, row in zip(range(batch_rows), rows)]
+                    if not batch:
+                        break
+                    conn.executemany(sql, batch)
+                    counts[table] += len(batch)
+                    uncommitted += len(batch)
+                    if uncommitted >= commit_rows:
+                        conn.commit()
+                        uncommitted = 0
+                conn.commit()
+    finally:
+        conn.execute(f"PRAGMA synchronous = {config.DB_SYNCHRONOUS}")
+    return counts
+
+
+def _ndjson_source(path: str, table: str) -> Optional[Tuple[str, List[str], Iterator[tuple]]]:
+    f = open(path, encoding="utf-8")
+    first = f.readline()
+    if not first.strip():
+        f.close()
+        return None
+    first_record = json.loads(first)
+    columns = list(first_record)
+
+    def rows():
+        with f:
+            yield tuple(first_record[c] for c in columns)
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield tuple(record.get(c) for c in columns)
+
+    return table, columns, rows()
+
+
+def import_ndjson(db: Database, in_dir: str, tables: Sequence[str] = EXPORT_TABLES,
+                  **load_options) -> Dict[str, int]:
+    """
+    Bulk-load ``<in_dir>/<table>.ndjson`` files written by export_ndjson
+
+    Users exported without password hashes get an unusable placeholder
+    hash and must reset their password.
+
+    Returns:
+        Rows inserted per table
+    """
+    sources = []
+    for table in tables:
+        path = os.path.join(in_dir, f"{table}.ndjson")
+        source = _ndjson_source(path, table) if os.path.exists(path) else None
+        if source is None:
+            continue
+        if table == "users" and "password_hash" not in source[1]:
+            table, columns, rows = source
+            source = (table, columns + ["password_hash"], (row + ("!",) for row in rows))
+        sources.append(source)
+    return bulk_load(db, sources, **load_options)
+
+
+def seed_benchmark(db: Database, users: int = 1000, conversations: int = 100000,
+                   messages: int = 10000000, mood_logs: int = 1000000, seed: int = 7) -> Dict[str, int]:
+    """
+    Fill an empty database with synthetic data through bulk_load
+
+    Timestamps are spread evenly over the last 365 days. Users get the
+    placeholder hash "!" so they cannot log in.
+
+    Returns:
+        Rows inserted per table
+    """
+    rng = random.Random(seed)
+    words = ("anxious", "tired", "work", "sleep", "family", "hopeful", "stress", "friend",
+             "lonely", "better", "exam", "today", "feel", "really", "again", "calm")
+    emotions = [db._lookup_id("emotions", name) for name in ("joy", "sadness", "anger", "fear", "neutral")] + [None]
+    roles = [db._lookup_id("roles", name) for name in ("user", "assistant")]
+    # Row generation is the bottleneck at this size: draw from precomputed
+    # pools and write the encoded columns directly
+    phrases = [" ".join(rng.choices(words, k=12)) for _ in range(4096)]
+    span = 365 * DAY_MS
+    start = int(time.time() * 1000) - span
+    started = datetime.fromtimestamp(start / 1000, timezone.utc)
+    days = [(started + timedelta(days=d)).strftime("%Y-%m-%d") for d in range(367)]
+    clock = [f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(86400)]
+
+    def stamp(i: int, total: int) -> str:
+        day, second = divmod(i * (span // 1000) // total, 86400)
+        return f"{days[day]} {clock[second]}"
+
+    randrange, random_ = rng.randrange, rng.random
+    return bulk_load(db, [
+        ("users", ["user_id", "username", "email", "password_hash"],
+         ((u, f"user{u}", f"user{u}@example.com", "!") for u in range(1, users + 1))),
+        ("conversations", ["conversation_id", "user_id", "started_at"],
+         ((c, randrange(users) + 1, stamp(c - 1, conversations)) for c in range(1, conversations + 1))),
+        ("messages", ["conversation_id", "role_id", "content", "emotion_id", "created_ms"],
+         ((int(random_() * conversations) + 1, roles[i & 1],
+           phrases[i & 4095], emotions[i % 6], start + i * span // messages)
+          for i in range(messages))),
+        ("mood_logs", ["user_id", "mood_score", "emotion_id", "logged_ms"],
+         ((int(random_() * users) + 1, round(random_() * 2 - 1, 2), emotions[i % 6], start + i * span // mood_logs)
+          for i in range(mood_logs))),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk export/import for the chatbot database")
+    parser.add_argument("command", choices=["export-ndjson", "export-parquet", "import-ndjson", "seed"])
+    parser.add_argument("path", nargs="?", help="Export/import directory")
+    parser.add_argument("--db", default=config.DB_PATH, help="SQLite database path")
+    parser.add_argument("--include-secrets", action="store_true", help="Export password hashes")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--conversations", type=int, default=100000)
+    parser.add_argument("--messages", type=int, default=10000000)
+    parser.add_argument("--mood-logs", type=int, default=1000000)
+    args = parser.parse_args()
+    if args.command != "seed" and not args.path:
+        parser.error(f"{args.command} needs a directory")
+
+    db = Database(args.db)
+    started = time.perf_counter()
+    try:
+        if args.command == "export-ndjson":
+            counts = export_ndjson(db, args.path, include_secrets=args.include_secrets)
+        elif args.command == "export-parquet":
+            counts = export_parquet(db, args.path, include_secrets=args.include_secrets)
+        elif args.command == "import-ndjson":
+            counts = import_ndjson(db, args.path)
+        else:
+            counts = seed_benchmark(db, args.users, args.conversations, args.messages, args.mood_logs)
+    finally:
+        db.close()
+    print(f"{args.command}: {counts} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Circuit breakers and health scoring for LLM backends
+
+Each backend keeps a rolling window of outcomes and a latency EWMA.
+When the error rate crosses the threshold the breaker opens and the
+backend is skipped at zero cost until a jittered probe interval elapses;
+then a single half-open probe decides whether it closes again.
+"""
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+import config
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Per-backend failure tracker
+
+    Args:
+        name: Backend name (used in reports)
+        window: Seconds of history used for the error rate
+        error_threshold: Error rate (0-1) that opens the breaker
+        min_calls: Calls needed in the window before it can open
+        probe_interval: Base seconds to wait before a half-open probe
+        max_probe_interval: Cap for the exponential probe backoff
+        jitter: Fractional jitter applied to the probe interval
+        latency_alpha: Smoothing factor for the latency EWMA
+    """
+
+    def __init__(self, name: str, window: float = None, error_threshold: float = None,
+                 min_calls: int = None, probe_interval: float = None,
+                 max_probe_interval: float = None, jitter: float = None,
+                 latency_alpha: float = 0.3):
+        self.name = name
+        self.window = window if window is not None else config.BREAKER_WINDOW
+        self.error_threshold = error_threshold if error_threshold is not None else config.BREAKER_ERROR_THRESHOLD
+        self.min_calls = min_calls if min_calls is not None else config.BREAKER_MIN_CALLS
+        self.probe_interval = probe_interval if probe_interval is not None else config.BREAKER_PROBE_INTERVAL
+        self.max_probe_interval = (max_probe_interval if max_probe_interval is not None
+                                   else config.BREAKER_MAX_PROBE_INTERVAL)
+        self.jitter = jitter if jitter is not None else config.BREAKER_JITTER
+        self.latency_alpha = latency_alpha
+
+        self.state = CLOSED
+        self.latency_ewma = None
+        self._outcomes = deque()  # (timestamp, ok)
+        self._opened_count = 0
+        self._next_probe_at = 0.0
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def error_rate(self) -> float:
+        with self._lock:
+            self._prune(time.monotonic())
+            if not self._outcomes:
+                return 0.0
+            return sum(1 for _, ok in self._outcomes if not ok) / len(self._outcomes)
+
+    def allow(self) -> bool:
+        """
+        Whether a call may go to this backend now
+
+        An open breaker admits exactly one probe once its interval has
+        passed, moving to half-open until that probe reports back.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self._next_probe_at:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self._opened_count += 1
+        interval = min(self.probe_interval * (2 ** (self._opened_count - 1)), self.max_probe_interval)
+        self._next_probe_at = now + interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _observe_latency(self, latency: float):
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma += self.latency_alpha * (latency - self.latency_ewma)
+
+    def record_success(self, latency: float):
+        """Report a successful call that took ``latency`` seconds"""
+        now = time.monotonic()
+        with self._lock:
+            self._observe_latency(latency)
+            self._outcomes.append((now, True))
+            self._prune(now)
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+                self._opened_count = 0
+                self._outcomes.clear()
+
+    def record_failure(self, latency: float = 0.0):
+        """Report a failed or empty call"""
+        now = time.monotonic()
+        with self._lock:
+            if latency:
+                self._observe_latency(latency)
+            self._outcomes.append((now, False))
+            self._prune(now)
+            if self.state == HALF_OPEN:
+                self._open(now)
+                return
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if (self.state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.error_threshold):
+                self._open(now)
+
+    def cancel_probe(self):
+        """Hand back a half-open probe that was cancelled before finishing"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+                self._next_probe_at = time.monotonic()
+
+    def health_score(self) -> float:
+        """
+        0-1 score used to order backends; higher is better
+
+        Combines success rate with latency (a 1s EWMA halves the score of
+        an otherwise perfect backend). Open breakers score 0.
+        """
+        if self.state == OPEN:
+            return 0.0
+        success = 1.0 - self.error_rate()
+        latency = self.latency_ewma or 0.0
+        return success / (1.0 + latency)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """State for /api/flight-check"""
+        now = time.monotonic()
+        return {
+            "state": self.state,
+            "error_rate": round(self.error_rate(), 3),
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "health_score": round(self.health_score(), 3),
+            "next_probe_in": round(max(0.0, self._next_probe_at - now), 1) if self.state == OPEN else None,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Process-wide breaker for ``name`` so every caller shares its health"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    """Snapshot of every registered breaker"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.snapshot() for b in breakers}
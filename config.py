@@ -12,6 +12,114 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 # Ollama Configuration (Legacy/Fallback)
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 
+# OpenAI-compatible endpoints for the hosted backends
+# Point these (and OLLAMA_BASE_URL) at llm_stub.py for offline load tests
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+TOGETHER_BASE_URL = os.getenv("TOGETHER_BASE_URL", "https://api.together.xyz/v1")
+
+# Async inference settings
+# Maximum in-flight requests per backend and per-call timeout in seconds
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "10"))
+
+# Near-duplicate response cache (opt-in)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.8"))
+
+# Hedged LLM requests: answer deterministically if the LLM misses the deadline
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_DEADLINE = float(os.getenv("HEDGE_DEADLINE", "4"))
+HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", "32"))
+# Most primaries running or queued at once; beyond that callers get the fallback straight away
+HEDGE_MAX_PENDING = int(os.getenv("HEDGE_MAX_PENDING", "64"))
+
+# Racing mode for FreeAIBackend: query the top-N backends concurrently
+BACKEND_RACE_ENABLED = os.getenv("BACKEND_RACE_ENABLED", "false").lower() == "true"
+BACKEND_RACE_TOP_N = int(os.getenv("BACKEND_RACE_TOP_N", "2"))
+BACKEND_RACE_STAGGER = float(os.getenv("BACKEND_RACE_STAGGER", "0.5"))
+BACKEND_RACE_DEADLINE = float(os.getenv("BACKEND_RACE_DEADLINE", "8"))
+
+# Circuit breakers for LLM backends
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", "60"))
+BREAKER_ERROR_THRESHOLD = float(os.getenv("BREAKER_ERROR_THRESHOLD", "0.5"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "3"))
+BREAKER_PROBE_INTERVAL = float(os.getenv("BREAKER_PROBE_INTERVAL", "30"))
+BREAKER_MAX_PROBE_INTERVAL = float(os.getenv("BREAKER_MAX_PROBE_INTERVAL", "300"))
+BREAKER_JITTER = float(os.getenv("BREAKER_JITTER", "0.2"))
+
+# Pooled keep-alive HTTP transport for external LLM APIs
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "15"))
+
+# Client-side provider quotas (Groq free tier: 30 requests/minute)
+GROQ_RPM = float(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = float(os.getenv("GROQ_TPM", "6000"))
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "5"))
+PROVIDER_RATE_LIMITS = {
+    "groq": (GROQ_RPM, GROQ_TPM),
+}
+
+# Single-flight: identical prompts in flight at the same time share one backend call
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "20"))
+
+# Adaptive quality ladder: crew -> llm -> rules -> canned under load (opt-in)
+QUALITY_LADDER_ENABLED = os.getenv("QUALITY_LADDER_ENABLED", "false").lower() == "true"
+QUALITY_TIER_SLOS = {
+    # tier: (latency SLO in seconds, max in-flight requests)
+    "crew": (float(os.getenv("QUALITY_SLO_CREW", "10")), int(os.getenv("QUALITY_MAX_INFLIGHT_CREW", "8"))),
+    "llm": (float(os.getenv("QUALITY_SLO_LLM", "4")), int(os.getenv("QUALITY_MAX_INFLIGHT_LLM", "32"))),
+    "rules": (float(os.getenv("QUALITY_SLO_RULES", "0.5")), int(os.getenv("QUALITY_MAX_INFLIGHT_RULES", "256"))),
+    "canned": (float(os.getenv("QUALITY_SLO_CANNED", "0.05")), 1 << 30),
+}
+QUALITY_MAX_ERROR_RATE = float(os.getenv("QUALITY_MAX_ERROR_RATE", "0.2"))
+QUALITY_DOWN_AFTER = int(os.getenv("QUALITY_DOWN_AFTER", "3"))
+QUALITY_RECOVER_AFTER = float(os.getenv("QUALITY_RECOVER_AFTER", "30"))
+QUALITY_MIN_DWELL = float(os.getenv("QUALITY_MIN_DWELL", "5"))
+# Share of requests sent to the tier above while recovering, and answers it needs before a step up
+QUALITY_PROBE_FRACTION = float(os.getenv("QUALITY_PROBE_FRACTION", "0.05"))
+QUALITY_MIN_PROBES = int(os.getenv("QUALITY_MIN_PROBES", "3"))
+
+# SQLite persistence (see database.Database)
+DB_PATH = os.getenv("DB_PATH", "data/emosup.db")
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
+# Write-behind batching of message/mood inserts (opt-in)
+# DB_WRITE_DURABILITY: "async" returns immediately, "group" waits for the batch commit
+DB_WRITE_BEHIND = os.getenv("DB_WRITE_BEHIND", "false").lower() == "true"
+DB_WRITE_DURABILITY = os.getenv("DB_WRITE_DURABILITY", "async")
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", "500"))
+DB_WRITE_FLUSH_INTERVAL = float(os.getenv("DB_WRITE_FLUSH_INTERVAL", "0.05"))
+DB_WRITE_MAX_PENDING = int(os.getenv("DB_WRITE_MAX_PENDING", "10000"))
+# Hash sharding (see sharding.py): above 1, DB_PATH holds only accounts and
+# conversation ownership and per-user data is spread over DB_SHARDS files
+DB_SHARDS = int(os.getenv("DB_SHARDS", "1"))
+DB_SHARD_ROUTE_CACHE = int(os.getenv("DB_SHARD_ROUTE_CACHE", "100000"))
+# async_database.AsyncDatabase: worker threads (one connection each) and
+# the most concurrent inserts committed together
+DB_ASYNC_WORKERS = int(os.getenv("DB_ASYNC_WORKERS", "4"))
+DB_ASYNC_MAX_BATCH = int(os.getenv("DB_ASYNC_MAX_BATCH", "500"))
+
+# Cold storage: messages older than ARCHIVE_AFTER_DAYS move into zlib blobs
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_ROWS = int(os.getenv("ARCHIVE_BATCH_ROWS", "5000"))
+ARCHIVE_PAUSE = float(os.getenv("ARCHIVE_PAUSE", "1"))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", "6"))
+
+# Authentication: bcrypt runs on a bounded pool; sessions use signed tokens
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+AUTH_HASH_MAX_PENDING = int(os.getenv("AUTH_HASH_MAX_PENDING", "32"))
+AUTH_HASH_MAX_WAIT = float(os.getenv("AUTH_HASH_MAX_WAIT", "5"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+SESSION_SECRET = os.getenv("SESSION_SECRET")
+
 # Model Configuration
 # Default to a model supported by Groq (e.g., Llama 3 8B)
 MODEL_NAME = os.getenv("MODEL_NAME", "llama3-8b-8192")
@@ -98,6 +206,7 @@ CRISIS_KEYWORDS = [
 
 # Improvement 16: Therapeutic session settings
 MAX_HISTORY_LENGTH = 10
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
 EMOTION_INTENSITY_THRESHOLD = 0.6
 SUPPORT_EMAIL = "support@emosupport.example.com"
 
@@ -1,91 +1,141 @@
 import json
+import asyncio
+import importlib
+import threading
 import config
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional
+from async_llm import BackendLimiter, chat_completion, remaining
+from hedging import hedged_call
+from rate_limiter import RateLimitExceeded, estimate_tokens, get_rate_limiter
+from response_cache import get_response_cache
+from single_flight import get_single_flight, prompt_fingerprint
 
 # Improvement 21: Graceful Degradation Logic
-# Try to import CrewAI, but don't crash if it fails due to Python 3.14
-try:
-    from crewai import Agent, Task, Crew, Process
-    HAS_CREWAI = True
-except ImportError:
-    HAS_CREWAI = False
-    print("⚠️ CrewAI not found or incompatible with this Python version.")
-
-# LLM Initialization
-HAS_LANGCHAIN = False
-HAS_GROQ_LANGCHAIN = False
-HAS_GROQ_NATIVE = False
+# Lazy provider registry: heavy SDKs (CrewAI, LangChain, Groq, Ollama) are
+# imported on first use, and only for the engine selected by configuration.
+# The names below stay at module level so they can be patched in tests.
+Agent = Task = Crew = Process = None
+ChatGroq = None
+Ollama = None
+groq = None
 ollama_lib = None
 
-# Try LangChain Groq
-try:
-    from langchain_groq import ChatGroq
-    HAS_GROQ_LANGCHAIN = True
-    HAS_LANGCHAIN = True
-except Exception:
-    HAS_GROQ_LANGCHAIN = False
-
-# Try Native Groq
-try:
-    import groq
-    HAS_GROQ_NATIVE = True
-except ImportError:
-    HAS_GROQ_NATIVE = False
-
-# Try Ollama LangChain
-try:
-    from langchain_community.llms import Ollama
-    if not HAS_LANGCHAIN:
-        HAS_LANGCHAIN = True
-except Exception:
-    # Direct ollama library fallback
-    try:
-        import ollama as ollama_lib
-    except ImportError:
-        ollama_lib = None
+# provider -> (module path, {global name: attribute or None for the module})
+PROVIDERS = {
+    "crewai": ("crewai", {"Agent": "Agent", "Task": "Task", "Crew": "Crew", "Process": "Process"}),
+    "langchain_groq": ("langchain_groq", {"ChatGroq": "ChatGroq"}),
+    "groq": ("groq", {"groq": None}),
+    "langchain_ollama": ("langchain_community.llms", {"Ollama": "Ollama"}),
+    "ollama": ("ollama", {"ollama_lib": None}),
+}
+_provider_status: Dict[str, bool] = {}
+_provider_lock = threading.Lock()
+
+
+def load_provider(name: str) -> bool:
+    """
+    Import a provider SDK on demand
+
+    Args:
+        name: Key in PROVIDERS
+
+    Returns:
+        True if the provider is usable, False if it is missing or broken
+    """
+    if name in _provider_status:
+        return _provider_status[name]
+    with _provider_lock:
+        if name in _provider_status:
+            return _provider_status[name]
+        module_path, exports = PROVIDERS[name]
+        namespace = globals()
+        try:
+            if any(namespace[g] is None for g in exports):
+                module = importlib.import_module(module_path)
+                for global_name, attr in exports.items():
+                    if namespace[global_name] is None:
+                        namespace[global_name] = module if attr is None else getattr(module, attr)
+            available = True
+        except Exception as e:
+            print(f"⚠️ {module_path} not available: {e}")
+            available = False
+        _provider_status[name] = available
+        return available
+
+
+def groq_sdk_base_url() -> str:
+    """
+    Groq SDK base URL derived from config.GROQ_BASE_URL
+
+    The SDKs append ``/openai/v1/...`` themselves, so that suffix is
+    dropped from the OpenAI-compatible base used by the HTTP paths.
+    """
+    base = config.GROQ_BASE_URL.rstrip("/")
+    return base[:-len("/openai/v1")] if base.endswith("/openai/v1") else base
+
+
+def has_crewai() -> bool:
+    """Whether CrewAI can be used (imports it on first call)"""
+    return load_provider("crewai")
+
 
 class EmotionalSupportCrew:
+    # Shared across instances so the bound applies to the whole process
+    groq_limiter = BackendLimiter("Groq (async)")
+    # Identical prompts in flight at the same time share one provider call
+    inflight = get_single_flight("crew")
+
     def __init__(self):
         self.model = config.MODEL_NAME
         self.history: List[Dict[str, str]] = []
         self.llm = None
         self.groq_client = None
+        # Provider behind self.llm / self.groq_client ("groq" or "ollama")
+        self.engine: Optional[str] = None
         
         # Prioritize Groq
         if config.GROQ_API_KEY:
-            if HAS_GROQ_LANGCHAIN:
+            if load_provider("langchain_groq"):
                 try:
                     self.llm = ChatGroq(
                         temperature=0.7,
                         groq_api_key=config.GROQ_API_KEY,
+                        groq_api_base=groq_sdk_base_url(),
                         model_name=self.model
                     )
+                    self.engine = "groq"
                     print(f"✅ Initialized Groq via LangChain: {self.model}")
                 except Exception as e:
                     print(f"⚠️ LangChain Groq failed: {e}")
             
-            if not self.llm and HAS_GROQ_NATIVE:
+            if not self.llm and load_provider("groq"):
                 try:
-                    self.groq_client = groq.Groq(api_key=config.GROQ_API_KEY)
+                    self.groq_client = groq.Groq(api_key=config.GROQ_API_KEY,
+                                                 base_url=groq_sdk_base_url())
+                    self.engine = "groq"
                     print(f"✅ Initialized Groq via Native Client: {self.model}")
                 except Exception as e:
                     print(f"❌ Native Groq initialization failed: {e}")
 
         # Fallback to Ollama
-        if not self.llm and not self.groq_client and HAS_LANGCHAIN:
+        if not self.llm and not self.groq_client and load_provider("langchain_ollama"):
             try:
-                from langchain_community.llms import Ollama
                 self.llm = Ollama(
                     model=self.model,
                     base_url=config.OLLAMA_BASE_URL,
                     temperature=0.7
                 )
+                self.engine = "ollama"
                 print(f"✅ Initialized Ollama LLM: {self.model}")
             except Exception as e:
                 print(f"❌ Failed to initialize Ollama LLM: {e}")
 
-    def get_response(self, user_input: str) -> Dict[str, Any]:
-        # 1. Crisis Check
+    def warm_up(self):
+        """Resolve the providers get_response will need, ahead of the first request"""
+        if self.llm:
+            has_crewai()
+
+    def _crisis_result(self, user_input: str) -> Optional[Dict[str, Any]]:
         user_input_lower = user_input.lower()
         if any(keyword in user_input_lower for keyword in config.CRISIS_KEYWORDS):
             return {
@@ -94,20 +144,80 @@ class EmotionalSupportCrew:
                 "coping_suggestion": "Please seek professional help immediately.",
                 "is_crisis": True
             }
+        return None
 
+    def get_response(self, user_input: str, use_crew: bool = True) -> Dict[str, Any]:
+        # 1. Crisis Check
+        crisis = self._crisis_result(user_input)
+        if crisis:
+            return crisis
+
+        return self._respond(user_input, use_crew=use_crew)
+
+    def get_response_hedged(self, user_input: str, fallback: Callable[[], Dict[str, Any]],
+                            deadline: Optional[float] = None, use_crew: bool = True) -> Dict[str, Any]:
+        """
+        Race the LLM against a deterministic fallback
+
+        The LLM pipeline starts on the hedge pool while ``fallback`` runs on
+        the calling thread. If the LLM misses ``deadline`` seconds (default
+        config.HEDGE_DEADLINE) or fails, the fallback answer is returned and
+        recorded in history; a late LLM result can still warm the response
+        cache but never touches the conversation.
+
+        Args:
+            user_input: User's message
+            fallback: Cheap deterministic responder, e.g. TherapySystem-based
+            deadline: Seconds to wait for the LLM
+            use_crew: Allow the two-agent CrewAI pipeline (False: single prompt only)
+
+        Returns:
+            Response dict with ``response_source`` set to "llm" or "deterministic"
+        """
+        crisis = self._crisis_result(user_input)
+        if crisis:
+            return crisis
+
+        result, source = hedged_call(
+            lambda: self._respond(user_input, record=False, use_crew=use_crew),
+            fallback,
+            config.HEDGE_DEADLINE if deadline is None else deadline,
+            is_valid=lambda r: not r.get("error"),
+        )
+        self._record_turn(user_input, result["response"])
+        return {**result, "response_source": source}
+
+    def crew_available(self) -> bool:
+        """Whether the two-agent CrewAI pipeline can run"""
+        return bool(self.llm) and has_crewai()
+
+    def _acquire_quota(self, prompt: str, requests: int = 1):
+        """Block for the engine's client-side quota; raises RateLimitExceeded when saturated"""
+        quota = get_rate_limiter(self.engine) if self.engine else None
+        if quota:
+            quota.acquire(estimate_tokens(prompt, 512) * requests, requests=requests)
+
+    def _respond(self, user_input: str, record: bool = True, use_crew: bool = True) -> Dict[str, Any]:
         # 2. Try CrewAI (Requires LangChain LLM)
-        if HAS_CREWAI and self.llm:
+        if use_crew and self.crew_available():
             try:
-                return self._run_crew_logic(user_input)
+                return self._run_crew_logic(user_input, record)
+            except RateLimitExceeded:
+                raise
             except Exception as e:
                 print(f"CrewAI execution failed, falling back: {e}")
 
         # 3. Fallback: High-Performance Single-Agent Therapy
-        return self._run_fallback_logic(user_input)
+        return self._run_fallback_logic(user_input, record)
 
-    def _run_crew_logic(self, user_input: str) -> Dict[str, Any]:
-        from crewai import Agent, Task, Crew, Process
-        
+    def _run_crew_logic(self, user_input: str, record: bool = True) -> Dict[str, Any]:
+        key = prompt_fingerprint("crewai", self.model, self.format_history(), user_input)
+        result = self.inflight.do(key, lambda: self._kickoff(user_input), config.SINGLE_FLIGHT_TIMEOUT)
+        return self._parse_json_result(result, user_input, record)
+
+    def _kickoff(self, user_input: str) -> str:
+        # Analyst + therapist: at least two provider calls per kickoff
+        self._acquire_quota(user_input, requests=2)
         analyst = Agent(
             role='Clinical Analyst',
             goal='Identify distortions.',
@@ -125,12 +235,57 @@ class EmotionalSupportCrew:
         t2 = Task(description=f"Respond to: {user_input}", agent=therapist, expected_output="JSON", context=[t1])
         
         crew = Crew(agents=[analyst, therapist], tasks=[t1, t2], process=Process.sequential)
-        result = crew.kickoff()
-        return self._parse_json_result(str(result), user_input)
+        return str(crew.kickoff())
+
+    async def aget_response(self, user_input: str, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Async variant of get_response
+
+        When Groq is configured the single-prompt path runs on the event
+        loop through the shared limiter. Other engines are synchronous
+        and run in a worker thread.
+
+        Args:
+            user_input: User's message
+            deadline: Absolute monotonic deadline (see async_llm.deadline_after)
+
+        Raises:
+            RateLimitExceeded: If the Groq quota cannot admit the call in time
+        """
+        crisis = self._crisis_result(user_input)
+        if crisis:
+            return crisis
+
+        if not config.GROQ_API_KEY or (self.llm and has_crewai()):
+            return await asyncio.to_thread(self.get_response, user_input)
 
-    def _run_fallback_logic(self, user_input: str) -> Dict[str, Any]:
+        prompt = self._build_prompt(user_input)
+
+        async def call():
+            quota = get_rate_limiter("groq")
+            if quota:
+                await quota.aacquire(estimate_tokens(prompt, 512))
+            return await chat_completion(
+                f"{config.GROQ_BASE_URL.rstrip('/')}/chat/completions",
+                config.GROQ_API_KEY,
+                self.model,
+                [{"role": "user", "content": prompt}],
+                self.groq_limiter,
+                deadline,
+            )
+
+        try:
+            response = await self.inflight.ado(prompt_fingerprint("groq", self.model, prompt), call,
+                                               remaining(deadline, config.SINGLE_FLIGHT_TIMEOUT))
+            return self._parse_json_result(response, user_input)
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            return self._error_result(e)
+
+    def _build_prompt(self, user_input: str) -> str:
         history_text = self.format_history()
-        prompt = f"""You are a professional Therapeutic AI. 
+        return f"""You are a professional Therapeutic AI. 
         Context: Use Person-Centered Therapy and CBT.
         History: {history_text}
         User: {user_input}
@@ -139,42 +294,93 @@ class EmotionalSupportCrew:
         Return EXACTLY this JSON format:
         {{"response": "your therapeutic text", "emotion": "detected emotion", "coping_suggestion": "a grounding tip"}}
         """
-        
+
+    def _complete(self, prompt: str) -> str:
+        """Send a single prompt to whichever engine is configured"""
+        if self.llm:
+            if hasattr(self.llm, 'predict'):
+                return self.llm.predict(prompt)
+            return self.llm.invoke(prompt).content
+        if self.groq_client:
+            completion = self.groq_client.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=self.model,
+            )
+            return completion.choices[0].message.content
+        if load_provider("ollama"):
+            client = ollama_lib.Client(host=config.OLLAMA_BASE_URL)
+            res = client.chat(model=self.model, messages=[{'role': 'user', 'content': prompt}])
+            return res['message']['content']
+        raise Exception("No inference engine available")
+
+    def _run_fallback_logic(self, user_input: str, record: bool = True) -> Dict[str, Any]:
+        cache = get_response_cache("crew")
+        has_history = bool(self.history)
+        if cache:
+            cached = cache.get(user_input, has_history=has_history)
+            if cached:
+                if record:
+                    self._record_turn(user_input, cached["response"])
+                return dict(cached)
+
+        prompt = self._build_prompt(user_input)
+
+        def call():
+            self._acquire_quota(prompt)
+            return self._complete(prompt)
+
+        key = prompt_fingerprint(self.engine or "", self.model, prompt)
         try:
-            if self.llm:
-                if hasattr(self.llm, 'predict'):
-                    response = self.llm.predict(prompt)
-                else:
-                    response = self.llm.invoke(prompt).content
-            elif self.groq_client:
-                chat_completion = self.groq_client.chat.completions.create(
-                    messages=[{"role": "user", "content": prompt}],
-                    model=self.model,
-                )
-                response = chat_completion.choices[0].message.content
-            elif ollama_lib:
-                res = ollama_lib.chat(model=self.model, messages=[{'role': 'user', 'content': prompt}])
-                response = res['message']['content']
-            else:
-                raise Exception("No inference engine available")
-            
-            return self._parse_json_result(response, user_input)
+            response = self.inflight.do(key, call, config.SINGLE_FLIGHT_TIMEOUT)
+        except RateLimitExceeded:
+            raise
         except Exception as e:
-            return {"response": f"I'm here for you. Tell me more? (Error: {e})", "emotion": "neutral", "coping_suggestion": None, "is_crisis": False}
+            return self._error_result(e)
 
-    def _parse_json_result(self, raw_str: str, user_input: str) -> Dict[str, Any]:
+        data = self._parse_json(response)
+        if data is None:
+            return self._raw_result(response)
+        if cache:
+            cache.put(user_input, dict(data), has_history=has_history)
+        if record:
+            self._record_turn(user_input, data["response"])
+        return data
+
+    @staticmethod
+    def _parse_json(raw_str: str) -> Optional[Dict[str, Any]]:
         try:
             raw_str = raw_str.strip()
             if "```json" in raw_str: raw_str = raw_str.split("```json")[1].split("```")[0].strip()
             start = raw_str.find('{')
             end = raw_str.rfind('}') + 1
             data = json.loads(raw_str[start:end])
+            if not isinstance(data, dict) or "response" not in data:
+                return None
             data["is_crisis"] = False
-            self.history.append({"role": "User", "content": user_input})
-            self.history.append({"role": "Assistant", "content": data["response"]})
             return data
-        except:
-            return {"response": raw_str, "emotion": "neutral", "coping_suggestion": None, "is_crisis": False}
+        except Exception:
+            return None
+
+    @staticmethod
+    def _raw_result(raw_str: str) -> Dict[str, Any]:
+        return {"response": raw_str.strip(), "emotion": "neutral", "coping_suggestion": None, "is_crisis": False}
+
+    @staticmethod
+    def _error_result(error: Exception) -> Dict[str, Any]:
+        return {"response": f"I'm here for you. Tell me more? (Error: {error})", "emotion": "neutral",
+                "coping_suggestion": None, "is_crisis": False, "error": str(error)}
+
+    def _parse_json_result(self, raw_str: str, user_input: str, record: bool = True) -> Dict[str, Any]:
+        data = self._parse_json(raw_str)
+        if data is None:
+            return self._raw_result(raw_str)
+        if record:
+            self._record_turn(user_input, data["response"])
+        return data
+
+    def _record_turn(self, user_input: str, response: str):
+        self.history.append({"role": "User", "content": user_input})
+        self.history.append({"role": "Assistant", "content": response})
 
     def format_history(self) -> str:
         return "\n".join([f"{msg['role']}: {msg['content']}" for msg in self.history[-6:]])
@@ -1,30 +1,344 @@
 """
 Database management for user authentication and data storage
+
+Connections are per thread: every worker thread gets its own read-write
+connection, plus a read-only one for analytics queries. The database runs
+in WAL mode so readers never block the writer and commits only need to
+fsync the log.
+
+Schema v2 stores message roles and emotions as small-integer keys into
+the ``roles`` and ``emotions`` lookup tables, and message and mood
+timestamps as integer epoch milliseconds. The public methods still take
+and return names and ``YYYY-MM-DD HH:MM:SS`` UTC strings.
 """
+import atexit
+import contextlib
+import itertools
+import json
+import queue
+import re
 import sqlite3
-import bcrypt
-from datetime import datetime
-from typing import Optional, Dict, List, Any
+import threading
+import time
+import weakref
+import zlib
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional, Dict, Iterator, List, Any, NamedTuple, Tuple
 import os
 
+import config
+from auth import get_password_hasher, issue_session_token, verify_session_token
+
+
+SCHEMA_VERSION = 2
+
+DAY_MS = 86400000
+
+# SQL expressions: epoch milliseconds now, and back to CURRENT_TIMESTAMP format
+_SQL_NOW_MS = "CAST(ROUND((julianday('now') - 2440587.5) * 86400000) AS INTEGER)"
+
+
+def _sql_timestamp(column: str, fmt: str = "%Y-%m-%d %H:%M:%S") -> str:
+    return f"strftime('{fmt}', {column} / 1000.0, 'unixepoch')"
+
+
+def _now_ms() -> int:
+    return time.time_ns() // 1000000
+
+
+def to_ms(value) -> Optional[int]:
+    """Epoch milliseconds from a UTC ``YYYY-MM-DD HH:MM:SS[.fff]`` string (ints pass through)"""
+    if value is None or isinstance(value, int):
+        return value
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return round(parsed.timestamp() * 1000)
+
+
+def from_ms(ms: Optional[int]) -> Optional[str]:
+    """UTC ``YYYY-MM-DD HH:MM:SS`` string for epoch milliseconds"""
+    if ms is None:
+        return None
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+# Logical columns that schema v2 stores encoded: {table: {logical: (physical, lookup table or "ms")}}
+ENCODED_COLUMNS = {
+    "messages": {
+        "role": ("role_id", "roles"),
+        "emotion": ("emotion_id", "emotions"),
+        "timestamp": ("created_ms", "ms"),
+    },
+    "mood_logs": {
+        "primary_emotion": ("emotion_id", "emotions"),
+        "logged_at": ("logged_ms", "ms"),
+    },
+}
+_LOOKUP_KEYS = {"roles": "role_id", "emotions": "emotion_id"}
+
+
+class MessageRow(NamedTuple):
+    """Lightweight message row for paging and streaming"""
+    message_id: int
+    role: str
+    content: str
+    emotion: Optional[str]
+    sentiment_polarity: Optional[float]
+    sentiment_subjectivity: Optional[float]
+    timestamp: str
+    timestamp_ms: int
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        """Keyset position of this row: (timestamp_ms, message_id)"""
+        return self.timestamp_ms, self.message_id
+
+
+# Physical columns behind a MessageRow; role and emotion ids are decoded in Python
+_MESSAGE_COLUMNS = (f"message_id, role_id, content, emotion_id, sentiment_polarity, "
+                    f"sentiment_subjectivity, {_sql_timestamp('created_ms')}, created_ms")
+
+
+def _window_start(days: int) -> Tuple[int, str, int]:
+    """
+    Start of a ``days``-long window ending now
+
+    Returns:
+        (start in epoch ms, first whole UTC day after it, that day in epoch
+        ms); the partial first day is read from raw rows, whole days from
+        the rollup
+    """
+    since = _now_ms() - int(days * DAY_MS)
+    first_day_ms = since - since % DAY_MS + DAY_MS
+    return since, datetime.fromtimestamp(first_day_ms / 1000, timezone.utc).strftime("%Y-%m-%d"), first_day_ms
+
+
+class _Ticket(threading.Event):
+    """Completion signal for one queued row, carrying its error if it was dropped"""
+
+    def __init__(self):
+        super().__init__()
+        self.error: Optional[sqlite3.Error] = None
+
+
+class WriteBehindQueue:
+    """
+    Batches fire-and-forget inserts into one transaction per flush
+
+    A single background thread drains the queue, waiting at most
+    ``flush_interval`` after the first queued row (or until ``batch_size``
+    rows are queued) and then commits everything with ``executemany``,
+    so many requests share one fsync. A batch hitting OperationalError
+    (database locked or busy) is retried with backoff; rows rejected by
+    the data itself are counted in ``rows_failed`` and, in group mode,
+    raised to their submitter.
+
+    Args:
+        connection: Callable returning the calling thread's write connection
+        batch_size: Most rows written per transaction
+        flush_interval: Longest a row waits for companions, in seconds
+        max_pending: Queue bound; producers block once it is full
+        durability: "async" returns at once; "group" waits for the batch commit
+        retries: Attempts after an OperationalError before giving up on a batch
+        backoff: First retry delay in seconds, doubled on each attempt
+    """
+
+    _BARRIER = object()
+
+    def __init__(self, connection, batch_size: int, flush_interval: float,
+                 max_pending: int, durability: str = "async", retries: int = 5, backoff: float = 0.05):
+        if durability not in ("async", "group"):
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self._connection = connection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.retries = retries
+        self.backoff = backoff
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        # Orders submit()/flush() against close() so nothing lands behind the stop sentinel
+        self._submit_lock = threading.Lock()
+        # Rows submitted but not yet committed (queued or in the batch being written)
+        self._outstanding = 0
+        self._outstanding_lock = threading.Lock()
+        self.batches = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.retried = 0
+        self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        return self._outstanding
+
+    def submit(self, sql: str, params: Tuple):
+        """
+        Queue one insert (blocks while the queue is full; waits for commit in group mode)
+
+        Raises:
+            ConnectionError: If the queue is closed
+            sqlite3.Error: In group mode, if the row could not be written
+        """
+        done = _Ticket() if self.durability == "group" else None
+        with self._submit_lock:
+            if self._closed:
+                raise ConnectionError("Write-behind queue is closed")
+            with self._outstanding_lock:
+                self._outstanding += 1
+            self._queue.put((sql, params, done))
+        if done is not None:
+            done.wait()
+            if done.error is not None:
+                raise done.error
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything queued so far is committed"""
+        done = _Ticket()
+        with self._submit_lock:
+            if self._closed:
+                self._thread.join(timeout)
+                return not self._thread.is_alive()
+            self._queue.put((self._BARRIER, None, done))
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """Flush outstanding rows and stop the writer thread"""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                left = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=left) if left > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            if stop:
+                # close() holds the submit lock while queueing the sentinel, so nothing follows it
+                return
+
+    def _commit(self, conn: sqlite3.Connection, groups: Dict[str, List[Tuple]]):
+        """One transaction, retried with backoff while the database is locked or busy"""
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                with conn:
+                    for sql, params in groups.items():
+                        conn.executemany(sql, params)
+                return
+            except sqlite3.OperationalError:
+                if attempt == self.retries:
+                    raise
+                self.retried += 1
+                time.sleep(delay)
+                delay *= 2
+
+    def _write(self, batch: List[Tuple]):
+        rows = [item for item in batch if item[0] is not self._BARRIER]
+        groups: Dict[str, List[Tuple]] = {}
+        for sql, params, _ in rows:
+            groups.setdefault(sql, []).append(params)
+        conn = self._connection()
+        try:
+            self._commit(conn, groups)
+            self.rows_written += len(rows)
+        except sqlite3.Error as e:
+            # Isolate the bad rows instead of losing the whole batch
+            print(f"Write-behind batch failed ({e}); retrying row by row")
+            for sql, params, done in rows:
+                try:
+                    self._commit(conn, {sql: [params]})
+                    self.rows_written += 1
+                except sqlite3.Error as row_error:
+                    self.rows_failed += 1
+                    print(f"Dropped write-behind row: {row_error}")
+                    if done is not None:
+                        done.error = row_error
+        self.batches += 1
+        with self._outstanding_lock:
+            self._outstanding -= len(rows)
+        for _, _, done in batch:
+            if done is not None:
+                done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self.pending,
+            "batches": self.batches,
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "retried": self.retried,
+            "durability": self.durability,
+        }
+
+
+def _close_at_exit(ref):
+    database = ref()
+    if database is not None:
+        database.close()
+
 
 class Database:
     """
     SQLite database manager for the emotional support chatbot
     """
 
-    def __init__(self, db_path: str = "data/emosup.db"):
+    def __init__(self, db_path: str = None, write_behind: Optional[bool] = None):
         """
         Initialize database connection
 
         Args:
-            db_path: Path to SQLite database file
+            db_path: Path to SQLite database file (default config.DB_PATH)
+            write_behind: Queue message and mood inserts for batched commits
+                (default config.DB_WRITE_BEHIND)
         """
-        self.db_path = db_path
+        self.db_path = db_path or config.DB_PATH
         self._ensure_directory()
-        self.conn = None
-        self._connect()
+        self._local = threading.local()
+        self._connections: List[tuple] = []  # (owner thread ref, read_only, connection)
+        self._connections_lock = threading.Lock()
+        self._closed = False
+        # An in-memory database only exists on the connection that created it
+        self._shared = self.db_path == ":memory:"
+        self._shared_conn = None
+        # Dictionary-encoded names, both directions, per lookup table
+        self._lookup_lock = threading.Lock()
+        self._lookup_ids: Dict[str, Dict[str, int]] = {table: {} for table in _LOOKUP_KEYS}
+        self._lookup_names: Dict[str, Dict[int, str]] = {table: {} for table in _LOOKUP_KEYS}
+        self._writes: Optional[WriteBehindQueue] = None
         self._create_tables()
+        self._load_lookups()
+
+        if config.DB_WRITE_BEHIND if write_behind is None else write_behind:
+            self._writes = WriteBehindQueue(
+                lambda: self.conn,
+                batch_size=config.DB_WRITE_BATCH_SIZE,
+                flush_interval=config.DB_WRITE_FLUSH_INTERVAL,
+                max_pending=config.DB_WRITE_MAX_PENDING,
+                durability=config.DB_WRITE_DURABILITY,
+            )
+            # Queued rows must reach disk even if nobody calls close()
+            atexit.register(_close_at_exit, weakref.ref(self))
 
     def _ensure_directory(self):
         """Ensure database directory exists"""
@@ -32,17 +346,133 @@ class Database:
         if db_dir and not os.path.exists(db_dir):
             os.makedirs(db_dir, exist_ok=True)
 
-    def _connect(self):
-        """Establish database connection"""
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        """
+        Open a tuned connection
+
+        Args:
+            read_only: Open with mode=ro and query_only for analytics readers
+
+        Returns:
+            New sqlite3 connection, owned by the calling thread
+        """
         try:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row
+            if read_only:
+                uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+                conn = sqlite3.connect(uri, uri=True, timeout=config.DB_BUSY_TIMEOUT,
+                                       check_same_thread=False)
+                conn.execute("PRAGMA query_only = ON")
+            else:
+                conn = sqlite3.connect(self.db_path, timeout=config.DB_BUSY_TIMEOUT,
+                                       check_same_thread=False)
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.execute(f"PRAGMA synchronous = {config.DB_SYNCHRONOUS}")
+            conn.execute(f"PRAGMA cache_size = -{config.DB_CACHE_SIZE_KB}")
+            conn.execute(f"PRAGMA mmap_size = {config.DB_MMAP_SIZE}")
+            conn.execute("PRAGMA temp_store = MEMORY")
+            conn.row_factory = sqlite3.Row
         except sqlite3.Error as e:
             raise ConnectionError(f"Failed to connect to database: {str(e)}")
+        self._register(conn, read_only)
+        return conn
+
+    def _register(self, conn: sqlite3.Connection, read_only: bool):
+        """Track a new connection and close the ones whose threads have exited"""
+        with self._connections_lock:
+            alive = []
+            for entry in self._connections:
+                owner = entry[0]()
+                if owner is None or not owner.is_alive():
+                    entry[2].close()
+                else:
+                    alive.append(entry)
+            alive.append((weakref.ref(threading.current_thread()), read_only, conn))
+            self._connections = alive
+
+    def _thread_connection(self, attr: str, read_only: bool) -> sqlite3.Connection:
+        if self._closed:
+            raise ConnectionError("Database is closed")
+        if self._shared:
+            if self._shared_conn is None:
+                self._shared_conn = self._connect()
+            return self._shared_conn
+        conn = getattr(self._local, attr, None)
+        if conn is None:
+            conn = self._connect(read_only)
+            setattr(self._local, attr, conn)
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """This thread's read-write connection"""
+        return self._thread_connection("writer", read_only=False)
+
+    @property
+    def reader(self) -> sqlite3.Connection:
+        """This thread's read-only connection for analytics queries"""
+        self._sync_writes()
+        return self._thread_connection("reader", read_only=True)
+
+    def _insert(self, sql: str, params: Tuple):
+        """Run a fire-and-forget insert, through the write-behind queue if enabled"""
+        if self._writes is not None:
+            self._writes.submit(sql, params)
+            return
+        if getattr(self._local, "batch", False):
+            # Committed when the enclosing batch() block ends
+            self.conn.execute(sql, params)
+            return
+        with self.conn as conn:
+            conn.execute(sql, params)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Share one commit between this thread's message and mood inserts
+
+        Each insert still runs, and can fail, at its call site; only the
+        commit waits for the end of the block. An exception escaping the
+        block rolls the batch back. Nested blocks join the outer one, and
+        with write-behind enabled this is a no-op (the queue batches).
+        """
+        if self._writes is not None or getattr(self._local, "batch", False):
+            yield
+            return
+        conn = self.conn
+        self._local.batch = True
+        self._local.batch_lookups = []
+        try:
+            yield
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            try:
+                conn.commit()
+            except BaseException:
+                # Otherwise the open transaction rides along with the next commit
+                conn.rollback()
+                raise
+            for table, name, lookup_id in self._local.batch_lookups:
+                self._lookup_names[table][lookup_id] = name
+                self._lookup_ids[table][name] = lookup_id
+        finally:
+            self._local.batch = False
+            self._local.batch_lookups = []
+
+    def _sync_writes(self):
+        """Read-your-writes: commit queued rows before a read that may need them"""
+        if self._writes is not None and self._writes.pending:
+            self._writes.flush()
+
+    def write_stats(self) -> Optional[Dict[str, Any]]:
+        """Write-behind queue metrics, or None in immediate mode"""
+        return self._writes.stats() if self._writes is not None else None
 
     def _create_tables(self):
         """Create necessary database tables"""
-        cursor = self.conn.cursor()
+        conn = self.conn
+        cursor = conn.cursor()
 
         # Users table
         cursor.execute("""
@@ -64,37 +494,178 @@ class Database:
                 user_id INTEGER NOT NULL,
                 started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 ended_at TIMESTAMP,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                last_message_at TIMESTAMP,
                 FOREIGN KEY (user_id) REFERENCES users(user_id)
             )
         """)
+        self._migrate_message_counters(cursor)
 
-        # Messages table
+        # Lookup tables for dictionary-encoded names
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS roles (
+                role_id INTEGER PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL
+            )
+        """)
         cursor.execute("""
+            CREATE TABLE IF NOT EXISTS emotions (
+                emotion_id INTEGER PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL
+            )
+        """)
+        self._migrate_schema_v2(conn)
+
+        # Messages table
+        cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS messages (
                 message_id INTEGER PRIMARY KEY AUTOINCREMENT,
                 conversation_id INTEGER NOT NULL,
-                role TEXT NOT NULL,
+                role_id INTEGER NOT NULL,
                 content TEXT NOT NULL,
-                emotion TEXT,
+                emotion_id INTEGER,
                 sentiment_polarity REAL,
                 sentiment_subjectivity REAL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
+                created_ms INTEGER NOT NULL DEFAULT ({_SQL_NOW_MS}),
+                FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id),
+                FOREIGN KEY (role_id) REFERENCES roles(role_id),
+                FOREIGN KEY (emotion_id) REFERENCES emotions(emotion_id)
             )
         """)
 
         # Mood tracking table
-        cursor.execute("""
+        cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS mood_logs (
                 log_id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
                 mood_score REAL NOT NULL,
-                primary_emotion TEXT,
+                emotion_id INTEGER,
                 notes TEXT,
-                logged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
+                logged_ms INTEGER NOT NULL DEFAULT ({_SQL_NOW_MS}),
+                FOREIGN KEY (user_id) REFERENCES users(user_id),
+                FOREIGN KEY (emotion_id) REFERENCES emotions(emotion_id)
+            )
+        """)
+
+        # Full-text search over messages (external content, synced by triggers)
+        fts_exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone() is not None
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                content, content='messages', content_rowid='message_id',
+                tokenize='porter unicode61'
+            )
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_messages_fts_insert AFTER INSERT ON messages
+            BEGIN
+                INSERT INTO messages_fts (rowid, content) VALUES (NEW.message_id, NEW.content);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_messages_fts_delete AFTER DELETE ON messages
+            BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, content)
+                VALUES ('delete', OLD.message_id, OLD.content);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_messages_fts_update AFTER UPDATE OF content ON messages
+            BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, content)
+                VALUES ('delete', OLD.message_id, OLD.content);
+                INSERT INTO messages_fts (rowid, content) VALUES (NEW.message_id, NEW.content);
+            END
+        """)
+        if not fts_exists:
+            cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+        # Cold storage: old messages as compressed per-conversation blobs
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS message_archive (
+                archive_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation_id INTEGER NOT NULL,
+                first_ms INTEGER NOT NULL,
+                first_message_id INTEGER NOT NULL,
+                last_ms INTEGER NOT NULL,
+                last_message_id INTEGER NOT NULL,
+                row_count INTEGER NOT NULL,
+                codec TEXT NOT NULL,
+                raw_bytes INTEGER NOT NULL,
+                payload BLOB NOT NULL,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
             )
         """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_archive_conv_last
+            ON message_archive(conversation_id, last_ms, last_message_id)
+        """)
+
+        # Conversation counters move in the same transaction as the message row
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_messages_count_insert AFTER INSERT ON messages
+            BEGIN
+                UPDATE conversations
+                SET message_count = message_count + 1,
+                    last_message_at = MAX(COALESCE(last_message_at, ''), {_sql_timestamp('NEW.created_ms')})
+                WHERE conversation_id = NEW.conversation_id;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_messages_count_delete AFTER DELETE ON messages
+            BEGIN
+                UPDATE conversations
+                SET message_count = message_count - 1,
+                    last_message_at = (SELECT {_sql_timestamp('MAX(created_ms)')} FROM messages
+                                       WHERE conversation_id = OLD.conversation_id)
+                WHERE conversation_id = OLD.conversation_id;
+            END
+        """)
+
+        # Daily mood rollup, one row per user, UTC day and emotion (0 for
+        # none), kept current by the mood_logs triggers below
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS mood_daily (
+                user_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                emotion_id INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                score_sum REAL NOT NULL,
+                score_min REAL NOT NULL,
+                score_max REAL NOT NULL,
+                PRIMARY KEY (user_id, day, emotion_id)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_mood_daily_insert AFTER INSERT ON mood_logs
+            BEGIN
+                INSERT INTO mood_daily (user_id, day, emotion_id, count,
+                                        score_sum, score_min, score_max)
+                VALUES (NEW.user_id, date(NEW.logged_ms / 1000, 'unixepoch'), COALESCE(NEW.emotion_id, 0), 1,
+                        NEW.mood_score, NEW.mood_score, NEW.mood_score)
+                ON CONFLICT (user_id, day, emotion_id) DO UPDATE SET
+                    count = count + 1,
+                    score_sum = score_sum + excluded.score_sum,
+                    score_min = MIN(score_min, excluded.score_min),
+                    score_max = MAX(score_max, excluded.score_max);
+            END
+        """)
+        # A delete can change min/max, so rebuild just that user/day/emotion bucket
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_mood_daily_delete AFTER DELETE ON mood_logs
+            BEGIN
+                DELETE FROM mood_daily
+                WHERE user_id = OLD.user_id AND day = date(OLD.logged_ms / 1000, 'unixepoch')
+                AND emotion_id = COALESCE(OLD.emotion_id, 0);
+                {self._ROLLUP_SELECT}
+                WHERE user_id = OLD.user_id
+                AND logged_ms >= OLD.logged_ms - OLD.logged_ms % {DAY_MS}
+                AND logged_ms < OLD.logged_ms - OLD.logged_ms % {DAY_MS} + {DAY_MS}
+                AND COALESCE(emotion_id, 0) = COALESCE(OLD.emotion_id, 0)
+                GROUP BY 1, 2, 3;
+            END
+        """)
 
         # User preferences table
         cursor.execute("""
@@ -108,12 +679,279 @@ class Database:
             )
         """)
 
-        # Improvement: Database Indices for performance
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_conv ON messages(conversation_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mood_user ON mood_logs(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)")
+        # Improvement: Database Indices for performance. Composite indexes
+        # cover the history and analytics queries (filter + order in one
+        # index walk); username lookups already use the UNIQUE autoindex.
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_conv_time ON messages(conversation_id, created_ms)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mood_user_time ON mood_logs(user_id, logged_ms)")
+        # Covers the whole conversation listing, so it never touches the table
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_conversations_user_started
+            ON conversations(user_id, started_at, ended_at, message_count, last_message_at)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_mood_user_emotion_time
+            ON mood_logs(user_id, emotion_id, logged_ms)
+        """)
+        # Superseded by the composites above (each was a prefix of one)
+        for index in ("idx_messages_conv", "idx_mood_user", "idx_users_username"):
+            cursor.execute(f"DROP INDEX IF EXISTS {index}")
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        conn.commit()
+
+        # Databases created before the rollup existed need a one-off backfill
+        if (conn.execute("SELECT EXISTS (SELECT 1 FROM mood_logs)").fetchone()[0]
+                and not conn.execute("SELECT EXISTS (SELECT 1 FROM mood_daily)").fetchone()[0]):
+            self.rebuild_mood_rollups()
+
+    @staticmethod
+    def _migrate_message_counters(cursor: sqlite3.Cursor):
+        """Add and backfill the conversation counters on pre-existing databases"""
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(conversations)")}
+        if "message_count" in columns:
+            return
+        cursor.execute("ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("ALTER TABLE conversations ADD COLUMN last_message_at TIMESTAMP")
+        # Runs before the v2 migration, so messages may still have the v1 columns
+        messages = {row[1] for row in cursor.execute("PRAGMA table_info(messages)")}
+        last = "MAX(timestamp)" if "timestamp" in messages else _sql_timestamp("MAX(created_ms)")
+        cursor.execute(f"""
+            UPDATE conversations SET
+                message_count = (SELECT COUNT(*) FROM messages m
+                                 WHERE m.conversation_id = conversations.conversation_id),
+                last_message_at = (SELECT {last} FROM messages m
+                                   WHERE m.conversation_id = conversations.conversation_id)
+        """)
+
+    def _migrate_schema_v2(self, conn: sqlite3.Connection):
+        """
+        Rewrite v1 tables (free-text roles/emotions, TEXT timestamps) to v2
+
+        Runs in one transaction. Indexes and triggers on the rewritten
+        tables are dropped here and recreated by _create_tables; the mood
+        rollup is dropped and backfilled.
+        """
+        def columns(table):
+            return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+        v1_messages = "timestamp" in columns("messages")
+        v1_moods = "logged_at" in columns("mood_logs")
+        v1_archive = "first_timestamp" in columns("message_archive")
+        if not (v1_messages or v1_moods or v1_archive):
+            return
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for kind, name in conn.execute("""
+                SELECT type, name FROM sqlite_master
+                WHERE type IN ('index', 'trigger') AND sql IS NOT NULL
+                AND tbl_name IN ('messages', 'mood_logs', 'mood_daily', 'message_archive')
+            """).fetchall():
+                conn.execute(f"DROP {kind.upper()} {name}")
+            conn.execute("DROP TABLE IF EXISTS mood_daily")
+            epoch_ms = "CAST(strftime('%s', {0}) AS INTEGER) * 1000"
+
+            if v1_messages:
+                conn.execute("INSERT OR IGNORE INTO roles (name) SELECT DISTINCT role FROM messages")
+                conn.execute("""
+                    INSERT OR IGNORE INTO emotions (name)
+                    SELECT DISTINCT emotion FROM messages WHERE emotion IS NOT NULL
+                """)
+                conn.execute("""
+                    CREATE TABLE messages_v2 (
+                        message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        conversation_id INTEGER NOT NULL,
+                        role_id INTEGER NOT NULL,
+                        content TEXT NOT NULL,
+                        emotion_id INTEGER,
+                        sentiment_polarity REAL,
+                        sentiment_subjectivity REAL,
+                        created_ms INTEGER NOT NULL,
+                        FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id),
+                        FOREIGN KEY (role_id) REFERENCES roles(role_id),
+                        FOREIGN KEY (emotion_id) REFERENCES emotions(emotion_id)
+                    )
+                """)
+                conn.execute(f"""
+                    INSERT INTO messages_v2
+                    SELECT m.message_id, m.conversation_id, r.role_id, m.content, e.emotion_id,
+                           m.sentiment_polarity, m.sentiment_subjectivity,
+                           COALESCE({epoch_ms.format('m.timestamp')}, {_SQL_NOW_MS})
+                    FROM messages m
+                    JOIN roles r ON r.name = m.role
+                    LEFT JOIN emotions e ON e.name = m.emotion
+                """)
+                conn.execute("DROP TABLE messages")
+                conn.execute("ALTER TABLE messages_v2 RENAME TO messages")
+
+            if v1_moods:
+                conn.execute("""
+                    INSERT OR IGNORE INTO emotions (name)
+                    SELECT DISTINCT primary_emotion FROM mood_logs WHERE primary_emotion IS NOT NULL
+                """)
+                conn.execute("""
+                    CREATE TABLE mood_logs_v2 (
+                        log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER NOT NULL,
+                        mood_score REAL NOT NULL,
+                        emotion_id INTEGER,
+                        notes TEXT,
+                        logged_ms INTEGER NOT NULL,
+                        FOREIGN KEY (user_id) REFERENCES users(user_id),
+                        FOREIGN KEY (emotion_id) REFERENCES emotions(emotion_id)
+                    )
+                """)
+                conn.execute(f"""
+                    INSERT INTO mood_logs_v2
+                    SELECT l.log_id, l.user_id, l.mood_score, e.emotion_id, l.notes,
+                           COALESCE({epoch_ms.format('l.logged_at')}, {_SQL_NOW_MS})
+                    FROM mood_logs l
+                    LEFT JOIN emotions e ON e.name = l.primary_emotion
+                """)
+                conn.execute("DROP TABLE mood_logs")
+                conn.execute("ALTER TABLE mood_logs_v2 RENAME TO mood_logs")
+
+            if v1_archive:
+                # Blobs gain the timestamp_ms field; bounds become epoch ms
+                conn.execute("ALTER TABLE message_archive ADD COLUMN first_ms INTEGER")
+                conn.execute("ALTER TABLE message_archive ADD COLUMN last_ms INTEGER")
+                for archive_id, codec, payload in conn.execute(
+                        "SELECT archive_id, codec, payload FROM message_archive").fetchall():
+                    rows = [row + [to_ms(row[6])] for row in json.loads(zlib.decompress(payload))]
+                    conn.execute(
+                        "UPDATE message_archive SET first_ms = ?, last_ms = ?, payload = ? WHERE archive_id = ?",
+                        (rows[0][7], rows[-1][7], zlib.compress(json.dumps(rows, separators=(",", ":")).encode(),
+                                                               config.ARCHIVE_COMPRESSION_LEVEL), archive_id))
+                conn.execute("ALTER TABLE message_archive DROP COLUMN first_timestamp")
+                conn.execute("ALTER TABLE message_archive DROP COLUMN last_timestamp")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _load_lookups(self):
+        """Refresh the id <-> name caches from the lookup tables"""
+        with self._lookup_lock:
+            for table, key in _LOOKUP_KEYS.items():
+                rows = self.conn.execute(f"SELECT {key}, name FROM {table}").fetchall()
+                self._lookup_names[table] = {row[0]: row[1] for row in rows}
+                self._lookup_ids[table] = {row[1]: row[0] for row in rows}
 
-        self.conn.commit()
+    def _lookup_id(self, table: str, name: Optional[str]) -> Optional[int]:
+        """Id for ``name`` in lookup ``table``, adding it on first use"""
+        if name is None:
+            return None
+        lookup_id = self._lookup_ids[table].get(name)
+        if lookup_id is not None:
+            return lookup_id
+        if getattr(self._local, "batch", False):
+            # Inside batch(): add it in the open transaction rather than
+            # committing that early, and cache it only once the batch commits
+            conn = self.conn
+            conn.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+            lookup_id = conn.execute(
+                f"SELECT {_LOOKUP_KEYS[table]} FROM {table} WHERE name = ?", (name,)).fetchone()[0]
+            self._local.batch_lookups.append((table, name, lookup_id))
+            return lookup_id
+        with self._lookup_lock:
+            with self.conn as conn:
+                conn.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+                lookup_id = conn.execute(
+                    f"SELECT {_LOOKUP_KEYS[table]} FROM {table} WHERE name = ?", (name,)).fetchone()[0]
+            self._lookup_names[table][lookup_id] = name
+            self._lookup_ids[table][name] = lookup_id
+        return lookup_id
+
+    def _lookup_name(self, table: str, lookup_id: Optional[int]) -> Optional[str]:
+        """Name for ``lookup_id`` (another process may have added it since we loaded)"""
+        if lookup_id is None:
+            return None
+        name = self._lookup_names[table].get(lookup_id)
+        if name is None:
+            self._load_lookups()
+            name = self._lookup_names[table][lookup_id]
+        return name
+
+    def _message_row(self, row: tuple) -> MessageRow:
+        """MessageRow from a ``SELECT {_MESSAGE_COLUMNS}`` row"""
+        return MessageRow(row[0], self._lookup_name("roles", row[1]), row[2],
+                          self._lookup_name("emotions", row[3]), row[4], row[5], row[6], row[7])
+
+    def encode_columns(self, table: str, columns: List[str]):
+        """
+        Map logical column names to schema v2 storage
+
+        Args:
+            table: Table being written
+            columns: Column names, logical (``emotion``) or physical (``emotion_id``)
+
+        Returns:
+            (physical column names, function encoding one row tuple)
+        """
+        encoded = ENCODED_COLUMNS.get(table, {})
+        physical, encoders = [], []
+        for column in columns:
+            target, kind = encoded.get(column, (column, None))
+            physical.append(target)
+            if kind == "ms":
+                encoders.append(to_ms)
+            elif kind is not None:
+                encoders.append(lambda name, kind=kind: self._lookup_id(kind, name))
+            else:
+                encoders.append(None)
+        if not any(encoders):
+            return physical, tuple
+        return physical, lambda row: tuple(f(v) if f else v for f, v in zip(encoders, row))
+
+    _ROLLUP_SELECT = """
+                INSERT INTO mood_daily (user_id, day, emotion_id, count,
+                                        score_sum, score_min, score_max)
+                SELECT user_id, date(logged_ms / 1000, 'unixepoch'), COALESCE(emotion_id, 0), COUNT(*),
+                       SUM(mood_score), MIN(mood_score), MAX(mood_score)
+                FROM mood_logs"""
+
+    def check_message_counters(self, repair: bool = False) -> List[Dict[str, Any]]:
+        """
+        Compare the denormalized conversation counters with the messages table
+
+        Args:
+            repair: Rewrite mismatched counters from the messages table
+
+        Returns:
+            Mismatches as {conversation_id, message_count, actual_count,
+            last_message_at, actual_last_message_at} (as found, before repair)
+        """
+        self._sync_writes()
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            SELECT c.conversation_id, c.message_count, c.last_message_at,
+                   COUNT(m.message_id) + COALESCE(a.row_count, 0) AS actual_count,
+                   {_sql_timestamp('COALESCE(MAX(m.created_ms), a.last_ms)')} AS actual_last_message_at
+            FROM conversations c
+            LEFT JOIN messages m ON m.conversation_id = c.conversation_id
+            LEFT JOIN (
+                SELECT conversation_id, SUM(row_count) AS row_count, MAX(last_ms) AS last_ms
+                FROM message_archive GROUP BY conversation_id
+            ) a ON a.conversation_id = c.conversation_id
+            GROUP BY c.conversation_id
+            HAVING c.message_count != actual_count
+                OR c.last_message_at IS NOT actual_last_message_at
+        """)
+        mismatches = [dict(row) for row in cursor.fetchall()]
+        if repair and mismatches:
+            with self.conn as conn:
+                conn.executemany(
+                    "UPDATE conversations SET message_count = ?, last_message_at = ? WHERE conversation_id = ?",
+                    [(m["actual_count"], m["actual_last_message_at"], m["conversation_id"]) for m in mismatches])
+        return mismatches
+
+    def rebuild_mood_rollups(self):
+        """Recompute mood_daily from mood_logs (backfill or repair)"""
+        self._sync_writes()
+        with self.conn as conn:
+            conn.execute("DELETE FROM mood_daily")
+            conn.execute(self._ROLLUP_SELECT + " GROUP BY 1, 2, 3")
 
     # User Management
     def create_user(self, username: str, email: str, password: str, full_name: str = None) -> Optional[int]:
@@ -128,17 +966,19 @@ class Database:
 
         Returns:
             User ID if successful, None otherwise
+
+        Raises:
+            RateLimitExceeded: If the password hashing pool is saturated
         """
         try:
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-            cursor = self.conn.cursor()
-
-            cursor.execute("""
-                INSERT INTO users (username, email, password_hash, full_name)
-                VALUES (?, ?, ?, ?)
-            """, (username, email, password_hash, full_name))
-
-            self.conn.commit()
+            # Hashing runs on the bounded bcrypt pool, not on this thread
+            password_hash = get_password_hasher().hash(password)
+            # The context manager rolls back on error so the write lock is released
+            with self.conn as conn:
+                cursor = conn.execute("""
+                    INSERT INTO users (username, email, password_hash, full_name)
+                    VALUES (?, ?, ?, ?)
+                """, (username, email, password_hash, full_name))
             return cursor.lastrowid
         except sqlite3.IntegrityError:
             return None
@@ -152,7 +992,10 @@ class Database:
             password: Plain text password
 
         Returns:
-            User data if authenticated, None otherwise
+            User data with a signed ``session_token`` if authenticated, None otherwise
+
+        Raises:
+            RateLimitExceeded: If the password hashing pool is saturated
         """
         cursor = self.conn.cursor()
         cursor.execute("""
@@ -163,23 +1006,38 @@ class Database:
 
         user = cursor.fetchone()
 
-        if user and bcrypt.checkpw(password.encode('utf-8'), user['password_hash']):
+        if user and get_password_hasher().verify(password, user['password_hash']):
             # Update last login
-            cursor.execute("""
-                UPDATE users SET last_login = ? WHERE user_id = ?
-            """, (datetime.now(), user['user_id']))
-            self.conn.commit()
+            with self.conn as conn:
+                conn.execute("""
+                    UPDATE users SET last_login = ? WHERE user_id = ?
+                """, (datetime.now(), user['user_id']))
 
             return {
                 "user_id": user['user_id'],
                 "username": user['username'],
                 "email": user['email'],
                 "full_name": user['full_name'],
-                "created_at": user['created_at']
+                "created_at": user['created_at'],
+                "session_token": issue_session_token(user['user_id'])
             }
 
         return None
 
+    @staticmethod
+    def verify_session(token: str) -> Optional[int]:
+        """
+        Resolve a session token to its user ID (no bcrypt, no query)
+
+        Args:
+            token: Token from authenticate_user
+
+        Returns:
+            User ID if the token is valid and unexpired, None otherwise
+        """
+        claims = verify_session_token(token)
+        return claims["uid"] if claims else None
+
     def get_user_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
         """
         Get user by ID
@@ -213,14 +1071,19 @@ class Database:
         Returns:
             Conversation ID
         """
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            INSERT INTO conversations (user_id)
-            VALUES (?)
-        """, (user_id,))
-        self.conn.commit()
+        with self.conn as conn:
+            cursor = conn.execute("""
+                INSERT INTO conversations (user_id)
+                VALUES (?)
+            """, (user_id,))
         return cursor.lastrowid
 
+    def get_conversation_owner(self, conversation_id: int) -> Optional[int]:
+        """User ID owning a conversation, or None if it does not exist"""
+        row = self.conn.execute(
+            "SELECT user_id FROM conversations WHERE conversation_id = ?", (conversation_id,)).fetchone()
+        return row[0] if row else None
+
     def save_message(self, conversation_id: int, role: str, content: str,
                     emotion: str = None, sentiment_polarity: float = None,
                     sentiment_subjectivity: float = None):
@@ -235,34 +1098,290 @@ class Database:
             sentiment_polarity: Sentiment polarity score
             sentiment_subjectivity: Sentiment subjectivity score
         """
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            INSERT INTO messages (conversation_id, role, content, emotion,
-                                 sentiment_polarity, sentiment_subjectivity)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (conversation_id, role, content, emotion, sentiment_polarity, sentiment_subjectivity))
-        self.conn.commit()
+        # Timestamp taken now, not when a write-behind batch commits
+        self._insert("""
+            INSERT INTO messages (conversation_id, role_id, content, emotion_id,
+                                 sentiment_polarity, sentiment_subjectivity, created_ms)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (conversation_id, self._lookup_id("roles", role), content, self._lookup_id("emotions", emotion),
+              sentiment_polarity, sentiment_subjectivity, _now_ms()))
 
     def get_conversation_history(self, conversation_id: int) -> List[Dict[str, Any]]:
         """
         Get conversation history
 
+        Archived messages are decompressed transparently and come first.
+
         Args:
             conversation_id: Conversation ID
 
         Returns:
             List of messages
         """
+        return [row._asdict() for chunk in self.iter_conversation(conversation_id) for row in chunk]
+
+    def get_message_page(self, conversation_id: int, limit: Optional[int] = None,
+                         before: Optional[Tuple[int, int]] = None) -> Tuple[List[MessageRow], Optional[Tuple[int, int]]]:
+        """
+        Get the newest messages of a conversation, one page at a time
+
+        Keyset pagination on (timestamp_ms, message_id): each page is a single
+        index range read, so cost depends on the page size, not on how long
+        the conversation is. Pages that reach past the hot table continue
+        into the archive.
+
+        Args:
+            conversation_id: Conversation ID
+            limit: Page size (default config.HISTORY_PAGE_SIZE)
+            before: Cursor from the previous call to fetch older messages
+
+        Returns:
+            (messages oldest-first, cursor for the next older page or None)
+        """
+        limit = limit or config.HISTORY_PAGE_SIZE
+        self._sync_writes()
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        if before is None:
+            cursor.execute(f"""
+                SELECT {_MESSAGE_COLUMNS} FROM messages
+                WHERE conversation_id = ?
+                ORDER BY created_ms DESC, message_id DESC
+                LIMIT ?
+            """, (conversation_id, limit + 1))
+        else:
+            cursor.execute(f"""
+                SELECT {_MESSAGE_COLUMNS} FROM messages
+                WHERE conversation_id = ? AND (created_ms, message_id) < (?, ?)
+                ORDER BY created_ms DESC, message_id DESC
+                LIMIT ?
+            """, (conversation_id, *before, limit + 1))
+        rows = [self._message_row(row) for row in cursor.fetchall()]
+        if len(rows) <= limit:
+            boundary = rows[-1].key if rows else before
+            rows.extend(self._archived_rows_before(conversation_id, boundary, limit + 1 - len(rows)))
+        older = rows[limit - 1].key if len(rows) > limit else None
+        return rows[:limit][::-1], older
+
+    def iter_conversation(self, conversation_id: int, chunk_size: int = 500,
+                          after: Optional[Tuple[int, int]] = None) -> Iterator[List[MessageRow]]:
+        """
+        Stream a conversation oldest-first in chunks
+
+        Archived messages come first, one decompressed blob at a time. Hot
+        rows follow, one keyset query per chunk, so no statement stays open
+        between chunks and memory is bounded by ``chunk_size``.
+
+        Args:
+            conversation_id: Conversation ID
+            chunk_size: Rows per chunk
+            after: Resume after this (timestamp_ms, message_id) position
+
+        Yields:
+            Lists of up to ``chunk_size`` messages
+        """
+        self._sync_writes()
+        rows = itertools.chain(self._archived_rows_after(conversation_id, after),
+                               self._hot_rows_after(conversation_id, after, chunk_size))
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _hot_rows_after(self, conversation_id: int, after: Optional[Tuple[int, int]],
+                        chunk_size: int) -> Iterator[MessageRow]:
+        while True:
+            cursor = self.conn.cursor()
+            cursor.row_factory = None
+            if after is None:
+                cursor.execute(f"""
+                    SELECT {_MESSAGE_COLUMNS} FROM messages
+                    WHERE conversation_id = ?
+                    ORDER BY created_ms ASC, message_id ASC
+                    LIMIT ?
+                """, (conversation_id, chunk_size))
+            else:
+                cursor.execute(f"""
+                    SELECT {_MESSAGE_COLUMNS} FROM messages
+                    WHERE conversation_id = ? AND (created_ms, message_id) > (?, ?)
+                    ORDER BY created_ms ASC, message_id ASC
+                    LIMIT ?
+                """, (conversation_id, *after, chunk_size))
+            chunk = [self._message_row(row) for row in cursor.fetchall()]
+            yield from chunk
+            if len(chunk) < chunk_size:
+                return
+            after = chunk[-1].key
+
+    # Search
+    def search_messages(self, user_id: int, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Full-text search over a user's messages, best matches first
+
+        Words in ``query`` are matched as stemmed terms (all must appear);
+        FTS5 operators are not interpreted. Archived messages are not
+        indexed.
+
+        Args:
+            user_id: User ID
+            query: Free text to search for
+            limit: Maximum number of results
+
+        Returns:
+            List of {message_id, conversation_id, role, timestamp, snippet, rank}
+        """
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+        match = " ".join(f'"{term}"' for term in terms)
+        self._sync_writes()
+        cursor = self.reader.cursor()
+        cursor.execute(f"""
+            SELECT m.message_id, m.conversation_id, m.role_id AS role,
+                   {_sql_timestamp('m.created_ms')} AS timestamp,
+                   snippet(messages_fts, 0, '[', ']', '…', 12) AS snippet,
+                   messages_fts.rank AS rank
+            FROM messages_fts
+            JOIN messages m ON m.message_id = messages_fts.rowid
+            JOIN conversations c ON c.conversation_id = m.conversation_id
+            WHERE messages_fts MATCH ? AND c.user_id = ?
+            ORDER BY messages_fts.rank
+            LIMIT ?
+        """, (match, user_id, limit))
+
+        results = [dict(row) for row in cursor.fetchall()]
+        for result in results:
+            result["role"] = self._lookup_name("roles", result["role"])
+        return results
+
+    def rebuild_search_index(self):
+        """Rebuild messages_fts from the messages table (repair or after bulk loads)"""
+        self._sync_writes()
+        with self.conn as conn:
+            conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+            conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')")
+
+    # Cold storage
+    @staticmethod
+    def _unpack_archive(codec: str, payload: bytes) -> List[MessageRow]:
+        """Blobs hold decoded MessageRow fields, so they never depend on lookup ids"""
+        if codec != "zlib":
+            raise ValueError(f"Unsupported archive codec: {codec}")
+        return [MessageRow._make(row) for row in json.loads(zlib.decompress(payload))]
+
+    def _archived_rows_after(self, conversation_id: int,
+                             after: Optional[Tuple[int, int]]) -> Iterator[MessageRow]:
+        after = after or (-1, 0)
+        blob_key = after
+        while True:
+            # One blob per keyset query: only one payload in memory, no statement left open
+            row = self.conn.execute("""
+                SELECT codec, payload, last_ms, last_message_id FROM message_archive
+                WHERE conversation_id = ? AND (last_ms, last_message_id) > (?, ?)
+                ORDER BY last_ms, last_message_id
+                LIMIT 1
+            """, (conversation_id, *blob_key)).fetchone()
+            if row is None:
+                return
+            codec, payload, *blob_key = row
+            yield from (message for message in self._unpack_archive(codec, payload) if message.key > after)
+
+    def _archived_rows_before(self, conversation_id: int, before: Optional[Tuple[int, int]],
+                              limit: int) -> List[MessageRow]:
+        """Up to ``limit`` archived rows older than ``before``, newest first"""
+        rows: List[MessageRow] = []
         cursor = self.conn.cursor()
         cursor.execute("""
-            SELECT message_id, role, content, emotion, sentiment_polarity,
-                   sentiment_subjectivity, timestamp
-            FROM messages
-            WHERE conversation_id = ?
-            ORDER BY timestamp ASC
-        """, (conversation_id,))
+            SELECT codec, payload FROM message_archive
+            WHERE conversation_id = ? AND (first_ms, first_message_id) < (?, ?)
+            ORDER BY last_ms DESC, last_message_id DESC
+        """, (conversation_id, *(before or (2 ** 62, 0))))
+        for codec, payload in cursor:
+            older = [row for row in self._unpack_archive(codec, payload) if before is None or row.key < before]
+            rows.extend(reversed(older))
+            if len(rows) >= limit:
+                break
+        return rows[:limit]
 
-        return [dict(row) for row in cursor.fetchall()]
+    def archive_old_messages(self, older_than_days: Optional[float] = None,
+                             max_rows: Optional[int] = None) -> Dict[str, int]:
+        """
+        Move old messages into compressed per-conversation archive blobs
+
+        Each conversation's share is archived in its own transaction: the
+        blob is written, the rows are deleted, and the conversation
+        counters are restored (archived messages still count).
+
+        Args:
+            older_than_days: Archive messages older than this (default config.ARCHIVE_AFTER_DAYS)
+            max_rows: Stop after this many rows (default config.ARCHIVE_BATCH_ROWS)
+
+        Returns:
+            {"rows", "blobs", "raw_bytes", "compressed_bytes"} for this run
+        """
+        days = config.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+        budget = max_rows or config.ARCHIVE_BATCH_ROWS
+        cutoff_ms = _now_ms() - int(days * DAY_MS)
+        cutoff = from_ms(cutoff_ms)
+        result = {"rows": 0, "blobs": 0, "raw_bytes": 0, "compressed_bytes": 0}
+        self._sync_writes()
+        conn = self.conn
+        # Conversations are few; their message ranges come from idx_messages_conv_time
+        candidates = [row[0] for row in conn.execute(
+            "SELECT conversation_id FROM conversations WHERE started_at < ?", (cutoff,))]
+        for conversation_id in candidates:
+            if budget <= 0:
+                break
+            with conn:
+                cursor = conn.cursor()
+                cursor.row_factory = None
+                cursor.execute(f"""
+                    SELECT {_MESSAGE_COLUMNS} FROM messages
+                    WHERE conversation_id = ? AND created_ms < ?
+                    ORDER BY created_ms, message_id
+                    LIMIT ?
+                """, (conversation_id, cutoff_ms, budget))
+                rows = [self._message_row(row) for row in cursor.fetchall()]
+                if not rows:
+                    continue
+                raw = json.dumps(rows, separators=(",", ":")).encode("utf-8")
+                payload = zlib.compress(raw, config.ARCHIVE_COMPRESSION_LEVEL)
+                first, last = rows[0], rows[-1]
+                conn.execute("""
+                    INSERT INTO message_archive (conversation_id, first_ms, first_message_id,
+                                                 last_ms, last_message_id, row_count,
+                                                 codec, raw_bytes, payload)
+                    VALUES (?, ?, ?, ?, ?, ?, 'zlib', ?, ?)
+                """, (conversation_id, first.timestamp_ms, first.message_id, last.timestamp_ms,
+                      last.message_id, len(rows), len(raw), payload))
+                conn.executemany("DELETE FROM messages WHERE message_id = ?",
+                                 [(row.message_id,) for row in rows])
+                conn.execute("""
+                    UPDATE conversations
+                    SET message_count = message_count + ?,
+                        last_message_at = MAX(COALESCE(last_message_at, ''), ?)
+                    WHERE conversation_id = ?
+                """, (len(rows), last.timestamp, conversation_id))
+            budget -= len(rows)
+            result["rows"] += len(rows)
+            result["blobs"] += 1
+            result["raw_bytes"] += len(raw)
+            result["compressed_bytes"] += len(payload)
+        return result
+
+    def archive_stats(self) -> Dict[str, Any]:
+        """Totals for the archive tier, including bytes saved by compression"""
+        row = self.reader.execute("""
+            SELECT COUNT(*) AS blobs, COALESCE(SUM(row_count), 0) AS rows,
+                   COALESCE(SUM(raw_bytes), 0) AS raw_bytes,
+                   COALESCE(SUM(length(payload)), 0) AS compressed_bytes
+            FROM message_archive
+        """).fetchone()
+        stats = dict(row)
+        stats["saved_bytes"] = stats["raw_bytes"] - stats["compressed_bytes"]
+        stats["ratio"] = round(stats["raw_bytes"] / stats["compressed_bytes"], 2) if stats["compressed_bytes"] else None
+        return stats
 
     def get_user_conversations(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
         """
@@ -275,15 +1394,12 @@ class Database:
         Returns:
             List of conversations
         """
-        cursor = self.conn.cursor()
+        cursor = self.reader.cursor()
         cursor.execute("""
-            SELECT c.conversation_id, c.started_at, c.ended_at,
-                   COUNT(m.message_id) as message_count
-            FROM conversations c
-            LEFT JOIN messages m ON c.conversation_id = m.conversation_id
-            WHERE c.user_id = ?
-            GROUP BY c.conversation_id
-            ORDER BY c.started_at DESC
+            SELECT conversation_id, started_at, ended_at, message_count, last_message_at
+            FROM conversations
+            WHERE user_id = ?
+            ORDER BY started_at DESC
             LIMIT ?
         """, (user_id, limit))
 
@@ -300,12 +1416,10 @@ class Database:
             primary_emotion: Primary emotion
             notes: Additional notes
         """
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            INSERT INTO mood_logs (user_id, mood_score, primary_emotion, notes)
-            VALUES (?, ?, ?, ?)
-        """, (user_id, mood_score, primary_emotion, notes))
-        self.conn.commit()
+        self._insert("""
+            INSERT INTO mood_logs (user_id, mood_score, emotion_id, notes, logged_ms)
+            VALUES (?, ?, ?, ?, ?)
+        """, (user_id, mood_score, self._lookup_id("emotions", primary_emotion), notes, _now_ms()))
 
     def get_mood_history(self, user_id: int, days: int = 30) -> List[Dict[str, Any]]:
         """
@@ -318,21 +1432,29 @@ class Database:
         Returns:
             List of mood logs
         """
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT log_id, mood_score, primary_emotion, notes, logged_at
+        since, _, _ = _window_start(days)
+        cursor = self.reader.cursor()
+        cursor.execute(f"""
+            SELECT log_id, mood_score, emotion_id, notes, {_sql_timestamp('logged_ms')} AS logged_at
             FROM mood_logs
             WHERE user_id = ?
-            AND logged_at >= datetime('now', '-' || ? || ' days')
-            ORDER BY logged_at DESC
-        """, (user_id, days))
+            AND logged_ms >= ?
+            ORDER BY logged_ms DESC
+        """, (user_id, since))
 
-        return [dict(row) for row in cursor.fetchall()]
+        return [{"log_id": row["log_id"], "mood_score": row["mood_score"],
+                 "primary_emotion": self._lookup_name("emotions", row["emotion_id"]),
+                 "notes": row["notes"], "logged_at": row["logged_at"]}
+                for row in cursor.fetchall()]
 
     def get_emotion_statistics(self, user_id: int, days: int = 30) -> Dict[str, int]:
         """
         Get emotion statistics for user
 
+        Whole days come from the mood_daily rollup; only the partial first
+        day of the window is counted from raw mood_logs, so the cost grows
+        with ``days`` rather than with how often the user logs.
+
         Args:
             user_id: User ID
             days: Number of days to analyze
@@ -340,20 +1462,155 @@ class Database:
         Returns:
             Dictionary with emotion counts
         """
-        cursor = self.conn.cursor()
+        since, first_day, first_day_ms = _window_start(days)
+        cursor = self.reader.cursor()
         cursor.execute("""
-            SELECT primary_emotion, COUNT(*) as count
-            FROM mood_logs
-            WHERE user_id = ?
-            AND logged_at >= datetime('now', '-' || ? || ' days')
-            AND primary_emotion IS NOT NULL
-            GROUP BY primary_emotion
+            SELECT emotion_id, SUM(count) as count
+            FROM (
+                SELECT emotion_id, count
+                FROM mood_daily
+                WHERE user_id = ? AND day >= ? AND emotion_id != 0
+                UNION ALL
+                SELECT emotion_id, 1
+                FROM mood_logs
+                WHERE user_id = ? AND logged_ms >= ? AND logged_ms < ?
+                AND emotion_id IS NOT NULL
+            )
+            GROUP BY emotion_id
             ORDER BY count DESC
-        """, (user_id, days))
+        """, (user_id, first_day, user_id, since, first_day_ms))
+
+        return {self._lookup_name("emotions", row['emotion_id']): row['count'] for row in cursor.fetchall()}
+
+    def get_daily_mood(self, user_id: int, days: int = 30) -> List[Dict[str, Any]]:
+        """
+        Get per-day mood aggregates for user
 
-        return {row['primary_emotion']: row['count'] for row in cursor.fetchall()}
+        Read from the mood_daily rollup plus the partial first day of the
+        window, like get_emotion_statistics.
+
+        Args:
+            user_id: User ID
+            days: Number of days to retrieve
+
+        Returns:
+            Oldest-first list of {day, count, avg_mood, min_mood, max_mood}
+        """
+        since, first_day, first_day_ms = _window_start(days)
+        cursor = self.reader.cursor()
+        cursor.execute("""
+            SELECT day, SUM(count) as count, SUM(score_sum) / SUM(count) as avg_mood,
+                   MIN(score_min) as min_mood, MAX(score_max) as max_mood
+            FROM (
+                SELECT day, count, score_sum, score_min, score_max
+                FROM mood_daily
+                WHERE user_id = ? AND day >= ?
+                UNION ALL
+                SELECT date(logged_ms / 1000, 'unixepoch'), 1, mood_score, mood_score, mood_score
+                FROM mood_logs
+                WHERE user_id = ? AND logged_ms >= ? AND logged_ms < ?
+            )
+            GROUP BY day
+            ORDER BY day ASC
+        """, (user_id, first_day, user_id, since, first_day_ms))
+
+        return [dict(row) for row in cursor.fetchall()]
 
     def close(self):
-        """Close database connection"""
-        if self.conn:
-            self.conn.close()
+        """Flush queued writes, then close every connection opened by any thread"""
+        if self._closed:
+            return
+        if self._writes is not None:
+            self._writes.close()
+        self._closed = True
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        # Writers last: only a read-write connection can checkpoint and remove the WAL
+        for _, _, conn in sorted(connections, key=lambda entry: not entry[1]):
+            conn.close()
+
+
+class ArchiveJob:
+    """
+    Background mover from the hot messages table to the archive
+
+    Work is rate limited: each pass archives at most ``batch_rows`` rows,
+    then sleeps ``pause`` seconds before the next pass while a backlog
+    remains, and ``interval`` seconds once it is caught up.
+
+    Args:
+        db: Database (or ShardedDatabase) to archive
+        interval: Seconds between sweeps once caught up
+        batch_rows: Rows per pass
+        pause: Seconds between passes while catching up
+    """
+
+    def __init__(self, db: Database, interval: Optional[float] = None,
+                 batch_rows: Optional[int] = None, pause: Optional[float] = None):
+        self.db = db
+        self.interval = config.ARCHIVE_INTERVAL if interval is None else interval
+        self.batch_rows = batch_rows or config.ARCHIVE_BATCH_ROWS
+        self.pause = config.ARCHIVE_PAUSE if pause is None else pause
+        self.totals = {"rows": 0, "blobs": 0, "raw_bytes": 0, "compressed_bytes": 0}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ArchiveJob":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="db-archive", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_once(self) -> Dict[str, int]:
+        """One rate-limited pass; returns what it moved"""
+        moved = self.db.archive_old_messages(max_rows=self.batch_rows)
+        for key, value in moved.items():
+            self.totals[key] += value
+        return moved
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                moved = self.run_once()
+            except sqlite3.Error as e:
+                print(f"Archive pass failed: {e}")
+                moved = {"rows": 0}
+            if moved["rows"]:
+                print(f"Archived {moved['rows']} messages "
+                      f"({moved['raw_bytes'] - moved['compressed_bytes']} bytes saved)")
+            self._stop.wait(self.pause if moved["rows"] >= self.batch_rows else self.interval)
+
+
+def main():
+    """Maintenance commands: ``python database.py <command> [--db PATH]``"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chatbot database maintenance")
+    parser.add_argument("command", choices=["rebuild-search-index", "check-counters", "rebuild-mood-rollups"])
+    parser.add_argument("--db", default=config.DB_PATH, help="SQLite database path")
+    parser.add_argument("--repair", action="store_true", help="Fix counters found by check-counters")
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    try:
+        if args.command == "rebuild-search-index":
+            db.rebuild_search_index()
+            print("Search index rebuilt")
+        elif args.command == "check-counters":
+            mismatches = db.check_message_counters(repair=args.repair)
+            print(f"{len(mismatches)} conversation(s) with drifted counters"
+                  + (" (repaired)" if args.repair and mismatches else ""))
+        else:
+            db.rebuild_mood_rollups()
+            print("Mood rollups rebuilt")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,23 @@ No Ollama needed! Uses free API tiers from multiple providers
 """
 import os
 import json
-from typing import Dict, Any, Optional
-import urllib.request
-import urllib.error
+import time
+import asyncio
+from typing import Dict, Any, Iterator, List, Optional
+
+import config
+from async_llm import BackendLimiter, chat_completion, deadline_after, post_json, remaining, run_sync
+from circuit_breaker import get_breaker
+from http_transport import get_transport, iter_sse_data
+from rate_limiter import RateLimitExceeded, estimate_tokens, get_rate_limiter
+from response_cache import get_response_cache
+from single_flight import get_single_flight, prompt_fingerprint
 
 
 class FreeAIBackend:
     """Manages multiple free AI API backends as fallback"""
+    # Shared across instances: identical prompts in flight share one dispatch
+    inflight = get_single_flight("free_ai")
 
     def __init__(self):
         self.backends = [
@@ -20,23 +30,342 @@ class FreeAIBackend:
             FallbackResponses()  # Always works, no API needed
         ]
         self.current_backend_index = 0
+        # Routing telemetry for racing mode
+        self.last_winner: Optional[str] = None
+        self.win_counts: Dict[str, int] = {}
 
     def get_response(self, prompt: str, emotion_hint: str = "") -> str:
-        """Try each backend in order until one works"""
+        """
+        Try each backend in order until one works (or race them, see arace)
 
-        for i, backend in enumerate(self.backends):
+        Concurrent calls with the same prompt and hint share one dispatch;
+        a caller that waits longer than config.SINGLE_FLIGHT_TIMEOUT for
+        it gets the built-in response instead.
+        """
+        try:
+            return self.inflight.do(prompt_fingerprint(prompt, emotion_hint),
+                                    lambda: self._get_response(prompt, emotion_hint),
+                                    config.SINGLE_FLIGHT_TIMEOUT)
+        except TimeoutError:
+            return self.backends[-1].generate(prompt, emotion_hint)
+
+    def _get_response(self, prompt: str, emotion_hint: str = "") -> str:
+        if config.BACKEND_RACE_ENABLED:
+            return run_sync(self.arace(prompt, emotion_hint))
+
+        cache = get_response_cache("free_ai")
+        if cache:
+            cached = cache.get(prompt, emotion_hint)
+            if cached:
+                return cached
+
+        for backend in self.candidates():
+            if not backend.breaker.allow():
+                continue
+            started = time.monotonic()
             try:
                 response = backend.generate(prompt, emotion_hint)
-                if response:
-                    self.current_backend_index = i
-                    return response
+            except RateLimitExceeded as e:
+                # Our own quota, not a backend fault: move on without penalty
+                backend.breaker.cancel_probe()
+                print(f"{backend.name} skipped: {e}")
+                continue
             except Exception as e:
                 print(f"{backend.name} failed: {e}")
+                response = None
+            if not response:
+                backend.breaker.record_failure(time.monotonic() - started)
                 continue
+            backend.breaker.record_success(time.monotonic() - started)
+            self.current_backend_index = self.backends.index(backend)
+            if cache:
+                cache.put(prompt, response, emotion_hint)
+            return response
 
         # If all fail, use fallback
+        self.current_backend_index = len(self.backends) - 1
         return self.backends[-1].generate(prompt, emotion_hint)
 
+    async def aget_response(self, prompt: str, emotion_hint: str = "",
+                            deadline: Optional[float] = None) -> str:
+        """
+        Async variant of get_response
+
+        The caller's deadline is shared across the whole fallback chain;
+        once it passes, the built-in responses answer immediately.
+        Identical concurrent prompts share one dispatch, as in get_response.
+        """
+        try:
+            wait = remaining(deadline, config.SINGLE_FLIGHT_TIMEOUT)
+            return await self.inflight.ado(prompt_fingerprint(prompt, emotion_hint),
+                                           lambda: self._aget_response(prompt, emotion_hint, deadline),
+                                           wait)
+        except TimeoutError:
+            return self.backends[-1].generate(prompt, emotion_hint)
+
+    async def _aget_response(self, prompt: str, emotion_hint: str = "",
+                             deadline: Optional[float] = None) -> str:
+        if config.BACKEND_RACE_ENABLED:
+            return await self.arace(prompt, emotion_hint, deadline=deadline)
+
+        cache = get_response_cache("free_ai")
+        if cache:
+            cached = cache.get(prompt, emotion_hint)
+            if cached:
+                return cached
+
+        for backend in self.candidates():
+            try:
+                remaining(deadline)
+            except TimeoutError:
+                break
+            if not backend.breaker.allow():
+                continue
+            started = time.monotonic()
+            try:
+                response = await backend.agenerate(prompt, emotion_hint, deadline)
+            except asyncio.CancelledError:
+                # Caller gave up; an unfinished probe says nothing about health
+                backend.breaker.cancel_probe()
+                raise
+            except RateLimitExceeded as e:
+                backend.breaker.cancel_probe()
+                print(f"{backend.name} skipped: {e}")
+                continue
+            except Exception as e:
+                print(f"{backend.name} failed: {e}")
+                response = None
+            if not response:
+                backend.breaker.record_failure(time.monotonic() - started)
+                continue
+            backend.breaker.record_success(time.monotonic() - started)
+            self.current_backend_index = self.backends.index(backend)
+            if cache:
+                cache.put(prompt, response, emotion_hint)
+            return response
+
+        self.current_backend_index = len(self.backends) - 1
+        return self.backends[-1].generate(prompt, emotion_hint)
+
+    def generate_stream(self, prompt: str, emotion_hint: str = "") -> Iterator[Optional[str]]:
+        """
+        Stream a reply as text deltas, failing over like get_response
+
+        Backends without ``generate_stream`` answer in a single piece. If
+        a provider fails after it has started streaming, ``None`` is
+        yielded before the next provider starts: the consumer should drop
+        the text received so far and render the new answer from scratch.
+        """
+        cache = get_response_cache("free_ai")
+        if cache:
+            cached = cache.get(prompt, emotion_hint)
+            if cached:
+                yield cached
+                return
+
+        for backend in self.candidates():
+            if not backend.breaker.allow():
+                continue
+            if hasattr(backend, "generate_stream"):
+                stream = backend.generate_stream(prompt, emotion_hint)
+            else:
+                stream = _single_piece(backend, prompt, emotion_hint)
+            started = time.monotonic()
+            parts = []
+            try:
+                for delta in stream:
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            except RateLimitExceeded as e:
+                backend.breaker.cancel_probe()
+                print(f"{backend.name} skipped: {e}")
+                continue
+            except GeneratorExit:
+                # Consumer went away; an unfinished probe says nothing about health
+                stream.close()
+                backend.breaker.cancel_probe()
+                raise
+            except Exception as e:
+                print(f"{backend.name} failed mid-stream: {e}")
+                backend.breaker.record_failure(time.monotonic() - started)
+                if parts:
+                    yield None
+                continue
+            if not parts:
+                backend.breaker.record_failure(time.monotonic() - started)
+                continue
+            backend.breaker.record_success(time.monotonic() - started)
+            self.current_backend_index = self.backends.index(backend)
+            if cache:
+                cache.put(prompt, "".join(parts), emotion_hint)
+            return
+
+        self.current_backend_index = len(self.backends) - 1
+        yield self.backends[-1].generate(prompt, emotion_hint)
+
+    def candidates(self) -> List[Any]:
+        """
+        Configured remote backends ordered by health score, best first
+
+        Ties keep the declared order. Callers must still check
+        ``backend.breaker.allow()`` right before calling a backend.
+        """
+        configured = [b for b in self.backends[:-1] if b.is_configured()]
+        return sorted(configured, key=lambda b: b.breaker.health_score(), reverse=True)
+
+    async def arace(self, prompt: str, emotion_hint: str = "", top_n: Optional[int] = None,
+                    stagger: Optional[float] = None, deadline: Optional[float] = None) -> str:
+        """
+        Fire the top-N backends concurrently and return the first valid answer
+
+        Backend i starts ``i * stagger`` seconds after the first, so a fast
+        primary usually answers before the others are ever called. Losers
+        are cancelled. If nothing valid arrives before the global deadline
+        the built-in responses answer.
+
+        Args:
+            prompt: User message
+            emotion_hint: Detected emotion
+            top_n: Backends to race (default config.BACKEND_RACE_TOP_N)
+            stagger: Seconds between starts (default config.BACKEND_RACE_STAGGER)
+            deadline: Absolute monotonic deadline (default now + config.BACKEND_RACE_DEADLINE)
+
+        Returns:
+            Response text
+        """
+        cache = get_response_cache("free_ai")
+        if cache:
+            cached = cache.get(prompt, emotion_hint)
+            if cached:
+                return cached
+
+        top_n = top_n or config.BACKEND_RACE_TOP_N
+        stagger = config.BACKEND_RACE_STAGGER if stagger is None else stagger
+        if deadline is None:
+            deadline = deadline_after(config.BACKEND_RACE_DEADLINE)
+        racers = []
+        for backend in self.candidates():
+            if len(racers) == top_n:
+                break
+            if backend.breaker.allow():
+                racers.append(backend)
+
+        reported = set()
+
+        async def run(backend, delay):
+            if delay:
+                await asyncio.sleep(delay)
+            started = time.monotonic()
+            try:
+                response = await backend.agenerate(prompt, emotion_hint, deadline)
+            except RateLimitExceeded:
+                raise
+            except Exception:
+                reported.add(backend)
+                backend.breaker.record_failure(time.monotonic() - started)
+                raise
+            reported.add(backend)
+            if response:
+                backend.breaker.record_success(time.monotonic() - started)
+            else:
+                backend.breaker.record_failure(time.monotonic() - started)
+            return response
+
+        def release_probe(task):
+            # Losing a race (even while still staggered, or before the task
+            # ever ran) or hitting our own quota is not the backend's fault
+            if tasks[task] not in reported:
+                tasks[task].breaker.cancel_probe()
+
+        tasks = {asyncio.ensure_future(run(b, i * stagger)): b for i, b in enumerate(racers)}
+        for task in tasks:
+            task.add_done_callback(release_probe)
+        pending = set(tasks)
+        winner, response = None, None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining(deadline), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is not None:
+                        print(f"{tasks[task].name} failed: {task.exception()}")
+                    elif task.result():
+                        winner, response = tasks[task], task.result()
+                        break
+        except TimeoutError:
+            pass
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if winner is None:
+            return self.backends[-1].generate(prompt, emotion_hint)
+
+        self.current_backend_index = self.backends.index(winner)
+        self.last_winner = winner.name
+        self.win_counts[winner.name] = self.win_counts.get(winner.name, 0) + 1
+        if cache:
+            cache.put(prompt, response, emotion_hint)
+        return response
+
+
+def stream_chat_completion(api_url: str, api_key: str, payload: Dict[str, Any],
+                           timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """
+    POST an OpenAI-compatible completion with ``stream: true``
+
+    Server-sent events are parsed as they arrive on the pooled
+    connection, which goes back to the pool once ``[DONE]`` is read.
+
+    Args:
+        api_url: Full ``/chat/completions`` URL
+        api_key: Bearer token
+        payload: Completion request (``stream`` is forced on)
+        timeout: Seconds allowed per socket read
+
+    Yields:
+        Each decoded ``chat.completion.chunk``
+
+    Raises:
+        ConnectionError: On HTTP error status or a stream cut short
+    """
+    body = json.dumps({**payload, "stream": True}).encode()
+    headers = {"Content-Type": "application/json", "Accept": "text/event-stream"}
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    response, release = get_transport().open("POST", api_url, body, headers, timeout)
+    finished = False
+    try:
+        if response.status >= 400:
+            detail = response.read()
+            finished = True
+            raise ConnectionError(f"HTTP {response.status}: {detail[:200].decode(errors='replace')}")
+        for data in iter_sse_data(response):
+            if data == b"[DONE]":
+                break
+            yield json.loads(data)
+        else:
+            raise ConnectionError("Stream ended before [DONE]")
+        response.read()
+        finished = True
+    finally:
+        release(finished)
+
+
+def _single_piece(backend, prompt: str, emotion_hint: str) -> Iterator[str]:
+    yield backend.generate(prompt, emotion_hint)
+
+
+def _delta_text(chunk: Dict[str, Any]) -> str:
+    choices = chunk.get("choices")
+    if not choices:
+        return ""
+    return choices[0].get("delta", {}).get("content") or ""
+
 
 class GroqBackend:
     """
@@ -47,13 +376,17 @@ class GroqBackend:
 
     def __init__(self):
         self.api_key = os.getenv("GROQ_API_KEY", "")
-        self.api_url = "https://api.groq.com/openai/v1/chat/completions"
+        self.api_url = f"{config.GROQ_BASE_URL.rstrip('/')}/chat/completions"
         self.model = "llama-3.3-70b-versatile"  # Fast and free!
+        self.limiter = BackendLimiter(self.name)
+        self.breaker = get_breaker(self.name)
+        # Client-side RPM/TPM quota; raises RateLimitExceeded instead of tripping a 429
+        self.quota = get_rate_limiter("groq")
 
-    def generate(self, prompt: str, emotion_hint: str = "") -> Optional[str]:
-        if not self.api_key:
-            return None
+    def is_configured(self) -> bool:
+        return bool(self.api_key)
 
+    def _build_request(self, prompt: str, emotion_hint: str = "") -> Dict[str, Any]:
         therapeutic_prompt = f"""You are an empathetic AI therapist. The user is feeling {emotion_hint or 'neutral'}.
 
 Guidelines:
@@ -76,27 +409,66 @@ Therapist:"""
             "temperature": 0.7,
             "max_tokens": 200
         }
+        return data
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+    def generate(self, prompt: str, emotion_hint: str = "") -> Optional[str]:
+        if not self.api_key:
+            return None
+
+        data = self._build_request(prompt, emotion_hint)
+        estimated = estimate_tokens(data["messages"][-1]["content"], data["max_tokens"])
+        if self.quota:
+            self.quota.acquire(estimated)
 
-        req = urllib.request.Request(
-            self.api_url,
-            data=json.dumps(data).encode(),
-            headers=headers,
-            method="POST"
-        )
+        headers = {"Authorization": f"Bearer {self.api_key}"}
 
         try:
-            with urllib.request.urlopen(req, timeout=10) as response:
-                result = json.loads(response.read().decode())
-                return result["choices"][0]["message"]["content"].strip()
+            result = get_transport().post_json(self.api_url, data, headers, timeout=10)
+            if self.quota:
+                self.quota.settle(estimated, result.get("usage", {}).get("total_tokens"))
+            return result["choices"][0]["message"]["content"].strip()
         except Exception as e:
             print(f"Groq API error: {e}")
             return None
 
+    async def agenerate(self, prompt: str, emotion_hint: str = "",
+                        deadline: Optional[float] = None) -> Optional[str]:
+        """Non-blocking generate bounded by this backend's limiter"""
+        if not self.api_key:
+            return None
+        data = self._build_request(prompt, emotion_hint)
+        estimated = estimate_tokens(data["messages"][-1]["content"], data["max_tokens"])
+        on_usage = None
+        if self.quota:
+            await self.quota.aacquire(estimated)
+            on_usage = lambda usage: self.quota.settle(estimated, usage.get("total_tokens"))
+        model = data.pop("model")
+        messages = data.pop("messages")
+        return await chat_completion(self.api_url, self.api_key, model, messages,
+                                     self.limiter, deadline, timeout=10, on_usage=on_usage, **data)
+
+    def generate_stream(self, prompt: str, emotion_hint: str = "") -> Iterator[str]:
+        """
+        Stream the reply as text deltas over SSE
+
+        Unlike generate, errors propagate so FreeAIBackend can fail over.
+        """
+        if not self.api_key:
+            return
+        data = self._build_request(prompt, emotion_hint)
+        estimated = estimate_tokens(data["messages"][-1]["content"], data["max_tokens"])
+        if self.quota:
+            self.quota.acquire(estimated)
+        usage = None
+        for chunk in stream_chat_completion(self.api_url, self.api_key, data, timeout=10):
+            # Groq reports usage on the last chunk under x_groq
+            usage = chunk.get("usage") or chunk.get("x_groq", {}).get("usage") or usage
+            text = _delta_text(chunk)
+            if text:
+                yield text
+        if self.quota:
+            self.quota.settle(estimated, (usage or {}).get("total_tokens"))
+
 
 class HuggingFaceBackend:
     """
@@ -108,10 +480,15 @@ class HuggingFaceBackend:
         self.api_key = os.getenv("HF_API_KEY", "")
         # Free inference API - no key needed for some models
         self.api_url = "https://api-inference.huggingface.co/models/microsoft/DialoGPT-medium"
+        self.limiter = BackendLimiter(self.name)
+        self.breaker = get_breaker(self.name)
 
-    def generate(self, prompt: str, emotion_hint: str = "") -> Optional[str]:
-        # DialoGPT works without API key (rate limited)
-        data = {
+    def is_configured(self) -> bool:
+        # The free inference API works without a key
+        return True
+
+    def _build_request(self, prompt: str, emotion_hint: str = "") -> Dict[str, Any]:
+        return {
             "inputs": f"User is feeling {emotion_hint}. {prompt}",
             "parameters": {
                 "max_length": 150,
@@ -120,26 +497,36 @@ class HuggingFaceBackend:
             }
         }
 
-        headers = {"Content-Type": "application/json"}
+    def generate(self, prompt: str, emotion_hint: str = "") -> Optional[str]:
+        # DialoGPT works without API key (rate limited)
+        data = self._build_request(prompt, emotion_hint)
+
+        headers = {}
         if self.api_key:
             headers["Authorization"] = f"Bearer {self.api_key}"
 
-        req = urllib.request.Request(
-            self.api_url,
-            data=json.dumps(data).encode(),
-            headers=headers,
-            method="POST"
-        )
-
         try:
-            with urllib.request.urlopen(req, timeout=15) as response:
-                result = json.loads(response.read().decode())
-                if isinstance(result, list) and len(result) > 0:
-                    return result[0].get("generated_text", "").strip()
+            result = get_transport().post_json(self.api_url, data, headers, timeout=15)
+            if isinstance(result, list) and len(result) > 0:
+                return result[0].get("generated_text", "").strip()
         except Exception as e:
             print(f"HuggingFace API error: {e}")
             return None
 
+    async def agenerate(self, prompt: str, emotion_hint: str = "",
+                        deadline: Optional[float] = None) -> Optional[str]:
+        """Non-blocking generate bounded by this backend's limiter"""
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+        async def call():
+            result = await post_json(self.api_url, self._build_request(prompt, emotion_hint),
+                                     headers, remaining(deadline, 15))
+            if isinstance(result, list) and len(result) > 0:
+                return result[0].get("generated_text", "").strip()
+            return None
+
+        return await self.limiter.run(call, deadline)
+
 
 class TogetherBackend:
     """
@@ -150,13 +537,15 @@ class TogetherBackend:
 
     def __init__(self):
         self.api_key = os.getenv("TOGETHER_API_KEY", "")
-        self.api_url = "https://api.together.xyz/v1/chat/completions"
+        self.api_url = f"{config.TOGETHER_BASE_URL.rstrip('/')}/chat/completions"
         self.model = "meta-llama/Llama-3-8b-chat-hf"
+        self.limiter = BackendLimiter(self.name)
+        self.breaker = get_breaker(self.name)
 
-    def generate(self, prompt: str, emotion_hint: str = "") -> Optional[str]:
-        if not self.api_key:
-            return None
+    def is_configured(self) -> bool:
+        return bool(self.api_key)
 
+    def _build_request(self, prompt: str, emotion_hint: str = "") -> Dict[str, Any]:
         therapeutic_prompt = f"""You are a compassionate therapist. User emotion: {emotion_hint or 'neutral'}
 
 Be empathetic, validating, and supportive. Ask caring follow-up questions.
@@ -174,27 +563,48 @@ Therapist:"""
             "temperature": 0.7,
             "max_tokens": 200
         }
+        return data
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+    def generate(self, prompt: str, emotion_hint: str = "") -> Optional[str]:
+        if not self.api_key:
+            return None
+
+        data = self._build_request(prompt, emotion_hint)
 
-        req = urllib.request.Request(
-            self.api_url,
-            data=json.dumps(data).encode(),
-            headers=headers,
-            method="POST"
-        )
+        headers = {"Authorization": f"Bearer {self.api_key}"}
 
         try:
-            with urllib.request.urlopen(req, timeout=10) as response:
-                result = json.loads(response.read().decode())
-                return result["choices"][0]["message"]["content"].strip()
+            result = get_transport().post_json(self.api_url, data, headers, timeout=10)
+            return result["choices"][0]["message"]["content"].strip()
         except Exception as e:
             print(f"Together API error: {e}")
             return None
 
+    async def agenerate(self, prompt: str, emotion_hint: str = "",
+                        deadline: Optional[float] = None) -> Optional[str]:
+        """Non-blocking generate bounded by this backend's limiter"""
+        if not self.api_key:
+            return None
+        data = self._build_request(prompt, emotion_hint)
+        model = data.pop("model")
+        messages = data.pop("messages")
+        return await chat_completion(self.api_url, self.api_key, model, messages,
+                                     self.limiter, deadline, timeout=10, **data)
+
+    def generate_stream(self, prompt: str, emotion_hint: str = "") -> Iterator[str]:
+        """
+        Stream the reply as text deltas over SSE
+
+        Unlike generate, errors propagate so FreeAIBackend can fail over.
+        """
+        if not self.api_key:
+            return
+        data = self._build_request(prompt, emotion_hint)
+        for chunk in stream_chat_completion(self.api_url, self.api_key, data, timeout=10):
+            text = _delta_text(chunk)
+            if text:
+                yield text
+
 
 class FallbackResponses:
     """
@@ -0,0 +1,82 @@
+"""
+Hedged execution: race a slow call against a cheap deterministic one
+
+The primary (LLM) call runs on a shared bounded pool while the fallback
+is computed on the caller's thread. Whichever valid answer is available
+at the deadline wins, which puts a hard ceiling on response latency.
+Primaries still queued at the deadline are cancelled, and once
+config.HEDGE_MAX_PENDING are outstanding new callers skip the primary,
+so a stalled backend cannot pile up an unbounded backlog.
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Optional, Tuple, TypeVar
+
+import config
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_pending: Optional[threading.BoundedSemaphore] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _pending
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config.HEDGE_MAX_WORKERS,
+                                           thread_name_prefix="llm-hedge")
+            _pending = threading.BoundedSemaphore(config.HEDGE_MAX_PENDING)
+        return _executor
+
+
+def _log_late_result(future):
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error:
+        print(f"Hedged LLM call failed after deadline: {error}")
+
+
+def hedged_call(primary: Callable[[], T], fallback: Callable[[], T], deadline: float,
+                is_valid: Callable[[T], bool] = lambda result: bool(result)) -> Tuple[T, str]:
+    """
+    Return the primary result if it is ready and valid within ``deadline``
+
+    Args:
+        primary: Slow call (runs on the hedge pool)
+        fallback: Fast deterministic call (runs on the calling thread)
+        deadline: Seconds, measured from the call, to wait for ``primary``
+        is_valid: Predicate rejecting error-shaped primary results
+
+    Returns:
+        (result, source) where source is "llm" or "deterministic"
+    """
+    started = time.monotonic()
+    executor = _get_executor()
+    if not _pending.acquire(blocking=False):
+        # Backlog full: the primary could not start before the deadline anyway
+        return fallback(), "deterministic"
+    # Carry context (e.g. the rate-limit session) into the pool thread
+    future = executor.submit(contextvars.copy_context().run, primary)
+    future.add_done_callback(lambda _: _pending.release())
+    fallback_result = fallback()
+
+    try:
+        result = future.result(timeout=max(0.0, deadline - (time.monotonic() - started)))
+    except FutureTimeout:
+        # Drop it if it never started; a running call is left to finish,
+        # as it may still warm caches on completion
+        if not future.cancel():
+            future.add_done_callback(_log_late_result)
+        return fallback_result, "deterministic"
+    except Exception as e:
+        print(f"Hedged LLM call failed: {e}")
+        return fallback_result, "deterministic"
+
+    if not is_valid(result):
+        return fallback_result, "deterministic"
+    return result, "llm"
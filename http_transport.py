@@ -0,0 +1,424 @@
+"""
+Pooled keep-alive HTTP transport for external LLM backends
+
+Reuses TCP+TLS connections per host instead of opening a new one for
+every completion. ``HTTPTransport`` serves synchronous callers with
+``http.client`` connections; ``AsyncHTTPTransport`` does the same for
+event-loop callers on asyncio streams. Both keep at most ``pool_size``
+idle connections per host and retry once when a reused connection turns
+out to have been closed by the server.
+"""
+import asyncio
+import http.client
+import json
+import queue
+import socket
+import ssl
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+
+import config
+
+# Errors that mean a pooled connection went stale before we sent anything useful
+_STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError,
+                 http.client.CannotSendRequest, http.client.BadStatusLine)
+
+_ssl_context: Optional[ssl.SSLContext] = None
+
+
+def _get_ssl_context() -> ssl.SSLContext:
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+def _split(url: str) -> Tuple[Tuple[str, str, int], str]:
+    parts = urlsplit(url)
+    tls = parts.scheme == "https"
+    port = parts.port or (443 if tls else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return (parts.scheme, parts.hostname, port), path
+
+
+def _decode_json(status: int, body: bytes) -> Any:
+    if status >= 400:
+        raise ConnectionError(f"HTTP {status}: {body[:200].decode(errors='replace')}")
+    return json.loads(body.decode())
+
+
+class HTTPTransport:
+    """
+    Thread-safe keep-alive connection pool for synchronous callers
+
+    Args:
+        pool_size: Idle connections kept per host
+        connect_timeout: Seconds allowed to establish a connection
+        read_timeout: Default seconds allowed per socket read
+    """
+
+    def __init__(self, pool_size: Optional[int] = None, connect_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None):
+        self.pool_size = pool_size or config.HTTP_POOL_SIZE
+        self.connect_timeout = connect_timeout or config.HTTP_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or config.HTTP_READ_TIMEOUT
+        self._pools: Dict[Tuple[str, str, int], queue.LifoQueue] = {}
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.connections_reused = 0
+
+    def _pool(self, key) -> queue.LifoQueue:
+        with self._lock:
+            if key not in self._pools:
+                self._pools[key] = queue.LifoQueue(maxsize=self.pool_size)
+            return self._pools[key]
+
+    def _connect(self, key) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=self.connect_timeout,
+                                               context=_get_ssl_context())
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.connect_timeout)
+        conn.connect()
+        with self._lock:
+            self.connections_opened += 1
+        return conn
+
+    def _acquire(self, key) -> Tuple[http.client.HTTPConnection, bool]:
+        try:
+            conn = self._pool(key).get_nowait()
+            with self._lock:
+                self.connections_reused += 1
+            return conn, True
+        except queue.Empty:
+            return self._connect(key), False
+
+    def _release(self, key, conn: http.client.HTTPConnection):
+        try:
+            self._pool(key).put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def open(self, method: str, url: str, body: Optional[bytes] = None,
+             headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None):
+        """
+        Send a request and return ``(response, release)`` for streaming reads
+
+        The caller must read the response and then call ``release(reuse)``
+        with ``reuse=True`` only if the body was fully consumed.
+        """
+        key, path = _split(url)
+        for attempt in range(2):
+            conn, reused = self._acquire(key)
+            conn.sock.settimeout(timeout or self.read_timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+            except _STALE_ERRORS:
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+            def release(reuse: bool, conn=conn):
+                if reuse and not response.will_close:
+                    self._release(key, conn)
+                else:
+                    conn.close()
+
+            return response, release
+
+    def request(self, method: str, url: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None,
+                timeout: Optional[float] = None) -> Tuple[int, bytes]:
+        """Send a request and return ``(status, body)``"""
+        response, release = self.open(method, url, body, headers, timeout)
+        try:
+            data = response.read()
+        except Exception:
+            release(False)
+            raise
+        release(True)
+        return response.status, data
+
+    def post_json(self, url: str, payload: Any, headers: Optional[Dict[str, str]] = None,
+                  timeout: Optional[float] = None) -> Any:
+        """
+        POST JSON and decode the JSON reply
+
+        Raises:
+            ConnectionError: On HTTP error status
+        """
+        all_headers = {"Content-Type": "application/json", **(headers or {})}
+        status, data = self.request("POST", url, json.dumps(payload).encode(), all_headers, timeout)
+        return _decode_json(status, data)
+
+    def close(self):
+        """Close every idle connection"""
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools = {}
+        for pool in pools:
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+class _AsyncConnection:
+    __slots__ = ("reader", "writer")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+    def abandon(self):
+        """Hang up a connection whose event loop has closed and can no longer close it"""
+        sock = self.writer.get_extra_info("socket")
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class AsyncHTTPTransport:
+    """
+    Keep-alive connection pool for event-loop callers
+
+    Pools are kept per event loop because asyncio streams cannot move
+    between loops, so sync callers should go through async_llm.run_sync
+    (one long-lived loop) for connections to be reused across requests.
+    Pools left behind by loops that have since closed are hung up the
+    next time a new loop shows up.
+    """
+
+    def __init__(self, pool_size: Optional[int] = None, connect_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None):
+        self.pool_size = pool_size or config.HTTP_POOL_SIZE
+        self.connect_timeout = connect_timeout or config.HTTP_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or config.HTTP_READ_TIMEOUT
+        # Plain dict: the pooled streams reference their loop, so weak keys would never expire
+        self._pools: Dict[asyncio.AbstractEventLoop, Dict[Tuple[str, str, int], deque]] = {}
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.connections_abandoned = 0
+
+    def _pool(self, key) -> deque:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            pools = self._pools.get(loop)
+            if pools is None:
+                self._prune_closed_loops()
+                pools = self._pools[loop] = {}
+            return pools.setdefault(key, deque())
+
+    def _prune_closed_loops(self):
+        for loop in [loop for loop in self._pools if loop.is_closed()]:
+            for pool in self._pools.pop(loop).values():
+                while pool:
+                    pool.pop().abandon()
+                    self.connections_abandoned += 1
+
+    async def _acquire(self, key) -> Tuple[_AsyncConnection, bool]:
+        pool = self._pool(key)
+        while pool:
+            conn = pool.pop()
+            if not conn.reader.at_eof() and not conn.writer.is_closing():
+                self.connections_reused += 1
+                return conn, True
+            conn.close()
+        scheme, host, port = key
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=_get_ssl_context() if scheme == "https" else None),
+                self.connect_timeout,
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Connecting to {host}:{port} timed out")
+        self.connections_opened += 1
+        return _AsyncConnection(reader, writer), False
+
+    def _release(self, key, conn: _AsyncConnection):
+        pool = self._pool(key)
+        if len(pool) < self.pool_size:
+            pool.append(conn)
+        else:
+            conn.close()
+
+    async def open(self, method: str, url: str, body: bytes = b"",
+                   headers: Optional[Dict[str, str]] = None):
+        """
+        Send a request and return ``(status, headers, reader, release)``
+
+        For streaming reads. ``release(reuse)`` must be called once the
+        body has been consumed (``reuse=True``) or abandoned (``False``).
+        """
+        key, path = _split(url)
+        scheme, host, port = key
+        default_port = 443 if scheme == "https" else 80
+        lines = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {host}" if port == default_port else f"Host: {host}:{port}",
+            f"Content-Length: {len(body)}",
+            "Connection: keep-alive",
+        ]
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+        for attempt in range(2):
+            conn, reused = await self._acquire(key)
+            try:
+                conn.writer.write(head + body)
+                await conn.writer.drain()
+                status_line = await conn.reader.readline()
+                if not status_line:
+                    raise ConnectionResetError("Connection closed by server")
+            except (ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            break
+
+        try:
+            status = int(status_line.split()[1])
+            resp_headers = {}
+            while True:
+                line = await conn.reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                resp_headers[name.strip().lower()] = value.strip()
+        except BaseException:
+            conn.close()
+            raise
+
+        connection = resp_headers.get("connection", "").lower()
+        keep_alive = connection == "keep-alive" if status_line.startswith(b"HTTP/1.0") else connection != "close"
+
+        def release(reuse: bool):
+            if reuse and keep_alive:
+                self._release(key, conn)
+            else:
+                conn.close()
+
+        return status, resp_headers, conn.reader, release
+
+    async def request(self, method: str, url: str, body: bytes = b"",
+                      headers: Optional[Dict[str, str]] = None,
+                      timeout: Optional[float] = None) -> Tuple[int, bytes]:
+        """Send a request and return ``(status, body)``"""
+        async def exchange():
+            status, resp_headers, reader, release = await self.open(method, url, body, headers)
+            try:
+                if resp_headers.get("transfer-encoding", "").lower() == "chunked":
+                    data = await read_chunked(reader)
+                    reusable = True
+                elif "content-length" in resp_headers:
+                    data = await reader.readexactly(int(resp_headers["content-length"]))
+                    reusable = True
+                else:
+                    data = await reader.read()
+                    reusable = False
+            except BaseException:
+                release(False)
+                raise
+            release(reusable)
+            return status, data
+
+        try:
+            return await asyncio.wait_for(exchange(), timeout or self.read_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Request to {url} timed out")
+
+    async def post_json(self, url: str, payload: Any, headers: Optional[Dict[str, str]] = None,
+                        timeout: Optional[float] = None) -> Any:
+        """
+        POST JSON and decode the JSON reply
+
+        Raises:
+            ConnectionError: On HTTP error status
+            TimeoutError: If ``timeout`` elapses
+        """
+        all_headers = {"Content-Type": "application/json", **(headers or {})}
+        status, data = await self.request("POST", url, json.dumps(payload).encode(), all_headers, timeout)
+        return _decode_json(status, data)
+
+
+async def read_chunked(reader: asyncio.StreamReader) -> bytes:
+    """Read a whole chunked transfer-encoded body"""
+    parts = []
+    while True:
+        size_line = await reader.readline()
+        size = int(size_line.split(b";")[0].strip() or b"0", 16)
+        if size == 0:
+            await reader.readline()
+            break
+        parts.append(await reader.readexactly(size))
+        await reader.readexactly(2)
+    return b"".join(parts)
+
+
+def iter_sse_data(lines: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Yield the ``data`` payload of each server-sent event
+
+    ``lines`` is any iterable of raw lines; an ``http.client`` response
+    works and is consumed incrementally. Multi-line data fields are joined
+    with newlines as the SSE spec requires; comments and other fields are
+    ignored. Single-line events (the common case) are yielded without an
+    extra join.
+    """
+    data = []
+    for line in lines:
+        line = line.rstrip(b"\r\n")
+        if not line:
+            if data:
+                yield data[0] if len(data) == 1 else b"\n".join(data)
+                data = []
+            continue
+        if line.startswith(b"data:"):
+            value = line[5:]
+            data.append(value[1:] if value[:1] == b" " else value)
+    if data:
+        yield data[0] if len(data) == 1 else b"\n".join(data)
+
+
+_transport: Optional[HTTPTransport] = None
+_async_transport: Optional[AsyncHTTPTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HTTPTransport:
+    """Process-wide synchronous transport"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = HTTPTransport()
+        return _transport
+
+
+def get_async_transport() -> AsyncHTTPTransport:
+    """Process-wide async transport (pools are still per event loop, see AsyncHTTPTransport)"""
+    global _async_transport
+    with _transport_lock:
+        if _async_transport is None:
+            _async_transport = AsyncHTTPTransport()
+        return _async_transport
@@ -0,0 +1,328 @@
+"""
+Local LLM stub server for load and latency testing
+
+Speaks enough of the OpenAI chat-completions API (streaming and
+non-streaming) and the Ollama ``/api/generate`` and ``/api/chat`` APIs
+for every backend in this repo to run against it offline. Latency is
+shaped by a time-to-first-token and a tokens-per-second rate, failures
+are injected at a fixed rate from a seeded RNG, and replies are picked
+deterministically from a list of canned therapeutic JSON answers.
+
+Usage:
+    python llm_stub.py --port 8089 --ttft 0.2 --tps 40 --error-rate 0.05
+
+    GROQ_BASE_URL=http://127.0.0.1:8089/openai/v1
+    TOGETHER_BASE_URL=http://127.0.0.1:8089/v1
+    OLLAMA_BASE_URL=http://127.0.0.1:8089
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+CANNED_REPLIES = [
+    {
+        "response": "That sounds really heavy, and it makes sense that you feel this way. "
+                    "What has been weighing on you the most today?",
+        "emotion": "sad",
+        "coping_suggestion": "Try writing down three things that felt manageable today.",
+    },
+    {
+        "response": "I can hear how anxious this is making you. You are not alone in feeling it. "
+                    "What usually helps you feel a little steadier?",
+        "emotion": "anxious",
+        "coping_suggestion": "Breathe in for 4 counts, hold for 4, and exhale for 4.",
+    },
+    {
+        "response": "Feeling disconnected from people can be so painful. Thank you for sharing it with me. "
+                    "Who is someone you have felt close to in the past?",
+        "emotion": "lonely",
+        "coping_suggestion": "Send a short message to one person you trust.",
+    },
+    {
+        "response": "It is completely understandable to feel frustrated after that. "
+                    "What part of the situation feels most unfair to you?",
+        "emotion": "angry",
+        "coping_suggestion": "Step away for ten minutes and take a short walk.",
+    },
+]
+
+_TOKEN_RE = re.compile(r"\S+\s*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into whitespace-delimited pseudo tokens (whitespace kept)"""
+    return _TOKEN_RE.findall(text) or [text]
+
+
+class LLMStubServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server with shaped latency and injected failures
+
+    Args:
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+        ttft: Seconds before the first token
+        tokens_per_second: Generation rate after the first token (0 for instant)
+        error_rate: Fraction of requests answered with ``error_status``
+        error_status: HTTP status used for injected failures
+        seed: Seed for the failure RNG, so runs are reproducible
+        replies: Canned reply payloads, serialized to JSON as the completion text
+    """
+    daemon_threads = True
+    # Keep-alive handler threads may be parked on idle sockets; do not join them
+    block_on_close = False
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, ttft: float = 0.05,
+                 tokens_per_second: float = 200.0, error_rate: float = 0.0,
+                 error_status: int = 500, seed: int = 0,
+                 replies: Optional[List[Dict[str, Any]]] = None):
+        super().__init__((host, port), _StubHandler)
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.replies = [json.dumps(r) for r in (replies or CANNED_REPLIES)]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.requests = 0
+        self.errors = 0
+        self.streams = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "LLMStubServer":
+        """Serve in a background daemon thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "LLMStubServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            failed = self.error_rate > 0 and self._rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+    def pick_reply(self, prompt: str) -> str:
+        """Same prompt, same reply: keyed on a CRC of the prompt"""
+        return self.replies[zlib.crc32(prompt.encode()) % len(self.replies)]
+
+    def token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors, "streams": self.streams}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; don't let Nagle add latency
+    disable_nagle_algorithm = True
+    server: LLMStubServer
+
+    def log_message(self, *args):
+        pass
+
+    # -- plumbing -----------------------------------------------------------
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status: int, payload: Any):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_chunked(self, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        with self.server._lock:
+            self.server.streams += 1
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _stream_tokens(self, tokens: List[str], frame, content_type: str, trailer: List[bytes]):
+        """Emit ``frame(token)`` for each token at the configured pace"""
+        self._start_chunked(content_type)
+        time.sleep(self.server.ttft)
+        delay = self.server.token_delay()
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(delay)
+            self._write_chunk(frame(token))
+        for data in trailer:
+            self._write_chunk(data)
+        self._end_chunked()
+
+    def _wait_full_generation(self, n_tokens: int):
+        time.sleep(self.server.ttft + max(n_tokens - 1, 0) * self.server.token_delay())
+
+    # -- routes -------------------------------------------------------------
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("", "/api/version"):
+            self._send_json(200, {"version": "stub"})
+        elif self.path.endswith("/models") or self.path == "/api/tags":
+            self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}],
+                                  "models": [{"name": "stub"}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            body = self._read_json()
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid JSON"}})
+            return
+        if self.server.should_fail():
+            self._send_json(self.server.error_status,
+                            {"error": {"message": "stub injected failure", "type": "server_error"}})
+            return
+        if self.path.endswith("/chat/completions"):
+            self._openai_chat(body)
+        elif self.path == "/api/generate":
+            self._ollama(body, body.get("prompt", ""), chat=False)
+        elif self.path == "/api/chat":
+            messages = body.get("messages") or [{}]
+            self._ollama(body, messages[-1].get("content", ""), chat=True)
+        else:
+            self._send_json(404, {"error": {"message": f"unknown route {self.path}"}})
+
+    def _openai_chat(self, body: Dict[str, Any]):
+        messages = body.get("messages") or [{}]
+        prompt = messages[-1].get("content", "")
+        reply = self.server.pick_reply(prompt)
+        tokens = tokenize(reply)
+        model = body.get("model", "stub")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        usage = {
+            "prompt_tokens": sum(len(tokenize(m.get("content", ""))) for m in messages),
+            "completion_tokens": len(tokens),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not body.get("stream"):
+            self._wait_full_generation(len(tokens))
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        def chunk(delta: Dict[str, Any], finish: Optional[str] = None) -> Dict[str, Any]:
+            return {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                    "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+
+        def sse(payload: Any) -> bytes:
+            return f"data: {json.dumps(payload)}\n\n".encode()
+
+        def frame(token: str) -> bytes:
+            return sse(chunk({"content": token}))
+
+        final = chunk({}, "stop")
+        final["usage"] = usage
+        self._stream_tokens(tokens, frame, "text/event-stream", [sse(final), b"data: [DONE]\n\n"])
+
+    def _ollama(self, body: Dict[str, Any], prompt: str, chat: bool):
+        reply = self.server.pick_reply(prompt)
+        tokens = tokenize(reply)
+        model = body.get("model", "stub")
+        created_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+        def message(text: str, done: bool) -> Dict[str, Any]:
+            payload = {"model": model, "created_at": created_at, "done": done}
+            if chat:
+                payload["message"] = {"role": "assistant", "content": text}
+            else:
+                payload["response"] = text
+            if done:
+                payload.update(done_reason="stop", eval_count=len(tokens),
+                               prompt_eval_count=len(tokenize(prompt)))
+            return payload
+
+        # Ollama streams unless told otherwise
+        if body.get("stream", True) is False:
+            self._wait_full_generation(len(tokens))
+            self._send_json(200, message(reply, True))
+            return
+
+        def frame(token: str) -> bytes:
+            return (json.dumps(message(token, False)) + "\n").encode()
+
+        self._stream_tokens(tokens, frame, "application/x-ndjson",
+                            [(json.dumps(message("", True)) + "\n").encode()])
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="OpenAI/Ollama-compatible LLM stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--ttft", type=float, default=0.05, help="seconds to first token")
+    parser.add_argument("--tps", type=float, default=200.0, help="tokens per second (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replies", help="JSON file with a list of reply objects")
+    args = parser.parse_args(argv)
+
+    replies = None
+    if args.replies:
+        with open(args.replies, encoding="utf-8") as f:
+            replies = json.load(f)
+
+    server = LLMStubServer(args.host, args.port, ttft=args.ttft, tokens_per_second=args.tps,
+                           error_rate=args.error_rate, error_status=args.error_status,
+                           seed=args.seed, replies=replies)
+    print(f"LLM stub listening on {server.url}")
+    print(f"  GROQ_BASE_URL={server.url}/openai/v1")
+    print(f"  TOGETHER_BASE_URL={server.url}/v1")
+    print(f"  OLLAMA_BASE_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
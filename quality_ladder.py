@@ -0,0 +1,260 @@
+"""
+Adaptive quality ladder for chat responses
+
+Responses can be produced at four tiers of very different cost:
+
+    crew    CrewAI analyst + therapist (two LLM calls)
+    llm     single-prompt LLM
+    rules   TherapySystem rule-based answer
+    canned  FallbackResponses text
+
+The controller serves each request at the highest tier the current level
+allows and watches in-flight requests, latency and error rate against
+that tier's SLO. It steps down quickly when the SLO is breached and
+steps back up only after the system has been comfortably healthy for a
+while, so it does not flap under a sustained spike. While recovering, a
+small share of requests probes the tier above; stepping up also needs
+enough of those probes answered within that tier's own SLO.
+"""
+import contextlib
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import config
+
+TIERS = ("crew", "llm", "rules", "canned")
+
+
+class _TierStats:
+    __slots__ = ("latency_ewma", "outcomes", "served")
+
+    def __init__(self):
+        self.latency_ewma: Optional[float] = None
+        self.outcomes: deque = deque()  # (timestamp, ok)
+        self.served = 0
+
+    def record(self, latency: float, ok: bool, now: float, alpha: float):
+        self.served += 1
+        self.outcomes.append((now, ok))
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = alpha * latency + (1 - alpha) * self.latency_ewma
+
+    def error_rate(self, now: float, window: float, min_calls: int) -> float:
+        while self.outcomes and self.outcomes[0][0] < now - window:
+            self.outcomes.popleft()
+        if len(self.outcomes) < min_calls:
+            return 0.0
+        return sum(1 for _, ok in self.outcomes if not ok) / len(self.outcomes)
+
+
+class QualityLadder:
+    """
+    Chooses the response tier and adapts it to load
+
+    Args:
+        slos: {tier: (latency SLO seconds, max in-flight requests)}
+        max_error_rate: Error rate that counts as an SLO breach
+        down_after: Consecutive breaches before stepping down
+        recover_after: Healthy seconds required before stepping up
+        min_dwell: Seconds to stay on a level before stepping down again
+        window: Sliding window in seconds for error rates
+        min_calls: Samples required before an error rate counts
+        probe_fraction: Share of requests sent to the tier above while recovering
+        min_probes: Probe answers required before stepping up
+    """
+
+    def __init__(self, slos: Optional[Dict[str, Tuple[float, int]]] = None,
+                 max_error_rate: Optional[float] = None, down_after: Optional[int] = None,
+                 recover_after: Optional[float] = None, min_dwell: Optional[float] = None,
+                 window: Optional[float] = None, min_calls: int = 5, alpha: float = 0.3,
+                 probe_fraction: Optional[float] = None, min_probes: Optional[int] = None):
+        self.slos = slos or config.QUALITY_TIER_SLOS
+        self.max_error_rate = config.QUALITY_MAX_ERROR_RATE if max_error_rate is None else max_error_rate
+        self.down_after = down_after or config.QUALITY_DOWN_AFTER
+        self.recover_after = config.QUALITY_RECOVER_AFTER if recover_after is None else recover_after
+        self.min_dwell = config.QUALITY_MIN_DWELL if min_dwell is None else min_dwell
+        self.window = window or config.BREAKER_WINDOW
+        self.min_calls = min_calls
+        self.alpha = alpha
+        self.probe_fraction = config.QUALITY_PROBE_FRACTION if probe_fraction is None else probe_fraction
+        self.min_probes = config.QUALITY_MIN_PROBES if min_probes is None else min_probes
+        self.level = 0
+        self.in_flight = 0
+        self.transitions = 0
+        self.probes = 0
+        self._probe_credit = 0.0
+        self._stats = {tier: _TierStats() for tier in TIERS}
+        self._breaches = 0
+        self._changed_at = float("-inf")
+        self._healthy_since: Optional[float] = None
+        # Tier the last request was actually served at (may sit below the level)
+        self._serving = TIERS[0]
+        self._available = set(TIERS)
+        self._lock = threading.Lock()
+
+    @property
+    def tier(self) -> str:
+        """Best tier currently allowed"""
+        return TIERS[self.level]
+
+    def choose(self, available: Optional[Iterable[str]] = None) -> str:
+        """
+        Tier for the next request
+
+        Args:
+            available: Tiers that can actually be served right now
+                (e.g. no "crew" without CrewAI); defaults to all
+
+        Returns:
+            The highest available tier at or below the current level, or
+            now and then the tier above it as a recovery probe
+        """
+        allowed = set(available) if available is not None else set(TIERS)
+        with self._lock:
+            self._evaluate(time.monotonic())
+            self._available = allowed
+            tier = next((t for t in TIERS[self.level:] if t in allowed), TIERS[-1])
+            self._serving = tier
+            return self._probe() or tier
+
+    def _probe(self) -> Optional[str]:
+        """The tier above the level for ``probe_fraction`` of requests while recovering"""
+        if self.level == 0 or self._healthy_since is None or TIERS[self.level - 1] not in self._available:
+            return None
+        self._probe_credit += self.probe_fraction
+        if self._probe_credit < 1:
+            return None
+        self._probe_credit -= 1
+        self.probes += 1
+        return TIERS[self.level - 1]
+
+    @contextlib.contextmanager
+    def track(self, tier: str):
+        """
+        Count a request as in flight and record its outcome
+
+        Yields a dict; set ``outcome["ok"] = False`` for a degraded answer
+        that did not raise. Exceptions count as errors and propagate.
+        """
+        outcome = {"ok": True}
+        started = time.monotonic()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield outcome
+        except BaseException:
+            outcome["ok"] = False
+            raise
+        finally:
+            self.record(tier, time.monotonic() - started, outcome["ok"], finished=True)
+
+    def record(self, tier: str, latency: float, ok: bool, finished: bool = False):
+        """Feed one observation (track() calls this for you)"""
+        now = time.monotonic()
+        with self._lock:
+            if finished:
+                self.in_flight -= 1
+            self._stats[tier].record(latency, ok, now, self.alpha)
+            self._evaluate(now)
+
+    def _breached(self, tier: str, now: float) -> bool:
+        """Outside ``tier``'s SLO, judged on that tier's own observations"""
+        latency_slo, max_in_flight = self.slos[tier]
+        stats = self._stats[tier]
+        return (
+            self.in_flight > max_in_flight
+            or (stats.latency_ewma is not None and stats.latency_ewma > latency_slo)
+            or stats.error_rate(now, self.window, self.min_calls) > self.max_error_rate
+        )
+
+    def _comfortable(self, tier: str, current: str, now: float) -> bool:
+        """Serving ``current`` well inside ``tier``'s SLO: the hysteresis band for stepping up"""
+        latency_slo, max_in_flight = self.slos[tier]
+        current = self._stats[current]
+        return (
+            self.in_flight <= max_in_flight / 2
+            and (current.latency_ewma is None or current.latency_ewma <= latency_slo / 2)
+            and current.error_rate(now, self.window, self.min_calls) <= self.max_error_rate / 2
+        )
+
+    def _evaluate(self, now: float):
+        serving = max(self.level, TIERS.index(self._serving))
+        if self._breached(TIERS[serving], now):
+            self._healthy_since = None
+            self._breaches += 1
+            if (self._breaches >= self.down_after and serving < len(TIERS) - 1
+                    and now - self._changed_at >= self.min_dwell):
+                self._move(serving + 1, now)
+            return
+
+        self._breaches = 0
+        if self.level == 0:
+            return
+        if not self._comfortable(TIERS[self.level - 1], TIERS[serving], now):
+            self._healthy_since = None
+            return
+        if self._healthy_since is None:
+            self._healthy_since = now
+        elif now - self._healthy_since >= self.recover_after and self._proven(TIERS[self.level - 1], now):
+            self._move(self.level - 1, now)
+
+    def _proven(self, tier: str, now: float) -> bool:
+        """Probes of ``tier`` came back within its own SLO"""
+        if tier not in self._available:
+            # Not servable anyway, so stepping up changes nothing yet
+            return True
+        return not self._breached(tier, now) and len(self._stats[tier].outcomes) >= self.min_probes
+
+    def _move(self, level: int, now: float):
+        previous = self.tier
+        self.level = level
+        self.transitions += 1
+        self._breaches = 0
+        self._changed_at = now
+        self._healthy_since = None
+        self._probe_credit = 0.0
+        # Judge the new level, and probes of the one above, on fresh observations only
+        for tier in TIERS[max(level - 1, 0):level + 1]:
+            self._stats[tier].latency_ewma = None
+            self._stats[tier].outcomes.clear()
+        print(f"Quality ladder: {previous} -> {self.tier} (in flight: {self.in_flight})")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current tier and per-tier metrics for /api/flight-check"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "tier": self.tier,
+                "in_flight": self.in_flight,
+                "transitions": self.transitions,
+                "probes": self.probes,
+                "tiers": {
+                    tier: {
+                        "slo_latency_s": self.slos[tier][0],
+                        "slo_max_in_flight": self.slos[tier][1],
+                        "latency_ewma_ms": round(s.latency_ewma * 1000, 1) if s.latency_ewma is not None else None,
+                        "error_rate": round(s.error_rate(now, self.window, self.min_calls), 3),
+                        "served": s.served,
+                    }
+                    for tier, s in self._stats.items()
+                },
+            }
+
+
+_ladder: Optional[QualityLadder] = None
+_ladder_lock = threading.Lock()
+
+
+def get_quality_ladder() -> Optional[QualityLadder]:
+    """Process-wide ladder, or None unless QUALITY_LADDER_ENABLED"""
+    global _ladder
+    if not config.QUALITY_LADDER_ENABLED:
+        return None
+    with _ladder_lock:
+        if _ladder is None:
+            _ladder = QualityLadder()
+        return _ladder
@@ -0,0 +1,255 @@
+"""
+Client-side rate limiting for provider quotas
+
+Each provider gets two token buckets (requests per minute and tokens per
+minute) behind a round-robin queue keyed by session, so one chatty
+session cannot starve the others. Waits are bounded: when a request
+could not be admitted within ``max_wait`` it is rejected immediately
+with a retry-after hint instead of tripping the provider's 429.
+"""
+import asyncio
+import contextlib
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+import config
+
+# Session the current request belongs to; set by the API layer
+current_session: contextvars.ContextVar = contextvars.ContextVar("rate_limit_session", default="default")
+
+
+@contextlib.contextmanager
+def session_scope(session_id: str):
+    """Attribute rate-limited calls made inside the block to ``session_id``"""
+    token = current_session.set(session_id or "default")
+    try:
+        yield
+    finally:
+        current_session.reset(token)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request cannot be admitted within the allowed wait"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} rate limit reached; retry after {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def estimate_tokens(text: str, max_tokens: int = 0) -> int:
+    """Rough prompt+completion token estimate (~4 characters per token)"""
+    return len(text) // 4 + 1 + max_tokens
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``per_minute / 60`` per second"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` tokens are available (0 if available now)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """Refund (positive) or charge (negative) tokens after the fact"""
+        self.tokens = min(self.capacity, self.tokens + delta)
+
+
+class ProviderRateLimiter:
+    """
+    RPM + TPM limiter with a fair per-session queue
+
+    Args:
+        name: Provider name used in errors and metrics
+        rpm: Requests per minute
+        tpm: Tokens per minute (None to only limit requests)
+        max_wait: Longest a caller may queue before being rejected
+    """
+
+    def __init__(self, name: str, rpm: float, tpm: Optional[float] = None,
+                 max_wait: Optional[float] = None):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_wait = max_wait if max_wait is not None else config.RATE_LIMIT_MAX_WAIT
+        self._cond = threading.Condition()
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self.admitted = 0
+        self.rejected = 0
+
+    def _bucket_wait(self, tokens: int, requests: int, now: float) -> float:
+        wait = self.requests.wait_time(requests, now)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    def _queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _enqueue(self, session: str, ticket, tokens: int, requests: int, max_wait: float):
+        now = time.monotonic()
+        # Everyone already queued goes first, each needing at least one request slot
+        estimate = self._bucket_wait(tokens, requests, now) + self._queued() / self.requests.rate
+        if estimate > max_wait:
+            self.rejected += 1
+            raise RateLimitExceeded(self.name, estimate)
+        self._queues.setdefault(session, deque()).append(ticket)
+
+    def _dequeue(self, session: str, ticket):
+        queue = self._queues.get(session)
+        if queue is None:
+            return
+        if ticket in queue:
+            queue.remove(ticket)
+        if not queue:
+            del self._queues[session]
+
+    def _try_admit(self, session: str, ticket, tokens: int, requests: int) -> float:
+        """Admit ``ticket`` if it is at the head of the round robin; else return a wait hint"""
+        head_session = next(iter(self._queues))
+        if head_session != session or self._queues[session][0] is not ticket:
+            return -1.0
+        wait = self._bucket_wait(tokens, requests, time.monotonic())
+        if wait > 0:
+            return wait
+        self.requests.take(requests)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+        queue = self._queues.pop(session)
+        queue.popleft()
+        if queue:
+            # Back of the line: other sessions get their turn first
+            self._queues[session] = queue
+        self.admitted += 1
+        return 0.0
+
+    def acquire(self, tokens: int = 1, session: Optional[str] = None,
+                max_wait: Optional[float] = None, requests: int = 1) -> float:
+        """
+        Block until a request of ``tokens`` may be sent
+
+        Args:
+            tokens: Estimated tokens for the request (see estimate_tokens)
+            session: Fairness key (defaults to the current session scope)
+            max_wait: Override for the bounded wait
+            requests: Provider calls this admission covers (multi-step pipelines)
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            RateLimitExceeded: If the request cannot be admitted in time
+        """
+        session = session or current_session.get()
+        max_wait = self.max_wait if max_wait is None else max_wait
+        ticket = object()
+        started = time.monotonic()
+        with self._cond:
+            self._enqueue(session, ticket, tokens, requests, max_wait)
+            while True:
+                wait = self._try_admit(session, ticket, tokens, requests)
+                if wait == 0.0:
+                    self._cond.notify_all()
+                    return time.monotonic() - started
+                left = started + max_wait - time.monotonic()
+                if left <= 0:
+                    self._dequeue(session, ticket)
+                    self.rejected += 1
+                    self._cond.notify_all()
+                    raise RateLimitExceeded(self.name, max(wait, 1.0 / self.requests.rate))
+                self._cond.wait(min(left, wait) if wait > 0 else left)
+
+    async def aacquire(self, tokens: int = 1, session: Optional[str] = None,
+                       max_wait: Optional[float] = None, requests: int = 1) -> float:
+        """Event-loop variant of acquire; shares the same queue and buckets"""
+        session = session or current_session.get()
+        max_wait = self.max_wait if max_wait is None else max_wait
+        ticket = object()
+        started = time.monotonic()
+        with self._cond:
+            self._enqueue(session, ticket, tokens, requests, max_wait)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_admit(session, ticket, tokens, requests)
+                    if wait == 0.0:
+                        self._cond.notify_all()
+                        return time.monotonic() - started
+                left = started + max_wait - time.monotonic()
+                if left <= 0:
+                    with self._cond:
+                        self.rejected += 1
+                    raise RateLimitExceeded(self.name, max(wait, 1.0 / self.requests.rate))
+                await asyncio.sleep(min(left, wait if wait > 0 else 0.05))
+        except BaseException:
+            with self._cond:
+                self._dequeue(session, ticket)
+                self._cond.notify_all()
+            raise
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """Correct the token bucket once the provider reports real usage"""
+        if self.tokens is None or not actual:
+            return
+        with self._cond:
+            self.tokens.adjust(estimated - actual)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            now = time.monotonic()
+            self.requests._refill(now)
+            if self.tokens is not None:
+                self.tokens._refill(now)
+            return {
+                "queued": self._queued(),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "requests_available": round(self.requests.tokens, 2),
+                "tokens_available": round(self.tokens.tokens, 0) if self.tokens is not None else None,
+            }
+
+
+_limiters: Dict[str, ProviderRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> Optional[ProviderRateLimiter]:
+    """
+    Shared limiter for ``provider``, or None if it has no configured quota
+
+    Quotas come from config.PROVIDER_RATE_LIMITS: {provider: (rpm, tpm)}.
+    """
+    limits = config.PROVIDER_RATE_LIMITS.get(provider)
+    if not limits:
+        return None
+    with _limiters_lock:
+        if provider not in _limiters:
+            rpm, tpm = limits
+            _limiters[provider] = ProviderRateLimiter(provider, rpm, tpm)
+        return _limiters[provider]
+
+
+def rate_limit_stats() -> Dict[str, Dict[str, float]]:
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
@@ -0,0 +1,225 @@
+"""
+Near-duplicate response cache
+
+Serves a stored response when a new history-free prompt is close enough
+to one we have already answered ("i feel so lonely tonight" vs "I feel
+really lonely tonight"). Similarity is estimated with MinHash signatures
+and candidates are found through LSH banding, so lookups stay O(bands)
+regardless of cache size. Crisis messages are never cached.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+
+# Filler words that change tone but not what the user is asking about
+FILLER_WORDS = {
+    "a", "an", "the", "so", "really", "very", "just", "quite", "pretty",
+    "too", "am", "im", "i'm", "is", "um", "like", "kind", "of", "bit",
+}
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize(text: str) -> List[str]:
+    """Lowercase, strip punctuation and drop filler words"""
+    tokens = re.findall(r"[a-z0-9']+", text.lower())
+    return [t for t in tokens if t not in FILLER_WORDS]
+
+
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "big")
+
+
+class MinHasher:
+    """MinHash signatures using universal hashing over 64-bit token hashes"""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        self.num_perm = num_perm
+        params = hashlib.blake2b(f"minhash-{seed}".encode(), digest_size=64).digest()
+        self._perms: List[Tuple[int, int]] = []
+        for i in range(num_perm):
+            block = hashlib.blake2b(params + i.to_bytes(4, "big"), digest_size=16).digest()
+            a = int.from_bytes(block[:8], "big") % _MERSENNE_PRIME or 1
+            b = int.from_bytes(block[8:], "big") % _MERSENNE_PRIME
+            self._perms.append((a, b))
+
+    def signature(self, tokens: List[str]) -> Tuple[int, ...]:
+        hashes = {_token_hash(t) for t in tokens} or {0}
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        )
+
+    @staticmethod
+    def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+        """Estimated Jaccard similarity of the underlying token sets"""
+        return sum(x == y for x, y in zip(sig_a, sig_b)) / len(sig_a)
+
+
+class _Entry:
+    __slots__ = ("emotion", "signature", "value", "stored_at")
+
+    def __init__(self, emotion: str, signature: Tuple[int, ...], value: Any):
+        self.emotion = emotion
+        self.signature = signature
+        self.value = value
+        self.stored_at = time.monotonic()
+
+
+class NearDuplicateCache:
+    """
+    Bounded LRU cache keyed by MinHash similarity and exact emotion
+
+    Args:
+        max_size: Maximum number of entries before LRU eviction
+        ttl: Seconds an entry stays valid
+        threshold: Minimum estimated Jaccard similarity for a hit
+        num_perm: MinHash signature length (must be divisible by ``bands``)
+        bands: Number of LSH bands
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600, threshold: float = 0.8,
+                 num_perm: int = 64, bands: int = 16):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple, set] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def is_cacheable(prompt: str, has_history: bool = False) -> bool:
+        """Only history-free, non-crisis turns may be cached"""
+        if has_history:
+            return False
+        lowered = prompt.lower()
+        return not any(keyword in lowered for keyword in config.CRISIS_KEYWORDS)
+
+    def _band_keys(self, emotion: str, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield (emotion, band, signature[band * self.rows:(band + 1) * self.rows])
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        for key in self._band_keys(entry.emotion, entry.signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def get(self, prompt: str, emotion: str = "", has_history: bool = False) -> Optional[Any]:
+        """
+        Look up a response for a near-duplicate prompt
+
+        Args:
+            prompt: Raw user prompt
+            emotion: Emotion label the response was produced for
+            has_history: Whether the turn has prior conversation context
+
+        Returns:
+            Cached value, or None on a miss or for uncacheable turns
+        """
+        if not self.is_cacheable(prompt, has_history):
+            return None
+        signature = self.hasher.signature(normalize(prompt))
+        now = time.monotonic()
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(emotion, signature):
+                candidates |= self._buckets.get(key, set())
+
+            best_id, best_score = None, 0.0
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if now - entry.stored_at > self.ttl:
+                    self._remove(entry_id)
+                    self.expirations += 1
+                    continue
+                score = self.hasher.similarity(signature, entry.signature)
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id].value
+
+    def put(self, prompt: str, value: Any, emotion: str = "", has_history: bool = False):
+        """Store ``value`` for ``prompt``; ignored for uncacheable turns"""
+        if not self.is_cacheable(prompt, has_history):
+            return
+        signature = self.hasher.signature(normalize(prompt))
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(emotion, signature, value)
+            for key in self._band_keys(emotion, signature):
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate metrics for dashboards and /api/flight-check"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+
+_caches: Dict[str, NearDuplicateCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(namespace: str) -> Optional[NearDuplicateCache]:
+    """
+    Shared cache for ``namespace``, or None when caching is disabled
+
+    Caching is opt-in through RESPONSE_CACHE_ENABLED.
+    """
+    if not config.RESPONSE_CACHE_ENABLED:
+        return None
+    with _caches_lock:
+        if namespace not in _caches:
+            _caches[namespace] = NearDuplicateCache(
+                max_size=config.RESPONSE_CACHE_SIZE,
+                ttl=config.RESPONSE_CACHE_TTL,
+                threshold=config.RESPONSE_CACHE_THRESHOLD,
+            )
+        return _caches[namespace]
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Metrics for every cache namespace created so far"""
+    with _caches_lock:
+        return {name: cache.stats() for name, cache in _caches.items()}
@@ -0,0 +1,392 @@
+"""
+Hash-sharded storage: per-user data spread over several SQLite files
+
+A single SQLite file serializes every writer on one lock, so adding API
+workers stops helping once that lock is saturated. In sharded mode the
+file at DB_PATH becomes a small catalog (accounts, conversation
+ownership, message id blocks) and each user's conversations, messages
+and mood logs live in one of DB_SHARDS files chosen by a stable hash of
+``user_id``. Writers for different shards never wait on each other.
+
+    python sharding.py reshard --from 1 --to 4   # migrate an existing single file
+    DB_SHARDS=4 python api_server.py
+    python sharding.py reshard --from 4 --to 8
+"""
+import argparse
+import contextlib
+import functools
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import config
+from database import Database, MessageRow
+
+# Each shard file hands out message ids from its own block, so ids stay
+# unique across shards and survive being merged by a reshard
+ID_BLOCK_BITS = 40
+
+_MASK64 = (1 << 64) - 1
+
+
+def shard_for(user_id: int, shards: int) -> int:
+    """
+    Stable shard index for a user (jump consistent hash)
+
+    Growing from N to N+1 shards moves only about 1/(N+1) of the users.
+    """
+    key = user_id & _MASK64
+    bucket, jump = -1, 0
+    while jump < shards:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & _MASK64
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_paths(db_path: str, shards: int) -> List[str]:
+    """Shard file names derived from the catalog path (``emosup.shard0of4.db``, ...)"""
+    if db_path == ":memory:":
+        raise ValueError("Sharded mode needs file-backed databases")
+    root, ext = os.path.splitext(db_path)
+    return [f"{root}.shard{i}of{shards}{ext}" for i in range(shards)]
+
+
+class ShardedDatabase:
+    """
+    Drop-in replacement for Database with users hash-partitioned across files
+
+    Per-user calls go to exactly one shard; conversation calls are routed
+    through the catalog's conversation -> user directory (cached, since a
+    conversation never changes owner). Maintenance calls fan out to every
+    shard in parallel.
+
+    Args:
+        db_path: Catalog path; shard files sit next to it (default config.DB_PATH)
+        shards: Number of shard files (default config.DB_SHARDS)
+        write_behind: Passed to each shard's Database
+    """
+
+    def __init__(self, db_path: str = None, shards: Optional[int] = None,
+                 write_behind: Optional[bool] = None):
+        self.db_path = db_path or config.DB_PATH
+        self.shard_count = shards or config.DB_SHARDS
+        if self.shard_count < 1:
+            raise ValueError("shards must be at least 1")
+        self.catalog = Database(self.db_path, write_behind=False)
+        with self.catalog.conn as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shard_id_blocks (
+                    block INTEGER PRIMARY KEY AUTOINCREMENT,
+                    path TEXT NOT NULL,
+                    assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+        self.shards = [Database(path, write_behind=write_behind)
+                       for path in shard_paths(self.db_path, self.shard_count)]
+        for shard in self.shards:
+            self._assign_id_block(shard)
+        self._owner = functools.lru_cache(maxsize=config.DB_SHARD_ROUTE_CACHE)(self._lookup_owner)
+        self._pool = ThreadPoolExecutor(self.shard_count, thread_name_prefix="db-shard")
+
+    def _assign_id_block(self, shard: Database):
+        """Start a fresh shard's message ids at its own catalog-assigned block"""
+        conn = shard.conn
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'messages'").fetchone()
+        if row is not None and row[0] >= 1 << ID_BLOCK_BITS:
+            return
+        with self.catalog.conn as catalog:
+            block = catalog.execute("INSERT INTO shard_id_blocks (path) VALUES (?)",
+                                    (shard.db_path,)).lastrowid
+        with conn:
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = 'messages'")
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('messages', ?)",
+                         (block << ID_BLOCK_BITS,))
+
+    # Routing
+    def shard_for_user(self, user_id: int) -> Database:
+        """The shard holding ``user_id``'s data"""
+        return self.shards[shard_for(user_id, self.shard_count)]
+
+    def _lookup_owner(self, conversation_id: int) -> int:
+        row = self.catalog.reader.execute(
+            "SELECT user_id FROM conversations WHERE conversation_id = ?", (conversation_id,)).fetchone()
+        if row is None:
+            # Raised rather than returned so lru_cache never remembers a miss
+            raise LookupError(conversation_id)
+        return row[0]
+
+    def shard_for_conversation(self, conversation_id: int) -> Optional[Database]:
+        """The shard holding a conversation, or None if the catalog has never seen it"""
+        try:
+            return self.shard_for_user(self._owner(conversation_id))
+        except LookupError:
+            return None
+
+    def fan_out(self, fn: Callable[[Database], Any]) -> List[Any]:
+        """
+        Run ``fn(shard)`` on every shard concurrently
+
+        Returns:
+            Results in shard order; the first exception is re-raised
+        """
+        return list(self._pool.map(fn, self.shards))
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Database.batch on every shard; each shard commits its share separately"""
+        with contextlib.ExitStack() as stack:
+            for shard in self.shards:
+                stack.enter_context(shard.batch())
+            yield
+
+    # User Management (catalog)
+    def create_user(self, username: str, email: str, password: str, full_name: str = None) -> Optional[int]:
+        return self.catalog.create_user(username, email, password, full_name)
+
+    def authenticate_user(self, username: str, password: str) -> Optional[Dict[str, Any]]:
+        return self.catalog.authenticate_user(username, password)
+
+    verify_session = staticmethod(Database.verify_session)
+
+    def get_user_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return self.catalog.get_user_by_id(user_id)
+
+    # Conversation Management
+    def create_conversation(self, user_id: int) -> int:
+        """
+        Create a new conversation
+
+        The id is allocated by the catalog, then the row is written to the
+        user's shard. A failure in between leaves an unused directory
+        entry, which is harmless.
+        """
+        conversation_id = self.catalog.create_conversation(user_id)
+        with self.shard_for_user(user_id).conn as conn:
+            conn.execute("INSERT INTO conversations (conversation_id, user_id) VALUES (?, ?)",
+                         (conversation_id, user_id))
+        return conversation_id
+
+    def get_conversation_owner(self, conversation_id: int) -> Optional[int]:
+        try:
+            return self._owner(conversation_id)
+        except LookupError:
+            return None
+
+    def save_message(self, conversation_id: int, role: str, content: str,
+                     emotion: str = None, sentiment_polarity: float = None,
+                     sentiment_subjectivity: float = None):
+        """
+        Save a message to its conversation's shard
+
+        Raises:
+            LookupError: If the conversation was never created
+        """
+        shard = self.shard_for_conversation(conversation_id)
+        if shard is None:
+            raise LookupError(f"Unknown conversation {conversation_id}")
+        shard.save_message(conversation_id, role, content, emotion,
+                           sentiment_polarity, sentiment_subjectivity)
+
+    def get_conversation_history(self, conversation_id: int) -> List[Dict[str, Any]]:
+        shard = self.shard_for_conversation(conversation_id)
+        return shard.get_conversation_history(conversation_id) if shard else []
+
+    def get_message_page(self, conversation_id: int, limit: Optional[int] = None,
+                         before: Optional[Tuple[int, int]] = None
+                         ) -> Tuple[List[MessageRow], Optional[Tuple[int, int]]]:
+        shard = self.shard_for_conversation(conversation_id)
+        return shard.get_message_page(conversation_id, limit, before) if shard else ([], None)
+
+    def iter_conversation(self, conversation_id: int, chunk_size: int = 500,
+                          after: Optional[Tuple[int, int]] = None) -> Iterator[List[MessageRow]]:
+        shard = self.shard_for_conversation(conversation_id)
+        return shard.iter_conversation(conversation_id, chunk_size, after) if shard else iter(())
+
+    def get_user_conversations(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+        return self.shard_for_user(user_id).get_user_conversations(user_id, limit)
+
+    def search_messages(self, user_id: int, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        return self.shard_for_user(user_id).search_messages(user_id, query, limit)
+
+    # Mood Tracking
+    def log_mood(self, user_id: int, mood_score: float, primary_emotion: str = None, notes: str = None):
+        self.shard_for_user(user_id).log_mood(user_id, mood_score, primary_emotion, notes)
+
+    def get_mood_history(self, user_id: int, days: int = 30) -> List[Dict[str, Any]]:
+        return self.shard_for_user(user_id).get_mood_history(user_id, days)
+
+    def get_emotion_statistics(self, user_id: int, days: int = 30) -> Dict[str, int]:
+        return self.shard_for_user(user_id).get_emotion_statistics(user_id, days)
+
+    def get_daily_mood(self, user_id: int, days: int = 30) -> List[Dict[str, Any]]:
+        return self.shard_for_user(user_id).get_daily_mood(user_id, days)
+
+    # Maintenance (fan-out)
+    def check_message_counters(self, repair: bool = False) -> List[Dict[str, Any]]:
+        return [m for found in self.fan_out(lambda s: s.check_message_counters(repair)) for m in found]
+
+    def rebuild_mood_rollups(self):
+        self.fan_out(Database.rebuild_mood_rollups)
+
+    def rebuild_search_index(self):
+        self.fan_out(Database.rebuild_search_index)
+
+    def archive_old_messages(self, older_than_days: Optional[float] = None,
+                             max_rows: Optional[int] = None) -> Dict[str, int]:
+        """Archive on every shard; ``max_rows`` applies per shard"""
+        totals = {"rows": 0, "blobs": 0, "raw_bytes": 0, "compressed_bytes": 0}
+        for moved in self.fan_out(lambda s: s.archive_old_messages(older_than_days, max_rows)):
+            for key, value in moved.items():
+                totals[key] += value
+        return totals
+
+    def archive_stats(self) -> Dict[str, Any]:
+        stats = {"blobs": 0, "rows": 0, "raw_bytes": 0, "compressed_bytes": 0}
+        for shard_stats in self.fan_out(Database.archive_stats):
+            for key in stats:
+                stats[key] += shard_stats[key]
+        stats["saved_bytes"] = stats["raw_bytes"] - stats["compressed_bytes"]
+        stats["ratio"] = round(stats["raw_bytes"] / stats["compressed_bytes"], 2) if stats["compressed_bytes"] else None
+        return stats
+
+    def write_stats(self) -> Optional[List[Optional[Dict[str, Any]]]]:
+        """Per-shard write-behind stats, or None if write-behind is off"""
+        stats = [shard.write_stats() for shard in self.shards]
+        return stats if any(stats) else None
+
+    def close(self):
+        self._pool.shutdown()
+        for shard in self.shards:
+            shard.close()
+        self.catalog.close()
+
+
+def open_database(db_path: str = None, shards: Optional[int] = None, **options):
+    """
+    Database, or ShardedDatabase when more than one shard is configured
+
+    Raises:
+        ValueError: If sharding is switched on over a single-file database
+            that has not been migrated with ``reshard(db_path, 1, shards)``
+    """
+    shards = config.DB_SHARDS if shards is None else shards
+    if shards > 1:
+        db_path = db_path or config.DB_PATH
+        if _holds_unsharded_data(db_path) and not any(os.path.exists(p) for p in shard_paths(db_path, shards)):
+            # Opening it sharded would silently hide every existing conversation
+            raise ValueError(f"{db_path} holds single-file data; migrate it first with "
+                             f"python sharding.py reshard --from 1 --to {shards} --db {db_path}")
+        return ShardedDatabase(db_path, shards, **options)
+    return Database(db_path, **options)
+
+
+def _holds_unsharded_data(db_path: str) -> bool:
+    if db_path == ":memory:" or not os.path.exists(db_path):
+        return False
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return conn.execute("SELECT 1 FROM messages UNION ALL SELECT 1 FROM mood_logs LIMIT 1").fetchone() is not None
+    except sqlite3.OperationalError:
+        return False  # no such table: a fresh or catalog-only file
+    finally:
+        conn.close()
+
+
+# (table, routing column, id column dropped on copy)
+_RESHARD_TABLES = (
+    ("conversations", "user_id", None),
+    ("messages", "conversation_id", None),
+    ("mood_logs", "user_id", "log_id"),
+    ("message_archive", "conversation_id", "archive_id"),
+)
+
+
+def reshard(db_path: str = None, old_shards: int = None, new_shards: int = None,
+            batch_rows: int = 50000) -> Dict[str, int]:
+    """
+    Copy every user's data from an old shard layout into a new one
+
+    Run offline: the old files are only read, so the service can be
+    restarted with DB_SHARDS=new_shards once this returns, and the old
+    shard files deleted after that. ``old_shards=1`` migrates a
+    single-file database: its file becomes the catalog (accounts and the
+    conversation directory are already in place) and its per-user rows
+    are left there untouched, so DB_SHARDS=1 still works as a rollback.
+    Message ids are kept (they are unique across shards); mood log and
+    archive ids are reassigned. Each target is bulk-loaded with its
+    indexes deferred, and each old shard is scanned once per new shard.
+
+    Returns:
+        Rows written per table
+
+    Raises:
+        ValueError: If the layouts match, the target is a single file, or
+            a target shard already holds data
+    """
+    import bulk_io
+
+    db_path = db_path or config.DB_PATH
+    old_shards = old_shards or config.DB_SHARDS
+    if not new_shards or new_shards == old_shards:
+        raise ValueError("new_shards must differ from old_shards")
+    if new_shards == 1:
+        raise ValueError("Merging shards back into a single file is not supported")
+    source = ShardedDatabase(db_path, old_shards, write_behind=False) if old_shards > 1 else None
+    target = ShardedDatabase(db_path, new_shards, write_behind=False)
+    try:
+        # A single file holds its own per-user rows next to the catalog tables
+        old = source.shards if source else [target.catalog]
+        for shard in target.shards:
+            if shard.conn.execute("SELECT 1 FROM conversations LIMIT 1").fetchone():
+                raise ValueError(f"Target shard {shard.db_path} is not empty")
+        owners = [dict(shard.reader.execute("SELECT conversation_id, user_id FROM conversations"))
+                  for shard in old]
+        columns = {}
+        for table, _, dropped in _RESHARD_TABLES:
+            names = [name for name, _, _ in bulk_io.table_columns(old[0], table)]
+            columns[table] = [i for i, name in enumerate(names) if name != dropped], names
+
+        def rows_for(index: int, table: str, route: str) -> Iterator[tuple]:
+            keep, names = columns[table]
+            position = names.index(route)
+            for owner, shard in zip(owners, old):
+                for _, batch in bulk_io.iter_rows(shard, table, batch_rows, include_secrets=True):
+                    for row in batch:
+                        user_id = owner.get(row[position]) if route == "conversation_id" else row[position]
+                        if user_id is not None and shard_for(user_id, new_shards) == index:
+                            yield tuple(row[i] for i in keep)
+
+        totals: Dict[str, int] = {}
+        for index, shard in enumerate(target.shards):
+            sources = [(table, [columns[table][1][i] for i in columns[table][0]], rows_for(index, table, route))
+                       for table, route, _ in _RESHARD_TABLES]
+            for table, count in bulk_io.bulk_load(shard, sources, batch_rows=batch_rows).items():
+                totals[table] = totals.get(table, 0) + count
+        return totals
+    finally:
+        if source:
+            source.close()
+        target.close()
+
+
+def main():
+    """``python sharding.py reshard --from N --to M [--db PATH]``"""
+    parser = argparse.ArgumentParser(description="Sharded database maintenance")
+    parser.add_argument("command", choices=["reshard"])
+    parser.add_argument("--db", default=config.DB_PATH, help="Catalog database path")
+    parser.add_argument("--from", dest="old", type=int, default=config.DB_SHARDS, help="Current shard count")
+    parser.add_argument("--to", dest="new", type=int, required=True, help="New shard count")
+    args = parser.parse_args()
+
+    counts = reshard(args.db, args.old, args.new)
+    print(f"Resharded {args.old} -> {args.new}: " + ", ".join(f"{t}={n}" for t, n in counts.items()))
+    if args.old > 1:
+        print(f"Set DB_SHARDS={args.new}, restart, then remove: " + " ".join(shard_paths(args.db, args.old)))
+    else:
+        print(f"Set DB_SHARDS={args.new} and restart; {args.db} keeps the single-file rows for rollback")
+
+
+if __name__ == "__main__":
+    main()
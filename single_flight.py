@@ -0,0 +1,163 @@
+"""
+Single-flight coalescing of identical in-flight LLM calls
+
+When several requests send the same prompt at the same moment (a popular
+opener, a client retry storm), only the first one reaches the backend.
+The others wait for its result, each with its own timeout, and receive
+the same value or exception. Nothing is cached once the call finishes;
+that is response_cache's job.
+"""
+import asyncio
+import hashlib
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import config
+
+
+def prompt_fingerprint(*parts: str) -> str:
+    """Stable key for a backend call built from its prompt-defining parts"""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update((part or "").encode())
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key
+
+    Args:
+        name: Label used in errors and metrics
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[Any, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run ``fn`` unless a call with ``key`` is already in flight
+
+        The first caller runs ``fn`` on its own thread; later callers
+        block until it finishes.
+
+        Args:
+            key: Call fingerprint (see prompt_fingerprint)
+            fn: Zero-argument callable performing the backend call
+            timeout: Longest a follower waits (the leader is not bounded here)
+
+        Returns:
+            The leader's result
+
+        Raises:
+            TimeoutError: If a follower gives up waiting
+            Exception: Whatever the leader's call raised
+        """
+        if not config.SINGLE_FLIGHT_ENABLED:
+            return fn()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        elif not call.done.wait(timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"{self.name}: timed out waiting for an identical in-flight call")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def ado(self, key: str, coro_factory: Callable[[], Awaitable[Any]],
+                  timeout: Optional[float] = None) -> Any:
+        """
+        Event-loop variant of do
+
+        The shared call runs as its own task, so a waiter that times out
+        or is cancelled (the leader included) does not cancel it for the
+        others. Calls are only shared within one event loop.
+        """
+        if not config.SINGLE_FLIGHT_ENABLED:
+            return await coro_factory()
+        loop = asyncio.get_running_loop()
+        task_key = (id(loop), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = loop.create_task(coro_factory())
+                self._tasks[task_key] = task
+                task.add_done_callback(lambda t: self._forget(task_key, t))
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"{self.name}: timed out waiting for an identical in-flight call")
+
+    def _forget(self, task_key, task: asyncio.Task):
+        with self._lock:
+            if self._tasks.get(task_key) is task:
+                del self._tasks[task_key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every waiter gave up
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls) + len(self._tasks),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "timeouts": self.timeouts,
+            }
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """Process-wide single-flight group for ``name``"""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def single_flight_stats() -> Dict[str, Dict[str, int]]:
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.stats() for group in groups}
@@ -3,7 +3,13 @@ from api_server import app
 import json
 
 @pytest.fixture
-def client():
+def client(tmp_path, monkeypatch):
+    import api_server
+    import config
+    # Keep chat persistence out of the real data directory
+    monkeypatch.setattr(config, "DB_PATH", str(tmp_path / "api.db"))
+    monkeypatch.setattr(api_server, "db", None)
+    monkeypatch.setattr(api_server, "ip_requests", {})
     app.config['TESTING'] = True
     with app.test_client() as client:
         yield client
@@ -23,3 +29,136 @@ def test_flight_check(client):
 def test_chat_no_message(client):
     rv = client.post('/api/chat', json={})
     assert rv.status_code == 400
+
+def test_chat_backpressure_returns_retry_after(client, monkeypatch):
+    import api_server
+    from rate_limiter import RateLimitExceeded
+
+    class SaturatedBot:
+        def get_response(self, message):
+            raise RateLimitExceeded("groq", 2.3)
+
+    monkeypatch.setattr(api_server, "get_chatbot", lambda: SaturatedBot())
+    rv = client.post('/api/chat', json={"message": "hello"})
+    assert rv.status_code == 429
+    assert rv.headers["Retry-After"] == "3"
+    assert json.loads(rv.data)["retry_after"] == 3
+
+
+def test_chat_reports_quality_tier(client, monkeypatch):
+    import api_server
+    from quality_ladder import QualityLadder
+
+    ladder = QualityLadder()
+    ladder.level = 2  # already degraded to rules
+    monkeypatch.setattr(api_server, "get_quality_ladder", lambda: ladder)
+    monkeypatch.setattr(api_server, "get_chatbot", lambda: None)
+
+    rv = client.post('/api/chat', json={"message": "I feel so lonely"})
+    data = json.loads(rv.data)
+    assert rv.status_code == 200
+    assert data["quality_tier"] == "rules"
+    assert data["response_source"] == "deterministic"
+    assert ladder.snapshot()["tiers"]["rules"]["served"] == 1
+
+
+class EchoBot:
+    def get_response(self, message):
+        return {"response": "I hear you.", "emotion": "sad", "is_crisis": False}
+
+
+@pytest.mark.parametrize("shards", [1, 2])
+def test_chat_persists_turn_in_the_callers_conversation(client, monkeypatch, shards):
+    import api_server
+    import config
+    from auth import issue_session_token
+
+    monkeypatch.setattr(config, "DB_SHARDS", shards)
+    monkeypatch.setattr(api_server, "get_chatbot", lambda: EchoBot())
+    database = api_server.get_db()
+    user_id = database.create_user("talker", "talker@example.com", "pass", "User")
+    other = database.create_user("other", "other@example.com", "pass", "User")
+    others_conv = database.create_conversation(other)
+    auth = {"Authorization": f"Bearer {issue_session_token(user_id)}"}
+
+    rv = client.post('/api/chat', json={"message": "I feel low"}, headers=auth)
+    assert rv.status_code == 200
+    conv_id = json.loads(rv.data)["conversation_id"]
+    assert database.get_conversation_owner(conv_id) == user_id
+    # The id handed back keeps the thread going; someone else's is not appended to
+    assert json.loads(client.post('/api/chat', json={"message": "still low", "conversation_id": conv_id},
+                                  headers=auth).data)["conversation_id"] == conv_id
+    assert json.loads(client.post('/api/chat', json={"message": "hi", "conversation_id": others_conv},
+                                  headers=auth).data)["conversation_id"] not in (conv_id, others_conv)
+
+    history = database.get_conversation_history(conv_id)
+    assert [(m["role"], m["content"]) for m in history] == [
+        ("user", "I feel low"), ("assistant", "I hear you."), ("user", "still low"), ("assistant", "I hear you.")]
+    assert database.get_conversation_history(others_conv) == []
+
+    # Anonymous turns have no owner, so nothing is stored
+    assert json.loads(client.post('/api/chat', json={"message": "anyone?"}).data)["conversation_id"] is None
+
+def test_login_issues_token_used_by_chat(client, monkeypatch):
+    import api_server
+
+    class EchoBot:
+        def get_response(self, message):
+            return {"response": "I hear you.", "emotion": "calm", "is_crisis": False}
+
+    monkeypatch.setattr(api_server, "get_chatbot", lambda: EchoBot())
+    database = api_server.get_db()
+    user_id = database.create_user("apiuser", "api@example.com", "pass", "User")
+
+    assert client.post('/api/login', json={"username": "apiuser", "password": "nope"}).status_code == 401
+    rv = client.post('/api/login', json={"username": "apiuser", "password": "pass"})
+    assert rv.status_code == 200
+    token = json.loads(rv.data)["session_token"]
+
+    rv = client.post('/api/chat', json={"message": "hello"}, headers={"Authorization": f"Bearer {token}"})
+    assert rv.status_code == 200
+    assert database.get_emotion_statistics(user_id) == {"calm": 1}
+
+def test_history_pages_with_cursor(client):
+    import api_server
+    from auth import issue_session_token
+
+    database = api_server.get_db()
+    user_id = database.create_user("reader", "reader@example.com", "pass", "User")
+    conv_id = database.create_conversation(user_id)
+    for i in range(5):
+        database.save_message(conv_id, "user", f"m{i}")
+    auth = {"Authorization": f"Bearer {issue_session_token(user_id)}"}
+
+    data = json.loads(client.get(f'/api/history?conversation_id={conv_id}&limit=3', headers=auth).data)
+    assert [m["content"] for m in data["messages"]] == ["m2", "m3", "m4"]
+    data = json.loads(client.get(f'/api/history?conversation_id={conv_id}&limit=3&before={data["before"]}',
+                                 headers=auth).data)
+    assert [m["content"] for m in data["messages"]] == ["m0", "m1"]
+    assert data["before"] is None
+    assert client.get(f'/api/history?conversation_id={conv_id}&before=bogus', headers=auth).status_code == 400
+    # Out-of-range limits are clamped
+    data = json.loads(client.get(f'/api/history?conversation_id={conv_id}&limit=0', headers=auth).data)
+    assert [m["content"] for m in data["messages"]] == ["m4"]
+
+
+def test_history_needs_the_owners_token(client, monkeypatch):
+    import api_server
+    from auth import issue_session_token
+
+    database = api_server.get_db()
+    owner = database.create_user("owner", "owner@example.com", "pass", "User")
+    other = database.create_user("other", "other@example.com", "pass", "User")
+    conv_id = database.create_conversation(owner)
+    url = f'/api/history?conversation_id={conv_id}'
+
+    assert client.get(url).status_code == 401
+    assert client.get(url, headers={"Authorization": "Bearer forged.token"}).status_code == 401
+    assert client.get(url, headers={"Authorization": f"Bearer {issue_session_token(other)}"}).status_code == 404
+    assert client.get('/api/history?conversation_id=999',
+                      headers={"Authorization": f"Bearer {issue_session_token(owner)}"}).status_code == 404
+
+    monkeypatch.setattr(api_server, "ip_requests", {})
+    for _ in range(31):
+        client.get(url)
+    assert client.get(url).status_code == 429
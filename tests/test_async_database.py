@@ -0,0 +1,247 @@
+import asyncio
+import gc
+import threading
+import time
+
+import pytest
+
+import bulk_io
+from async_database import AsyncDatabase
+from database import Database
+from sharding import ShardedDatabase
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "async.db"))
+    bulk_io.seed_benchmark(database, users=10, conversations=100, messages=20000, mood_logs=2000)
+    yield database
+    database.close()
+
+
+class LoopWatch:
+    """
+    Gaps between turns of a task that does nothing but yield to the loop
+
+    ``max_cpu`` is the most CPU the loop thread spent in one gap, i.e. the
+    longest it was blocked by work running on it, and ``cpu_slow`` counts
+    gaps that used over 1ms of it. Wall-clock gaps also include time the OS
+    handed the CPU to the pool threads, so only the share of gaps over 1ms
+    is kept. Nothing is stored per sample: a growing buffer would itself
+    stall the loop when it is reallocated.
+    """
+
+    def __init__(self):
+        self.samples = 0
+        self.slow = 0
+        self.cpu_slow = 0
+        self.max_cpu = 0.0
+
+    async def run(self, stop):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        while not stop.is_set():
+            await asyncio.sleep(0)
+            now_wall, now_cpu = time.perf_counter(), time.thread_time()
+            self.samples += 1
+            self.slow += now_wall - wall > 0.001
+            self.cpu_slow += now_cpu - cpu > 0.001
+            self.max_cpu = max(self.max_cpu, now_cpu - cpu)
+            wall, cpu = now_wall, now_cpu
+
+
+async def under_watch(load):
+    stop, watch = asyncio.Event(), LoopWatch()
+    watcher = asyncio.create_task(watch.run(stop))
+    try:
+        result = await load
+    finally:
+        stop.set()
+        await watcher
+    return result, watch
+
+
+def test_loop_stays_responsive_under_heavy_db_load(db):
+    async def writer(adb, n):
+        for i in range(n):
+            await adb.save_message(1 + i % 100, "user", f"worried about exams {i}", "fear")
+            await adb.log_mood(1 + i % 10, -0.25, "fear")
+
+    async def reader(adb):
+        for conv_id in range(1, 21):
+            await adb.get_conversation_history(conv_id)
+            await adb.search_messages(1 + conv_id % 10, "anxious", 50)
+            await adb.get_emotion_statistics(1 + conv_id % 10, 365)
+
+    async def main():
+        adb = AsyncDatabase(db, workers=4)
+        try:
+            _, watch = await under_watch(asyncio.gather(
+                *[writer(adb, 50) for _ in range(32)],
+                *[reader(adb) for _ in range(4)],
+                adb.rebuild_search_index()))
+            return watch, adb.batches, adb.rows_batched
+        finally:
+            await adb.close()
+
+    # As a latency-sensitive server would after startup: keep the seeded
+    # fixture data out of full collections, which pause whichever thread runs them
+    gc.collect()
+    gc.freeze()
+    try:
+        watch, batches, rows = asyncio.run(main())
+    finally:
+        gc.unfreeze()
+    assert watch.samples > 1000
+    # p99.9 loop turn under 1ms of CPU; a lone turn can still catch a page
+    # fault or young-generation collection, but nothing near a blocking query
+    assert watch.cpu_slow < watch.samples / 1000
+    assert watch.max_cpu < 0.01
+    # p99 wall-clock gap under 1ms; the very worst depend on the host's thread scheduling
+    assert watch.slow < watch.samples / 100
+    # 3200 concurrent inserts shared far fewer commits
+    assert rows == 3200 and batches < rows / 10
+    assert db.check_message_counters() == []
+
+
+def test_watch_detects_blocking_calls_on_the_loop(db):
+    async def blocking():
+        await asyncio.sleep(0)
+        db.rebuild_search_index()
+        await asyncio.sleep(0)
+
+    _, watch = asyncio.run(under_watch(blocking()))
+    assert watch.max_cpu > 0.01 and watch.cpu_slow >= 1
+
+
+def test_batched_writes_fail_per_caller(db):
+    async def main():
+        adb = AsyncDatabase(db)
+        try:
+            results = await asyncio.gather(
+                adb.save_message(1, "user", "first"),
+                adb.save_message(1, "user", None),
+                adb.save_message(1, "assistant", "second", "joy"),
+                return_exceptions=True)
+            page, _ = await adb.get_message_page(1, limit=2)
+            return results, page
+        finally:
+            await adb.close()
+
+    results, page = asyncio.run(main())
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], Exception)
+    assert [row.content for row in page] == ["first", "second"]
+
+
+def test_writes_racing_close_fail_cleanly(db):
+    adb = AsyncDatabase(db, workers=2)
+    outcomes = []
+
+    async def writer(n):
+        for i in range(200):
+            try:
+                await asyncio.wait_for(adb.save_message(1, "user", f"racing {n}-{i}"), 5)
+                outcomes.append("stored")
+            except ConnectionError:
+                outcomes.append("refused")
+                return
+            except Exception as e:
+                outcomes.append(e)
+                return
+
+    # Writers on their own loops, as separate request threads would be
+    threads = [threading.Thread(target=asyncio.run, args=(writer(n),)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    asyncio.run(adb.close())
+    for thread in threads:
+        thread.join()
+    # Every write landed before close() or was refused; none hung or hit the dead pool
+    assert set(outcomes) == {"stored", "refused"}
+    assert db.check_message_counters() == []
+
+
+def test_async_methods_match_sync(db):
+    async def main():
+        adb = AsyncDatabase(db, workers=2)
+        try:
+            streamed = [chunk async for chunk in adb.iter_conversation(3, chunk_size=17)]
+            return (streamed, await adb.get_user_conversations(2), await adb.get_daily_mood(2, 365),
+                    await adb.archive_stats())
+        finally:
+            await adb.close()
+
+    streamed, conversations, daily, archive = asyncio.run(main())
+    assert streamed == list(db.iter_conversation(3, chunk_size=17)) and len(streamed) > 2
+    assert conversations == db.get_user_conversations(2)
+    assert daily == db.get_daily_mood(2, 365)
+    assert archive == db.archive_stats()
+    assert AsyncDatabase.verify_session("not-a-token") is None
+
+
+def test_sharded_backend(tmp_path):
+    sharded = ShardedDatabase(str(tmp_path / "catalog.db"), shards=2)
+    with sharded.catalog.conn as conn:
+        conn.executemany("INSERT INTO users (username, email, password_hash) VALUES (?, ?, '!')",
+                         [(f"u{i}", f"u{i}@example.com") for i in range(6)])
+
+    async def main():
+        adb = AsyncDatabase(sharded)
+        try:
+            conversations = [await adb.create_conversation(user_id) for user_id in range(1, 7)]
+            await asyncio.gather(*[adb.save_message(conv_id, "user", f"hello {conv_id}")
+                                   for conv_id in conversations for _ in range(5)])
+            with pytest.raises(LookupError):
+                await adb.save_message(999, "user", "nobody")
+            return conversations, [await adb.get_conversation_history(c) for c in conversations]
+        finally:
+            await adb.close()
+
+    try:
+        conversations, histories = asyncio.run(main())
+        assert [len(history) for history in histories] == [5] * 6
+        assert sharded.check_message_counters() == []
+    finally:
+        sharded.close()
+
+
+def test_sharded_commit_failure_only_fails_its_own_shard(tmp_path, monkeypatch):
+    import contextlib
+    import sqlite3
+
+    sharded = ShardedDatabase(str(tmp_path / "catalog.db"), shards=2)
+    with sharded.catalog.conn as conn:
+        conn.executemany("INSERT INTO users (username, email, password_hash) VALUES (?, ?, '!')",
+                         [(f"u{i}", f"u{i}@example.com") for i in range(8)])
+    conversations = [sharded.create_conversation(user_id) for user_id in range(1, 9)]
+    broken = sharded.shards[0]
+    real_batch = broken.batch
+
+    @contextlib.contextmanager
+    def failing_commit():
+        with real_batch():
+            yield
+            raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(broken, "batch", failing_commit)
+
+    async def main():
+        adb = AsyncDatabase(sharded, workers=1)
+        try:
+            return await asyncio.gather(*[adb.save_message(conv_id, "user", "hello")
+                                          for conv_id in conversations], return_exceptions=True)
+        finally:
+            await adb.close()
+
+    try:
+        results = asyncio.run(main())
+        for conv_id, result in zip(conversations, results):
+            stored = sharded.get_conversation_history(conv_id)
+            if sharded.shard_for_conversation(conv_id) is broken:
+                assert isinstance(result, sqlite3.OperationalError) and stored == []
+            else:
+                assert result is None and len(stored) == 1
+        assert len(set(map(sharded.shard_for_conversation, conversations))) == 2
+    finally:
+        sharded.close()
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import config
+from async_llm import BackendLimiter, chat_completion, deadline_after, run_sync
+
+REPLY = {"response": "I hear you.", "emotion": "sad", "coping_suggestion": "Breathe."}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible chat completions endpoint"""
+    delay = 0.05
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        json.loads(body)
+        with StubHandler.lock:
+            StubHandler.active += 1
+            StubHandler.peak = max(StubHandler.peak, StubHandler.active)
+        time.sleep(self.delay)
+        with StubHandler.lock:
+            StubHandler.active -= 1
+        data = json.dumps({"choices": [{"message": {"content": json.dumps(REPLY)}}],
+                           "usage": {"total_tokens": 40}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_url():
+    StubHandler.delay = 0.05
+    StubHandler.peak = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+def test_concurrency_is_bounded(stub_url):
+    limiter = BackendLimiter("stub", max_concurrency=8)
+
+    async def run():
+        calls = [
+            chat_completion(f"{stub_url}/chat/completions", "", "m",
+                            [{"role": "user", "content": "hi"}], limiter)
+            for _ in range(40)
+        ]
+        return await asyncio.gather(*calls)
+
+    results = asyncio.run(run())
+    assert len(results) == 40
+    assert json.loads(results[0]) == REPLY
+    assert StubHandler.peak <= 8
+    assert limiter.in_flight == 0
+
+
+def test_bound_holds_across_event_loops(stub_url):
+    limiter = BackendLimiter("stub", max_concurrency=3)
+
+    def request():
+        # One short-lived loop per request, as the sync API paths used to do
+        asyncio.run(chat_completion(f"{stub_url}/chat/completions", "", "m",
+                                    [{"role": "user", "content": "hi"}], limiter))
+
+    threads = [threading.Thread(target=request) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert StubHandler.peak <= 3
+    assert limiter.in_flight == 0
+
+
+def test_run_sync_shares_one_loop():
+    async def current_loop():
+        return asyncio.get_running_loop()
+
+    assert run_sync(current_loop()) is run_sync(current_loop())
+
+
+def test_run_sync_timeout_cancels_the_coroutine():
+    cancelled = threading.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(TimeoutError) as raised:
+        run_sync(slow(), timeout=0.05)
+    assert type(raised.value) is TimeoutError
+    assert cancelled.wait(1)
+
+
+def test_deadline_propagates(stub_url):
+    StubHandler.delay = 1.0
+    limiter = BackendLimiter("stub", max_concurrency=1)
+
+    async def run():
+        return await chat_completion(f"{stub_url}/chat/completions", "", "m",
+                                     [{"role": "user", "content": "hi"}], limiter,
+                                     deadline=deadline_after(0.2))
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        asyncio.run(run())
+    assert time.monotonic() - start < 0.9
+
+
+def test_cancellation_releases_slot(stub_url):
+    StubHandler.delay = 0.5
+    limiter = BackendLimiter("stub", max_concurrency=1)
+
+    async def run():
+        task = asyncio.create_task(chat_completion(
+            f"{stub_url}/chat/completions", "", "m",
+            [{"role": "user", "content": "hi"}], limiter))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return limiter.in_flight
+
+    assert asyncio.run(run()) == 0
+
+
+def test_groq_async_path_settles_token_usage(stub_url, monkeypatch):
+    from free_ai_backends import GroqBackend
+    from rate_limiter import ProviderRateLimiter, estimate_tokens
+
+    monkeypatch.setattr(config, "GROQ_BASE_URL", stub_url)
+    monkeypatch.setenv("GROQ_API_KEY", "gsk_test")
+    backend = GroqBackend()
+    backend.quota = ProviderRateLimiter("groq", rpm=600, tpm=6000)
+    data = backend._build_request("I feel sad today", "sad")
+    estimated = estimate_tokens(data["messages"][-1]["content"], data["max_tokens"])
+
+    asyncio.run(backend.agenerate("I feel sad today", "sad"))
+    # Charged the estimate up front, then refunded all but the 40 actually used
+    assert backend.quota.tokens.tokens == pytest.approx(6000 - 40, abs=5)
+    assert estimated > 100
+
+
+def test_crew_async_path(stub_url, monkeypatch):
+    from crew_bot import EmotionalSupportCrew
+
+    monkeypatch.setattr(config, "GROQ_API_KEY", "gsk_test")
+    monkeypatch.setattr(config, "GROQ_BASE_URL", stub_url)
+    bot = EmotionalSupportCrew()
+    bot.llm = None
+
+    result = asyncio.run(bot.aget_response("I feel sad today"))
+    assert result["response"] == "I hear you."
+    assert result["is_crisis"] is False
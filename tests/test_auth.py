@@ -0,0 +1,56 @@
+import threading
+import time
+
+import pytest
+
+import auth
+from auth import PasswordHasher, issue_session_token, verify_session_token
+from rate_limiter import RateLimitExceeded
+
+
+def test_hasher_round_trip():
+    hasher = PasswordHasher(max_workers=2, max_pending=2, rounds=4)
+    hashed = hasher.hash("secret")
+    assert hasher.verify("secret", hashed)
+    assert not hasher.verify("wrong", hashed)
+
+
+def test_hasher_rejects_when_backlog_full():
+    hasher = PasswordHasher(max_workers=1, max_pending=0, max_wait=0.05, rounds=4)
+    release = threading.Event()
+    hasher._slots.acquire()
+    hasher._pool.submit(release.wait)
+    try:
+        with pytest.raises(RateLimitExceeded):
+            hasher.hash("secret")
+    finally:
+        release.set()
+        hasher._slots.release()
+    assert hasher.verify("secret", hasher.hash("secret"))
+
+
+def test_session_token_round_trip_and_tamper(monkeypatch):
+    monkeypatch.setattr(auth, "_secret", b"k" * 32)
+    token = issue_session_token(42)
+    assert verify_session_token(token)["uid"] == 42
+
+    payload, signature = token.split(".")
+    forged = issue_session_token(7).split(".")[0]
+    assert verify_session_token(f"{forged}.{signature}") is None
+    assert verify_session_token(token + "x") is None
+    assert verify_session_token("garbage") is None
+    assert verify_session_token("pä.yload") is None
+
+    monkeypatch.setattr(auth, "_secret", b"other" * 8)
+    assert verify_session_token(token) is None
+
+
+def test_session_token_expires_and_verifies_fast(monkeypatch):
+    monkeypatch.setattr(auth, "_secret", b"k" * 32)
+    assert verify_session_token(issue_session_token(1, ttl=-1)) is None
+
+    token = issue_session_token(1)
+    started = time.perf_counter()
+    for _ in range(1000):
+        verify_session_token(token)
+    assert (time.perf_counter() - started) / 1000 < 0.001
@@ -0,0 +1,47 @@
+import time
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def make_breaker(**overrides):
+    options = dict(window=60, error_threshold=0.5, min_calls=3, probe_interval=0.05, jitter=0.0)
+    options.update(overrides)
+    return CircuitBreaker("test", **options)
+
+
+def test_opens_after_error_rate_crosses_threshold():
+    breaker = make_breaker()
+    breaker.record_success(0.1)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.health_score() == 0.0
+
+
+def test_half_open_probe_closes_or_reopens():
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # only one probe at a time
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    time.sleep(0.11)  # probe interval doubles after a failed probe
+    assert breaker.allow()
+    breaker.record_success(0.2)
+    assert breaker.state == CLOSED
+    assert breaker.error_rate() == 0.0
+
+
+def test_health_score_prefers_fast_reliable_backends():
+    fast, slow = make_breaker(), make_breaker()
+    fast.record_success(0.1)
+    slow.record_success(2.0)
+    assert fast.health_score() > slow.health_score()
+    assert fast.snapshot()["state"] == CLOSED
@@ -48,3 +48,395 @@ def test_save_and_retrieve_messages(db):
     assert len(history) == 2
     assert history[0]['content'] == "Hello"
     assert history[1]['content'] == "Hi there!"
+
+def test_wal_mode_and_per_thread_connections(db):
+    import threading
+
+    assert db.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    user_id = db.create_user("threaduser", "thread@example.com", "pass", "User")
+    conv_id = db.create_conversation(user_id)
+
+    seen = []
+
+    def writer(n):
+        seen.append(db.conn)
+        for i in range(25):
+            db.save_message(conv_id, "user", f"{n}-{i}")
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len({id(conn) for conn in seen}) == 8
+    assert len(db.get_conversation_history(conv_id)) == 200
+
+def test_analytics_reader_is_read_only(db):
+    import sqlite3
+
+    user_id = db.create_user("reader", "reader@example.com", "pass", "User")
+    db.log_mood(user_id, 0.4, "happy")
+    assert db.get_emotion_statistics(user_id) == {"happy": 1}
+    with pytest.raises(sqlite3.OperationalError):
+        db.reader.execute("DELETE FROM mood_logs")
+
+def test_write_behind_batches_and_flushes_on_close(monkeypatch):
+    import threading
+
+    import config
+
+    path = "data/test_write_behind.sqlite"
+    if os.path.exists(path):
+        os.remove(path)
+    monkeypatch.setattr(config, "DB_WRITE_FLUSH_INTERVAL", 0.2)
+    database = Database(path, write_behind=True)
+    user_id = database.create_user("wbuser", "wb@example.com", "pass", "User")
+    conv_id = database.create_conversation(user_id)
+
+    def worker(n):
+        for i in range(50):
+            database.save_message(conv_id, "user", f"{n}-{i}")
+            database.log_mood(user_id, 0.1, "calm")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # Reads see queued rows (read-your-writes), committed in far fewer transactions
+    assert len(database.get_conversation_history(conv_id)) == 200
+    assert database.get_emotion_statistics(user_id) == {"calm": 200}
+    assert database.write_stats()["batches"] < 20
+
+    database.log_mood(user_id, 0.2, "happy")
+    database.close()
+    reopened = Database(path)
+    assert reopened.get_emotion_statistics(user_id)["happy"] == 1
+    reopened.close()
+    os.remove(path)
+
+def test_authenticate_issues_session_token(db):
+    user_id = db.create_user("tokenuser", "token@example.com", "pass", "User")
+    user = db.authenticate_user("tokenuser", "pass")
+    assert db.verify_session(user["session_token"]) == user_id
+    assert db.verify_session("not-a-token") is None
+
+def test_mood_rollups_track_inserts_deletes_and_backfill(db):
+    user_id = db.create_user("rollup", "rollup@example.com", "pass", "User")
+    for score, emotion in ((0.5, "happy"), (-0.5, "sad"), (0.1, "happy"), (0.0, None)):
+        db.log_mood(user_id, score, emotion)
+    # An entry just inside the window's partial first day is read from raw rows
+    calm = db._lookup_id("emotions", "calm")
+    db.conn.execute("INSERT INTO mood_logs (user_id, mood_score, emotion_id, logged_ms) VALUES "
+                    "(?, 0.2, ?, CAST(strftime('%s', 'now', '-6 days', '-23 hours') AS INTEGER) * 1000)",
+                    (user_id, calm))
+    db.conn.execute("INSERT INTO mood_logs (user_id, mood_score, emotion_id, logged_ms) VALUES "
+                    "(?, 0.9, ?, CAST(strftime('%s', 'now', '-8 days') AS INTEGER) * 1000)", (user_id, calm))
+    db.conn.commit()
+
+    assert db.get_emotion_statistics(user_id, 7) == {"happy": 2, "sad": 1, "calm": 1}
+    today = db.get_daily_mood(user_id, 7)[-1]
+    assert (today["count"], today["min_mood"], today["max_mood"]) == (4, -0.5, 0.5)
+    assert today["avg_mood"] == pytest.approx(0.025)
+
+    with db.conn as conn:
+        conn.execute("DELETE FROM mood_logs WHERE emotion_id = ?", (db._lookup_id("emotions", "sad"),))
+    assert db.get_daily_mood(user_id, 7)[-1]["min_mood"] == 0.0
+
+    rolled = db.conn.execute("SELECT * FROM mood_daily ORDER BY 1, 2, 3").fetchall()
+    db.rebuild_mood_rollups()
+    assert db.conn.execute("SELECT * FROM mood_daily ORDER BY 1, 2, 3").fetchall() == rolled
+
+def test_keyset_pages_and_streaming_chunks(db):
+    user_id = db.create_user("pager", "pager@example.com", "pass", "User")
+    conv_id = db.create_conversation(user_id)
+    for i in range(23):
+        # Same-second timestamps: message_id breaks the tie
+        db.save_message(conv_id, "user", f"m{i}")
+
+    page, older = db.get_message_page(conv_id, limit=10)
+    assert [m.content for m in page] == [f"m{i}" for i in range(13, 23)]
+    seen = [m.content for m in page]
+    while older:
+        page, older = db.get_message_page(conv_id, limit=10, before=older)
+        seen = [m.content for m in page] + seen
+    assert seen == [f"m{i}" for i in range(23)]
+
+    chunks = list(db.iter_conversation(conv_id, chunk_size=10))
+    assert [len(c) for c in chunks] == [10, 10, 3]
+    assert [m.content for c in chunks for m in c] == seen
+    assert list(db.iter_conversation(conv_id, after=chunks[1][-1].key)) == [chunks[2]]
+
+def test_message_counters_maintained_migrated_and_checked(db):
+    import sqlite3
+
+    user_id = db.create_user("counter", "counter@example.com", "pass", "User")
+    conv_id = db.create_conversation(user_id)
+    for i in range(3):
+        db.save_message(conv_id, "user", f"m{i}")
+    [conv] = db.get_user_conversations(user_id)
+    assert conv["message_count"] == 3 and conv["last_message_at"] is not None
+    assert db.check_message_counters() == []
+
+    with db.conn as conn:
+        conn.execute("UPDATE conversations SET message_count = 99")
+    [mismatch] = db.check_message_counters(repair=True)
+    assert (mismatch["message_count"], mismatch["actual_count"]) == (99, 3)
+    assert db.check_message_counters() == []
+
+    # A database from before the counters existed is migrated on open
+    old = "data/test_db_old_schema.sqlite"
+    if os.path.exists(old):
+        os.remove(old)
+    conn = sqlite3.connect(old)
+    conn.executescript("""
+        CREATE TABLE conversations (conversation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL, started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, ended_at TIMESTAMP);
+        CREATE TABLE messages (message_id INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id INTEGER NOT NULL,
+            role TEXT NOT NULL, content TEXT NOT NULL, emotion TEXT, sentiment_polarity REAL,
+            sentiment_subjectivity REAL, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        INSERT INTO conversations (user_id) VALUES (7);
+        INSERT INTO messages (conversation_id, role, content) VALUES (1, 'user', 'a'), (1, 'user', 'b');
+    """)
+    conn.close()
+    migrated = Database(old)
+    try:
+        assert migrated.get_user_conversations(7)[0]["message_count"] == 2
+        assert migrated.check_message_counters() == []
+    finally:
+        migrated.close()
+        os.remove(old)
+
+def test_archive_moves_old_messages_and_reads_stay_transparent(db):
+    from database import ArchiveJob
+
+    user_id = db.create_user("archiver", "archive@example.com", "pass", "User")
+    conv_id = db.create_conversation(user_id)
+    with db.conn as conn:
+        conn.execute("UPDATE conversations SET started_at = datetime('now', '-200 days')")
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, role_id, content, created_ms) "
+            f"VALUES (?, {db._lookup_id('roles', 'user')}, ?, CAST(strftime('%s', 'now', ?) AS INTEGER) * 1000)",
+            [(conv_id, f"old message {i} " * 20, f"-{200 - i} days") for i in range(30)])
+    db.save_message(conv_id, "assistant", "fresh")
+    before = db.get_conversation_history(conv_id)
+
+    job = ArchiveJob(db, batch_rows=20)
+    assert job.run_once()["rows"] == 20
+    assert job.run_once()["rows"] == 10
+    assert job.run_once()["rows"] == 0
+    assert db.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 1
+
+    assert db.get_conversation_history(conv_id) == before
+    page, older = db.get_message_page(conv_id, limit=8)
+    assert [m.content for m in page] == [m["content"] for m in before[-8:]]
+    while older:
+        more, older = db.get_message_page(conv_id, limit=8, before=older)
+        page = more + page
+    assert [m._asdict() for m in page] == before
+    assert db.get_user_conversations(user_id)[0]["message_count"] == 31
+    assert db.check_message_counters() == []
+
+    stats = db.archive_stats()
+    assert (stats["blobs"], stats["rows"]) == (2, 30)
+    assert stats["saved_bytes"] > 0 and stats["ratio"] > 2
+
+    # Streaming reads one blob per query, only as far as the reader gets:
+    # a blob dropped after the first chunk was never loaded
+    stream = db.iter_conversation(conv_id, chunk_size=5)
+    assert [m.content for m in next(stream)] == [m["content"] for m in before[:5]]
+    with db.conn as conn:
+        conn.execute("DELETE FROM message_archive WHERE archive_id = "
+                     "(SELECT MAX(archive_id) FROM message_archive)")
+    assert [m.content for chunk in stream for m in chunk] == [m["content"] for m in before[5:20]] + ["fresh"]
+
+def test_search_messages_ranked_per_user_and_rebuild(db):
+    alice = db.create_user("alice", "alice@example.com", "pass", "User")
+    bob = db.create_user("bob", "bob@example.com", "pass", "User")
+    a_conv, b_conv = db.create_conversation(alice), db.create_conversation(bob)
+    db.save_message(a_conv, "user", "I keep worrying about my exams and sleep")
+    db.save_message(a_conv, "user", "Exams, exams, exams. Worried about exams all week")
+    db.save_message(a_conv, "assistant", "Let's talk about your weekend plans")
+    db.save_message(b_conv, "user", "My exams went fine")
+
+    hits = db.search_messages(alice, "worried exams")
+    assert len(hits) == 2  # stemming: "worrying" matches "worried"
+    assert "[Exams]" in hits[0]["snippet"] and hits[0]["rank"] <= hits[1]["rank"]
+    assert {h["conversation_id"] for h in hits} == {a_conv}
+    assert len(db.search_messages(alice, 'exams"*(')) == 2 and db.search_messages(alice, "***") == []
+
+    with db.conn as conn:
+        conn.execute("UPDATE messages SET content = 'nothing here' WHERE conversation_id = ?", (b_conv,))
+    assert db.search_messages(bob, "exams") == []
+
+    with db.conn as conn:
+        conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('delete-all')")
+    assert db.search_messages(alice, "exams") == []
+    db.rebuild_search_index()
+    assert len(db.search_messages(alice, "exams")) == 2
+
+def test_schema_v1_database_migrates_to_dictionary_encoding():
+    import sqlite3
+
+    path = "data/test_db_v1.sqlite"
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE users (user_id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL, password_hash TEXT NOT NULL, full_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, last_login TIMESTAMP);
+        CREATE TABLE conversations (conversation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL, started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, ended_at TIMESTAMP);
+        CREATE TABLE messages (message_id INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id INTEGER NOT NULL,
+            role TEXT NOT NULL, content TEXT NOT NULL, emotion TEXT, sentiment_polarity REAL,
+            sentiment_subjectivity REAL, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE mood_logs (log_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+            mood_score REAL NOT NULL, primary_emotion TEXT, notes TEXT,
+            logged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE INDEX idx_messages_conv ON messages(conversation_id);
+        INSERT INTO users (username, email, password_hash) VALUES ('old', 'old@example.com', 'x');
+        INSERT INTO conversations (user_id) VALUES (1);
+        INSERT INTO messages (conversation_id, role, content, emotion, timestamp) VALUES
+            (1, 'user', 'hello there', 'joy', '2024-03-01 10:00:00'),
+            (1, 'assistant', 'hi', NULL, '2024-03-01 10:00:05');
+        INSERT INTO mood_logs (user_id, mood_score, primary_emotion, logged_at) VALUES
+            (1, 0.5, 'joy', datetime('now', '-1 hour')), (1, -0.2, 'fear', datetime('now', '-2 hours'));
+    """)
+    conn.close()
+
+    db = Database(path)
+    try:
+        assert db.conn.execute("PRAGMA user_version").fetchone()[0] == 2
+        columns = {row[1] for row in db.conn.execute("PRAGMA table_info(messages)")}
+        assert {"role_id", "emotion_id", "created_ms"} <= columns and "timestamp" not in columns
+        history = db.get_conversation_history(1)
+        assert [(m["role"], m["emotion"], m["timestamp"]) for m in history] == [
+            ("user", "joy", "2024-03-01 10:00:00"), ("assistant", None, "2024-03-01 10:00:05")]
+        assert history[0]["timestamp_ms"] == 1709287200000
+        assert db.get_emotion_statistics(1, 1) == {"joy": 1, "fear": 1}
+        assert [m["primary_emotion"] for m in db.get_mood_history(1, 1)] == ["joy", "fear"]
+        assert db.search_messages(1, "hello")[0]["role"] == "user"
+        assert db.check_message_counters() == []
+
+        # New writes reuse the lookup ids and still round-trip
+        db.save_message(1, "user", "again", "joy")
+        assert db.conn.execute("SELECT COUNT(*) FROM emotions").fetchone()[0] == 2
+        assert db.get_message_page(1, limit=1)[0][0].emotion == "joy"
+    finally:
+        db.close()
+        os.remove(path)
+
+
+def test_opening_existing_database_backfills_mood_rollups():
+    import sqlite3
+
+    path = "data/test_db_existing.sqlite"
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE users (user_id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL, password_hash TEXT NOT NULL, full_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, last_login TIMESTAMP);
+        CREATE TABLE mood_logs (log_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+            mood_score REAL NOT NULL, primary_emotion TEXT, notes TEXT,
+            logged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        INSERT INTO users (username, email, password_hash) VALUES ('old', 'old@example.com', 'x');
+        INSERT INTO mood_logs (user_id, mood_score, primary_emotion) VALUES (1, 0.5, 'joy'), (1, -0.5, 'fear');
+    """)
+    conn.close()
+
+    db = Database(path)
+    try:
+        assert db.get_emotion_statistics(1, 1) == {"joy": 1, "fear": 1}
+        assert db.get_daily_mood(1, 1)[-1]["count"] == 2
+    finally:
+        db.close()
+        os.remove(path)
+
+def test_write_behind_retries_locked_database_and_reports_bad_rows(tmp_path):
+    import sqlite3
+    import threading
+
+    from database import WriteBehindQueue
+
+    path = str(tmp_path / "queue.db")
+    with sqlite3.connect(path) as setup:
+        setup.execute("CREATE TABLE notes (body TEXT NOT NULL)")
+    conn = sqlite3.connect(path, timeout=0, check_same_thread=False)
+    blocker = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    blocker.execute("BEGIN IMMEDIATE")
+
+    writes = WriteBehindQueue(lambda: conn, batch_size=10, flush_interval=0.01, max_pending=100, backoff=0.02)
+    for i in range(5):
+        writes.submit("INSERT INTO notes (body) VALUES (?)", (f"note {i}",))
+    threading.Timer(0.1, blocker.rollback).start()
+    assert writes.flush(5)
+    # Locked, not lost
+    assert conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0] == 5
+    assert writes.retried > 0 and writes.rows_failed == 0
+    writes.close()
+
+    group = WriteBehindQueue(lambda: conn, batch_size=10, flush_interval=0.01, max_pending=100,
+                             durability="group")
+    with pytest.raises(sqlite3.IntegrityError):
+        group.submit("INSERT INTO notes (body) VALUES (?)", (None,))
+    group.submit("INSERT INTO notes (body) VALUES (?)", ("fine",))
+    assert group.stats()["rows_failed"] == 1
+    group.close()
+    with pytest.raises(ConnectionError):
+        group.submit("INSERT INTO notes (body) VALUES (?)", ("late",))
+    assert group.flush(1)
+    assert conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0] == 6
+    conn.close()
+    blocker.close()
+
+def test_new_lookup_names_inside_a_batch_do_not_commit_it(db):
+    user_id = db.create_user("batcher", "batch@example.com", "pass", "User")
+    conv_id = db.create_conversation(user_id)
+
+    with pytest.raises(RuntimeError):
+        with db.batch():
+            db.save_message(conv_id, "user", "first")
+            db.save_message(conv_id, "user", "second", "wistful")
+            raise RuntimeError("abandon the batch")
+    assert db.get_conversation_history(conv_id) == []
+    assert "wistful" not in db._lookup_ids["emotions"]
+
+    with db.batch():
+        db.save_message(conv_id, "user", "third", "wistful")
+        db.log_mood(user_id, 0.1, "wistful")
+    assert [m["emotion"] for m in db.get_conversation_history(conv_id)] == ["wistful"]
+    assert db.get_emotion_statistics(user_id) == {"wistful": 1}
+
+
+def test_failed_batch_commit_rolls_back(db, monkeypatch):
+    import sqlite3
+
+    from database import Database
+
+    user_id = db.create_user("committer", "commit@example.com", "pass", "User")
+    conv_id = db.create_conversation(user_id)
+    real = db.conn
+
+    class FailingCommit:
+        def __getattr__(self, name):
+            return getattr(real, name)
+
+        def commit(self):
+            raise sqlite3.OperationalError("disk I/O error")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(Database, "conn", property(lambda self: FailingCommit()))
+        with pytest.raises(sqlite3.OperationalError):
+            with db.batch():
+                db.save_message(conv_id, "user", "lost", "forlorn")
+    assert not real.in_transaction
+    assert "forlorn" not in db._lookup_ids["emotions"]
+
+    # A later unrelated write must not carry the failed batch with it
+    db.save_message(conv_id, "user", "kept")
+    assert [m["content"] for m in db.get_conversation_history(conv_id)] == ["kept"]
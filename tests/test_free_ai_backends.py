@@ -0,0 +1,204 @@
+import asyncio
+import time
+
+import pytest
+
+from circuit_breaker import CircuitBreaker
+from free_ai_backends import FallbackResponses, FreeAIBackend
+from rate_limiter import RateLimitExceeded
+
+
+class FakeBackend:
+    def __init__(self, name, delay, reply="ok", error=None):
+        self.name = name
+        self.delay = delay
+        self.reply = reply
+        self.error = error
+        self.started = False
+        self.cancelled = False
+        self.calls = 0
+        self.breaker = CircuitBreaker(name, min_calls=3, probe_interval=60)
+
+    def is_configured(self):
+        return True
+
+    async def agenerate(self, prompt, emotion_hint="", deadline=None):
+        self.started = True
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise self.error
+        return self.reply
+
+
+@pytest.fixture
+def backend():
+    return FreeAIBackend()
+
+
+def test_race_returns_first_valid_answer(backend):
+    slow = FakeBackend("slow", 0.5, "slow reply")
+    fast = FakeBackend("fast", 0.01, "fast reply")
+    backend.backends = [slow, fast, FallbackResponses()]
+
+    result = asyncio.run(backend.arace("hello", top_n=2, stagger=0))
+    assert result == "fast reply"
+    assert backend.last_winner == "fast"
+    assert backend.win_counts == {"fast": 1}
+    assert slow.cancelled
+
+
+def test_race_skips_failures(backend):
+    broken = FakeBackend("broken", 0.01, error=RuntimeError("500"))
+    empty = FakeBackend("empty", 0.01, reply=None)
+    good = FakeBackend("good", 0.05, "good reply")
+    backend.backends = [broken, empty, good, FallbackResponses()]
+
+    assert asyncio.run(backend.arace("hello", top_n=3, stagger=0)) == "good reply"
+
+
+def test_stagger_avoids_calling_backups(backend):
+    primary = FakeBackend("primary", 0.01, "primary reply")
+    backup = FakeBackend("backup", 0.01, "backup reply")
+    backend.backends = [primary, backup, FallbackResponses()]
+
+    assert asyncio.run(backend.arace("hello", top_n=2, stagger=0.3)) == "primary reply"
+    assert not backup.started
+
+
+def due_for_probe(fake):
+    fake.breaker.state = "open"
+    fake.breaker._next_probe_at = 0.0
+    return fake
+
+
+def test_cancelled_racers_hand_back_their_probes(backend):
+    primary = FakeBackend("primary", 0.01, "primary reply")
+    racing = due_for_probe(FakeBackend("racing", 1.0, "late reply"))
+    staggered = due_for_probe(FakeBackend("staggered", 0.01, "backup reply"))
+
+    # Loses the race after starting
+    backend.backends = [primary, racing, FallbackResponses()]
+    assert asyncio.run(backend.arace("hello", top_n=2, stagger=0)) == "primary reply"
+    assert racing.cancelled
+    # Cancelled while still waiting out its stagger
+    backend.backends = [primary, staggered, FallbackResponses()]
+    assert asyncio.run(backend.arace("hello", top_n=2, stagger=0.3)) == "primary reply"
+    assert not staggered.started
+
+    assert racing.breaker.state == staggered.breaker.state == "open"
+    assert racing.breaker.allow() and staggered.breaker.allow()
+
+
+def test_cancelled_call_hands_back_its_probe(backend):
+    slow = due_for_probe(FakeBackend("slow", 1.0))
+    backend.backends = [slow, FallbackResponses()]
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(backend._aget_response("hello"), 0.05)
+
+    asyncio.run(run())
+    assert slow.cancelled
+    assert slow.breaker.state == "open"
+
+
+def test_own_quota_hands_back_the_probe(backend):
+    limited = due_for_probe(FakeBackend("limited", 0.0, error=RateLimitExceeded("quota", 1.0)))
+    backend.backends = [limited, FallbackResponses()]
+
+    def over_quota(prompt, emotion_hint=""):
+        raise RateLimitExceeded("quota", 1.0)
+
+    limited.generate = over_quota
+    backend.get_response("hello")
+    assert limited.breaker.state == "open"
+    asyncio.run(backend._aget_response("hello"))
+    assert limited.breaker.state == "open"
+
+
+def test_global_deadline_falls_back(backend):
+    backend.backends = [FakeBackend("a", 1.0), FakeBackend("b", 1.0), FallbackResponses()]
+
+    start = time.monotonic()
+    result = asyncio.run(backend.arace("hello", "sad", top_n=2, stagger=0,
+                                       deadline=time.monotonic() + 0.1))
+    assert time.monotonic() - start < 0.5
+    assert result == FallbackResponses().generate("hello", "sad")
+    assert backend.last_winner is None
+
+
+def test_failing_backend_is_demoted_then_skipped(backend):
+    dead = FakeBackend("dead", 0.0, error=ConnectionError("refused"))
+    alive = FakeBackend("alive", 0.0, "alive reply")
+    backend.backends = [dead, alive, FallbackResponses()]
+
+    for _ in range(5):
+        assert asyncio.run(backend.aget_response("hello")) == "alive reply"
+    # Health ordering puts the failing backend last after one error
+    assert dead.calls == 1
+    assert backend.candidates()[0] is alive
+
+    alive.error = ConnectionError("refused")
+    for _ in range(5):
+        asyncio.run(backend.aget_response("hello"))
+    assert dead.breaker.state == "open"
+    assert dead.calls == 3
+
+
+class StreamingBackend(FakeBackend):
+    def __init__(self, name, deltas, error=None):
+        super().__init__(name, 0.0, error=error)
+        self.deltas = deltas
+
+    def generate_stream(self, prompt, emotion_hint=""):
+        self.calls += 1
+        yield from self.deltas
+        if self.error:
+            raise self.error
+
+
+def test_stream_fails_over_mid_stream(backend):
+    flaky = StreamingBackend("flaky", ["I hear ", "you"], error=ConnectionError("reset"))
+    steady = StreamingBackend("steady", ["That sounds ", "hard."])
+    backend.backends = [flaky, steady, FallbackResponses()]
+
+    assert list(backend.generate_stream("hello")) == ["I hear ", "you", None, "That sounds ", "hard."]
+    assert flaky.breaker.error_rate() == 1.0
+    assert backend.current_backend_index == 1
+
+
+def test_stream_hands_back_the_probe_on_own_quota(backend):
+    limited = due_for_probe(StreamingBackend("limited", [], error=RateLimitExceeded("quota", 1.0)))
+    backend.backends = [limited, FallbackResponses()]
+
+    assert list(backend.generate_stream("hello")) == [FallbackResponses().generate("hello")]
+    assert limited.calls == 1
+    assert limited.breaker.state == "open"
+
+
+def test_stream_uses_whole_reply_from_non_streaming_backends(backend):
+    plain = FakeBackend("plain", 0.0, "whole reply")
+    plain.generate = lambda prompt, emotion_hint="": plain.reply
+    backend.backends = [plain, FallbackResponses()]
+
+    assert list(backend.generate_stream("hello")) == ["whole reply"]
+
+
+def test_groq_streams_over_sse(monkeypatch):
+    import config
+    from free_ai_backends import GroqBackend
+    from llm_stub import LLMStubServer
+
+    with LLMStubServer(ttft=0, tokens_per_second=0) as stub:
+        monkeypatch.setenv("GROQ_API_KEY", "stub")
+        monkeypatch.setattr(config, "GROQ_BASE_URL", f"{stub.url}/openai/v1")
+        groq = GroqBackend()
+        deltas = list(groq.generate_stream("I feel sad"))
+        assert len(deltas) > 1
+        assert "".join(deltas) == groq.generate("I feel sad")
+        assert stub.stats()["streams"] == 1
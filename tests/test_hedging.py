@@ -0,0 +1,88 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import hedging
+from hedging import hedged_call
+
+
+def slow(value, delay):
+    def call():
+        time.sleep(delay)
+        return value
+    return call
+
+
+def test_fast_primary_wins():
+    result, source = hedged_call(slow("llm", 0.01), lambda: "rules", deadline=1.0)
+    assert (result, source) == ("llm", "llm")
+
+
+def test_slow_primary_loses_at_deadline():
+    start = time.monotonic()
+    result, source = hedged_call(slow("llm", 1.0), lambda: "rules", deadline=0.1)
+    assert (result, source) == ("rules", "deterministic")
+    assert time.monotonic() - start < 0.5
+
+
+def test_failed_or_invalid_primary_uses_fallback():
+    def boom():
+        raise RuntimeError("down")
+
+    assert hedged_call(boom, lambda: "rules", deadline=1.0) == ("rules", "deterministic")
+    assert hedged_call(lambda: {"error": "x"}, lambda: {"response": "rules"}, 1.0,
+                       is_valid=lambda r: not r.get("error"))[1] == "deterministic"
+
+
+def test_backlog_is_cancelled_and_bounded(monkeypatch):
+    monkeypatch.setattr(hedging, "_executor", ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(hedging, "_pending", threading.BoundedSemaphore(2))
+    stuck, started = threading.Event(), []
+
+    def hang():
+        started.append(1)
+        stuck.wait(5)
+        return "llm"
+
+    try:
+        # Occupies the only worker past its deadline
+        assert hedged_call(hang, lambda: "rules", deadline=0.05)[1] == "deterministic"
+        # Queued behind it: cancelled at the deadline, never runs
+        assert hedged_call(hang, lambda: "rules", deadline=0.05)[1] == "deterministic"
+        assert hedged_call(hang, lambda: "rules", deadline=0.05)[1] == "deterministic"
+        assert len(started) == 1
+
+        # Backlog full: the fallback comes back without waiting for the deadline
+        hedging._pending.acquire()
+        start = time.monotonic()
+        assert hedged_call(hang, lambda: "rules", deadline=1.0) == ("rules", "deterministic")
+        assert time.monotonic() - start < 0.5
+        hedging._pending.release()
+    finally:
+        stuck.set()
+        hedging._executor.shutdown(wait=True)
+    assert len(started) == 1
+
+
+def test_crew_hedge_keeps_late_llm_out_of_history(monkeypatch):
+    import crew_bot
+    from crew_bot import EmotionalSupportCrew
+
+    monkeypatch.setattr(crew_bot, "has_crewai", lambda: False)
+    bot = EmotionalSupportCrew()
+    bot.llm = MagicMock(spec=["predict"])
+
+    def late_predict(prompt):
+        time.sleep(0.3)
+        return '{"response": "late", "emotion": "sad", "coping_suggestion": null}'
+
+    bot.llm.predict.side_effect = late_predict
+    fallback = {"response": "rules", "emotion": "sad", "coping_suggestion": None, "is_crisis": False}
+
+    result = bot.get_response_hedged("I feel sad", lambda: dict(fallback), deadline=0.05)
+    assert result["response"] == "rules"
+    assert result["response_source"] == "deterministic"
+
+    time.sleep(0.4)
+    assert [m["content"] for m in bot.history] == ["I feel sad", "rules"]
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from http_transport import AsyncHTTPTransport, HTTPTransport
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    drop_after_response = False
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        data = json.dumps({"echo": payload}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        # Simulate an idle timeout on the server without telling the client
+        self.close_connection = KeepAliveHandler.drop_after_response
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    KeepAliveHandler.drop_after_response = False
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    server.shutdown()
+    server.server_close()
+
+
+def test_sync_connections_are_reused(server_url):
+    transport = HTTPTransport(pool_size=4)
+    for i in range(5):
+        assert transport.post_json(server_url, {"n": i}) == {"echo": {"n": i}}
+    assert transport.connections_opened == 1
+    assert transport.connections_reused == 4
+    transport.close()
+
+
+def test_sync_retries_stale_connection(server_url):
+    KeepAliveHandler.drop_after_response = True
+    transport = HTTPTransport(pool_size=4)
+    assert transport.post_json(server_url, {"n": 1}) == {"echo": {"n": 1}}
+    assert transport.post_json(server_url, {"n": 2}) == {"echo": {"n": 2}}
+    assert transport.connections_opened == 2
+
+
+def test_async_connections_are_reused(server_url):
+    transport = AsyncHTTPTransport(pool_size=4)
+
+    async def run():
+        return [await transport.post_json(server_url, {"n": i}) for i in range(5)]
+
+    assert asyncio.run(run())[-1] == {"echo": {"n": 4}}
+    assert transport.connections_opened == 1
+    assert transport.connections_reused == 4
+
+
+def test_async_retries_stale_connection(server_url):
+    KeepAliveHandler.drop_after_response = True
+    transport = AsyncHTTPTransport(pool_size=4)
+
+    async def run():
+        first = await transport.post_json(server_url, {"n": 1})
+        await asyncio.sleep(0.05)
+        return first, await transport.post_json(server_url, {"n": 2})
+
+    assert asyncio.run(run()) == ({"echo": {"n": 1}}, {"echo": {"n": 2}})
+    assert transport.connections_opened == 2
+
+
+def test_async_pools_outlive_requests_on_one_loop(server_url):
+    from async_llm import run_sync
+
+    transport = AsyncHTTPTransport(pool_size=4)
+    for i in range(3):
+        assert run_sync(transport.post_json(server_url, {"n": i})) == {"echo": {"n": i}}
+    assert transport.connections_opened == 1
+    assert transport.connections_reused == 2
+
+
+def test_async_pools_of_closed_loops_are_hung_up(server_url):
+    transport = AsyncHTTPTransport(pool_size=4)
+    for i in range(3):
+        asyncio.run(transport.post_json(server_url, {"n": i}))
+    assert transport.connections_opened == 3
+    assert transport.connections_abandoned == 2
+    assert len(transport._pools) == 1
+
+
+def test_iter_sse_data_handles_multiline_and_comments():
+    from http_transport import iter_sse_data
+
+    lines = [b": keep-alive\n", b"data: {\"a\": 1}\n", b"\n",
+             b"event: x\r\n", b"data: line one\r\n", b"data:line two\r\n", b"\r\n",
+             b"data: [DONE]\n"]
+    assert list(iter_sse_data(lines)) == [b'{"a": 1}', b"line one\nline two", b"[DONE]"]
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = {"crewai", "langchain", "langchain_groq", "langchain_community", "groq", "ollama"}
+# Readiness probes must pass within a few seconds of boot
+IMPORT_BUDGET_US = 1_500_000
+
+
+def import_profile(module):
+    """Run ``python -X importtime`` and return {module: cumulative_us}"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, timeout=60,
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    profile = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        profile[name.strip()] = int(cumulative)
+    return profile
+
+
+@pytest.mark.parametrize("module", ["crew_bot", "api_server"])
+def test_no_heavy_imports_at_module_load(module):
+    profile = import_profile(module)
+    loaded = {name.split(".")[0] for name in profile}
+    assert not loaded & HEAVY_MODULES
+
+
+@pytest.mark.parametrize("module", ["crew_bot", "api_server"])
+def test_import_time_budget(module):
+    profile = import_profile(module)
+    assert profile[module] < IMPORT_BUDGET_US
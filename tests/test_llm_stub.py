@@ -0,0 +1,108 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import config
+from http_transport import HTTPTransport
+from llm_stub import CANNED_REPLIES, LLMStubServer
+
+
+@pytest.fixture
+def stub():
+    with LLMStubServer(ttft=0.01, tokens_per_second=0) as server:
+        yield server
+
+
+def test_groq_and_together_backends_use_stub(stub, monkeypatch):
+    from free_ai_backends import GroqBackend, TogetherBackend
+
+    monkeypatch.setenv("GROQ_API_KEY", "stub")
+    monkeypatch.setenv("TOGETHER_API_KEY", "stub")
+    monkeypatch.setattr(config, "GROQ_BASE_URL", f"{stub.url}/openai/v1")
+    monkeypatch.setattr(config, "TOGETHER_BASE_URL", f"{stub.url}/v1")
+
+    groq = GroqBackend()
+    reply = groq.generate("I feel sad")
+    assert json.loads(reply) in CANNED_REPLIES
+    # Deterministic: same prompt, same reply
+    assert groq.generate("I feel sad") == reply
+    assert json.loads(asyncio.run(TogetherBackend().agenerate("I feel sad"))) in CANNED_REPLIES
+    assert stub.stats()["requests"] == 3
+
+
+def test_crew_async_groq_path_uses_stub(stub, monkeypatch):
+    import crew_bot
+
+    monkeypatch.setattr(crew_bot, "has_crewai", lambda: False)
+    bot = crew_bot.EmotionalSupportCrew()
+    bot.llm = None
+    monkeypatch.setattr(config, "GROQ_API_KEY", "stub")
+    monkeypatch.setattr(config, "GROQ_BASE_URL", f"{stub.url}/openai/v1")
+
+    result = asyncio.run(bot.aget_response("I feel so alone lately"))
+    assert {k: result[k] for k in ("response", "emotion")} in [
+        {k: r[k] for k in ("response", "emotion")} for r in CANNED_REPLIES
+    ]
+    assert len(bot.history) == 2
+
+
+def test_openai_stream_is_paced():
+    with LLMStubServer(ttft=0.1, tokens_per_second=100) as server:
+        response, release = HTTPTransport().open(
+            "POST", f"{server.url}/v1/chat/completions",
+            json.dumps({"messages": [{"role": "user", "content": "hi"}], "stream": True}).encode(),
+            {"Content-Type": "application/json"},
+        )
+        start = time.monotonic()
+        first_at, parts, done = None, [], False
+        for line in response:
+            if not line.startswith(b"data: "):
+                continue
+            data = line[6:].strip()
+            if data == b"[DONE]":
+                done = True
+                continue
+            delta = json.loads(data)["choices"][0]["delta"]
+            if delta.get("content"):
+                first_at = first_at or time.monotonic() - start
+                parts.append(delta["content"])
+        release(True)
+
+    assert done
+    assert json.loads("".join(parts)) in CANNED_REPLIES
+    assert first_at >= 0.05
+    # Remaining tokens arrive at ~100/s after the first one
+    assert time.monotonic() - start >= first_at + (len(parts) - 1) / 100 * 0.8
+
+
+def test_ollama_generate_stream_and_non_stream(stub):
+    transport = HTTPTransport()
+    full = transport.post_json(f"{stub.url}/api/generate",
+                               {"model": "m", "prompt": "hello", "stream": False})
+    assert full["done"] and json.loads(full["response"]) in CANNED_REPLIES
+
+    status, body = transport.request("POST", f"{stub.url}/api/generate",
+                                     json.dumps({"model": "m", "prompt": "hello"}).encode())
+    lines = [json.loads(line) for line in body.decode().splitlines()]
+    assert status == 200 and lines[-1]["done"]
+    assert "".join(line["response"] for line in lines) == full["response"]
+
+
+def test_error_rate_is_seeded():
+    settings = dict(ttft=0, tokens_per_second=0, error_rate=0.5, seed=7)
+    with LLMStubServer(**settings) as a, LLMStubServer(**settings) as b:
+        outcomes = []
+        for server in (a, b):
+            transport = HTTPTransport()
+            run = []
+            for _ in range(20):
+                try:
+                    transport.post_json(f"{server.url}/v1/chat/completions", {"messages": []})
+                    run.append(True)
+                except ConnectionError:
+                    run.append(False)
+            outcomes.append(run)
+    assert outcomes[0] == outcomes[1]
+    assert 0 < outcomes[0].count(False) < 20
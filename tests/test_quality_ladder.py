@@ -0,0 +1,89 @@
+import time
+
+from quality_ladder import QualityLadder
+
+SLOS = {"crew": (1.0, 4), "llm": (0.5, 8), "rules": (0.05, 64), "canned": (0.01, 1 << 30)}
+
+
+def make_ladder(**kwargs):
+    settings = dict(slos=SLOS, max_error_rate=0.2, down_after=2, recover_after=0.1, min_dwell=0)
+    settings.update(kwargs)
+    return QualityLadder(**settings)
+
+
+def test_latency_breach_steps_down_one_tier_at_a_time():
+    ladder = make_ladder()
+    assert ladder.choose() == "crew"
+    ladder.record("crew", 3.0, True)
+    assert ladder.tier == "crew"
+    ladder.record("crew", 3.0, True)
+    assert ladder.tier == "llm"
+    # The new level starts from fresh observations
+    assert ladder.choose() == "llm"
+
+
+def test_errors_and_queue_depth_count_as_breaches():
+    ladder = make_ladder(min_calls=3)
+    for _ in range(4):
+        with ladder.track(ladder.choose()) as outcome:
+            outcome["ok"] = False
+    assert ladder.tier == "llm"
+
+    ladder = make_ladder()
+    tracks = [ladder.track("crew") for _ in range(6)]
+    for t in tracks:
+        t.__enter__()
+    ladder.choose()
+    ladder.choose()
+    assert ladder.tier == "llm"
+    for t in tracks:
+        t.__exit__(None, None, None)
+
+
+def test_steps_up_only_after_sustained_health_and_good_probes():
+    ladder = make_ladder(probe_fraction=0.5, min_probes=2)
+    ladder.record("crew", 3.0, True)
+    ladder.record("crew", 3.0, True)
+    assert ladder.tier == "llm"
+
+    ladder.record("llm", 0.05, True)
+    assert ladder.tier == "llm"
+    # Healthy, so every other request now probes crew
+    assert [ladder.choose() for _ in range(4)] == ["llm", "crew", "llm", "crew"]
+    ladder.record("crew", 0.2, True)
+    time.sleep(0.15)
+    ladder.choose()
+    # Healthy long enough, but only one probe has answered
+    assert ladder.tier == "llm"
+    ladder.record("crew", 0.2, True)
+    assert ladder.tier == "crew"
+    assert ladder.transitions == 2
+    assert ladder.snapshot()["probes"] == 2
+
+
+def test_slow_probes_keep_the_ladder_down():
+    ladder = make_ladder(probe_fraction=0.5, min_probes=2)
+    ladder.record("crew", 3.0, True)
+    ladder.record("crew", 3.0, True)
+    ladder.record("llm", 0.05, True)
+    ladder.choose()
+    time.sleep(0.15)
+    for _ in range(6):
+        ladder.choose()
+        ladder.record("crew", 3.0, True)
+    # The level below is comfortable, but crew itself is still over its SLO
+    assert ladder.tier == "llm"
+    assert ladder.transitions == 1
+
+
+def test_unavailable_tiers_are_skipped():
+    ladder = make_ladder()
+    available = ["llm", "rules", "canned"]
+    assert ladder.choose(available) == "llm"
+    ladder.record("llm", 2.0, True)
+    ladder.record("llm", 2.0, True)
+    # Breaching llm while it stood in for crew goes straight to rules
+    assert ladder.choose(available) == "rules"
+    snapshot = ladder.snapshot()
+    assert snapshot["tier"] == "rules"
+    assert snapshot["tiers"]["llm"]["served"] == 2
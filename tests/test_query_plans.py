@@ -0,0 +1,112 @@
+"""
+Query-plan regression suite for Database
+
+Seeds a synthetic database, captures the SQL each read method actually
+runs, and asserts EXPLAIN QUERY PLAN walks the intended index instead of
+scanning or sorting. Set QUERY_PLAN_ROWS=1000000 for the full-size run;
+per-query latencies are printed and attached to the test report.
+"""
+import os
+import re
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from bulk_io import bulk_load
+from database import Database
+
+ROWS = int(os.getenv("QUERY_PLAN_ROWS", "50000"))
+USERS = max(10, ROWS // 1000)
+CONVERSATIONS = max(10, ROWS // 100)
+EMOTIONS = ("happy", "sad", "anxious", "angry", "calm", None)
+
+
+@pytest.fixture(scope="module")
+def seeded(tmp_path_factory):
+    db = Database(str(tmp_path_factory.mktemp("plans") / "plans.db"))
+    rng = random.Random(7)
+    now = datetime.now(timezone.utc)
+
+    def stamp(i):
+        return (now - timedelta(seconds=ROWS - i)).strftime("%Y-%m-%d %H:%M:%S")
+
+    def spread():
+        return (now - timedelta(days=rng.uniform(0, 90))).strftime("%Y-%m-%d %H:%M:%S")
+
+    bulk_load(db, [
+        ("users", ["user_id", "username", "email", "password_hash"],
+         ((u, f"user{u}", f"user{u}@example.com", "x") for u in range(1, USERS + 1))),
+        ("conversations", ["conversation_id", "user_id"],
+         ((c, c % USERS + 1) for c in range(1, CONVERSATIONS + 1))),
+        ("messages", ["conversation_id", "role", "content", "emotion", "timestamp"],
+         ((rng.randint(1, CONVERSATIONS), "user", f"message {i}", rng.choice(EMOTIONS), stamp(i))
+          for i in range(ROWS))),
+        ("mood_logs", ["user_id", "mood_score", "primary_emotion", "logged_at"],
+         ((rng.randint(1, USERS), rng.uniform(-1, 1), rng.choice(EMOTIONS), spread())
+          for _ in range(ROWS))),
+    ])
+    db.conn.execute("ANALYZE")
+    yield db
+    db.close()
+
+
+def capture(db, method, *args):
+    """Run a Database read method; return (its SELECTs with bound values, seconds)"""
+    statements = []
+    for conn in (db.conn, db.reader):
+        conn.set_trace_callback(statements.append)
+    try:
+        started = time.perf_counter()
+        method(*args)
+        elapsed = time.perf_counter() - started
+    finally:
+        for conn in (db.conn, db.reader):
+            conn.set_trace_callback(None)
+    selects = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+    assert selects, statements
+    return selects, elapsed
+
+
+def query_plan(db, sql):
+    return " | ".join(row["detail"] for row in db.reader.execute(f"EXPLAIN QUERY PLAN {sql}"))
+
+
+# Rollup reads merge two index searches, so they group and sort a
+# day-sized intermediate result
+@pytest.mark.parametrize("method, args, indexes, sorts", [
+    ("get_conversation_history", (3,), ["idx_messages_conv_time", "idx_archive_conv_last"], False),
+    ("get_message_page", (3, 20, (2 ** 62, 0)), ["idx_messages_conv_time"], False),
+    ("get_message_page", (3, 20, (0, 0)), ["idx_messages_conv_time", "idx_archive_conv_last"], False),
+    ("get_user_conversations", (2, 10), ["COVERING INDEX idx_conversations_user_started"], False),
+    ("get_mood_history", (2, 30), ["idx_mood_user_time"], False),
+    ("get_emotion_statistics", (2, 30), ["mood_daily USING PRIMARY KEY", "idx_mood_user_time"], True),
+    ("get_daily_mood", (2, 30), ["mood_daily USING PRIMARY KEY", "idx_mood_user_time"], True),
+])
+def test_read_queries_use_indexes(seeded, record_property, method, args, indexes, sorts):
+    statements, elapsed = capture(seeded, getattr(seeded, method), *args)
+    plan = " || ".join(query_plan(seeded, sql) for sql in statements)
+    for index in indexes:
+        assert index in plan, plan
+    assert not re.search(r"SCAN (?!\(subquery)", plan), plan
+    assert ("TEMP B-TREE" in plan) == sorts, plan
+    record_property(f"{method}_ms", round(elapsed * 1000, 3))
+    print(f"\n{method} over {ROWS} rows: {elapsed * 1000:.2f} ms  [{plan}]")
+
+
+def test_redundant_username_index_dropped(seeded):
+    indexes = {row["name"] for row in seeded.conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'users'")}
+    assert "idx_users_username" not in indexes
+    plan = query_plan(seeded, "SELECT user_id FROM users WHERE username = 'user1'")
+    assert "sqlite_autoindex_users" in plan, plan
+
+
+def test_search_uses_fts_index(seeded, record_property):
+    statements, elapsed = capture(seeded, seeded.search_messages, 2, "message 4242", 20)
+    plan = query_plan(seeded, next(sql for sql in statements if "MATCH" in sql))
+    assert "messages_fts VIRTUAL TABLE INDEX" in plan, plan
+    assert "SEARCH m USING INTEGER PRIMARY KEY" in plan, plan
+    record_property("search_messages_ms", round(elapsed * 1000, 3))
+    print(f"\nsearch_messages over {ROWS} rows: {elapsed * 1000:.2f} ms  [{plan}]")
@@ -0,0 +1,56 @@
+import threading
+import time
+
+import pytest
+
+from rate_limiter import ProviderRateLimiter, RateLimitExceeded, TokenBucket, session_scope
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(per_minute=60, capacity=1)
+    assert bucket.wait_time(1, time.monotonic()) == 0.0
+    bucket.take(1)
+    assert bucket.wait_time(1, time.monotonic()) == pytest.approx(1.0, abs=0.05)
+
+
+def test_rejects_early_with_retry_after():
+    limiter = ProviderRateLimiter("groq", rpm=60, max_wait=0.5)
+    for _ in range(60):
+        limiter.acquire()
+    with pytest.raises(RateLimitExceeded) as exc:
+        limiter.acquire(max_wait=0.2)
+    assert exc.value.retry_after > 0
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_tokens_per_minute_limit():
+    limiter = ProviderRateLimiter("groq", rpm=600, tpm=600, max_wait=0.0)
+    limiter.acquire(tokens=550)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(tokens=100)
+    limiter.settle(estimated=550, actual=100)
+    limiter.acquire(tokens=100)
+
+
+def test_fair_round_robin_across_sessions():
+    # 600 rpm with an empty bucket admits one request every 0.1s
+    limiter = ProviderRateLimiter("groq", rpm=600, max_wait=5)
+    limiter.requests.tokens = 0
+    order = []
+
+    def worker(session):
+        with session_scope(session):
+            limiter.acquire()
+        order.append(session)
+
+    threads = [threading.Thread(target=worker, args=("busy",)) for _ in range(4)]
+    for t in threads:
+        t.start()
+        time.sleep(0.01)
+    quiet = threading.Thread(target=worker, args=("quiet",))
+    quiet.start()
+    for t in threads + [quiet]:
+        t.join()
+
+    # The quiet session is served right after the busy one's first request
+    assert order.index("quiet") <= 1
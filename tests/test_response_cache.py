@@ -0,0 +1,65 @@
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+import config
+import response_cache
+from response_cache import NearDuplicateCache
+
+
+@pytest.fixture
+def cache():
+    return NearDuplicateCache(max_size=3, ttl=60, threshold=0.8)
+
+
+def test_near_duplicate_hit(cache):
+    cache.put("i feel so lonely tonight", "You are not alone.", "lonely")
+    assert cache.get("I feel really lonely tonight!", "lonely") == "You are not alone."
+    assert cache.stats()["hits"] == 1
+
+
+def test_different_prompt_or_emotion_misses(cache):
+    cache.put("i feel so lonely tonight", "You are not alone.", "lonely")
+    assert cache.get("my boss yelled at me in a meeting", "lonely") is None
+    assert cache.get("i feel so lonely tonight", "sad") is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_crisis_and_history_never_cached(cache):
+    cache.put("I want to end my life tonight", "crisis reply")
+    assert cache.stats()["size"] == 0
+    cache.put("i feel so lonely tonight", "reply")
+    assert cache.get("i feel so lonely tonight", has_history=True) is None
+
+
+def test_lru_eviction_and_ttl(cache):
+    for i, topic in enumerate(["work stress", "exam anxiety", "family argument", "money worries"]):
+        cache.put(f"i have {topic}", f"reply {i}")
+    stats = cache.stats()
+    assert stats["size"] == 3
+    assert stats["evictions"] == 1
+    assert cache.get("i have work stress") is None
+
+    cache.ttl = 0.01
+    time.sleep(0.02)
+    assert cache.get("i have money worries") is None
+    assert cache.stats()["expirations"] >= 1
+
+
+def test_crew_fallback_uses_cache(monkeypatch):
+    from crew_bot import EmotionalSupportCrew
+
+    monkeypatch.setattr(config, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(response_cache, "_caches", {})
+    bot = EmotionalSupportCrew()
+    bot.llm = MagicMock(spec=["predict"])
+    bot.llm.predict.return_value = '{"response": "I hear you.", "emotion": "lonely", "coping_suggestion": null}'
+
+    first = bot._run_fallback_logic("i feel so lonely tonight")
+    bot.reset_conversation()
+    second = bot._run_fallback_logic("I feel really lonely tonight")
+
+    assert first["response"] == second["response"] == "I hear you."
+    assert bot.llm.predict.call_count == 1
+    assert len(bot.history) == 2
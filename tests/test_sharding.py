@@ -0,0 +1,179 @@
+import os
+from collections import Counter
+
+import pytest
+
+from database import Database
+from sharding import ID_BLOCK_BITS, ShardedDatabase, open_database, reshard, shard_for, shard_paths
+
+
+def add_users(db, count):
+    """Users straight into the catalog (bcrypt would dominate the test time)"""
+    with db.catalog.conn as conn:
+        conn.executemany("INSERT INTO users (username, email, password_hash) VALUES (?, ?, '!')",
+                         [(f"user{i}", f"user{i}@example.com") for i in range(count)])
+    return [row[0] for row in db.catalog.conn.execute("SELECT user_id FROM users ORDER BY user_id")]
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    db = ShardedDatabase(str(tmp_path / "catalog.db"), shards=3)
+    yield db
+    db.close()
+
+
+def test_shard_for_is_stable_balanced_and_moves_few_users_on_growth():
+    assert [shard_for(i, 4) for i in range(1, 8)] == [shard_for(i, 4) for i in range(1, 8)]
+    counts = Counter(shard_for(i, 4) for i in range(1, 10001))
+    assert sorted(counts) == [0, 1, 2, 3] and min(counts.values()) > 2300
+    moved = sum(shard_for(i, 4) != shard_for(i, 5) for i in range(1, 10001))
+    assert 1500 < moved < 2500
+    assert shard_paths("data/emosup.db", 2) == ["data/emosup.shard0of2.db", "data/emosup.shard1of2.db"]
+
+
+def test_per_user_data_lives_only_on_its_shard(sharded):
+    user_ids = add_users(sharded, 12)
+    conversations = {}
+    for user_id in user_ids:
+        conversations[user_id] = conv_id = sharded.create_conversation(user_id)
+        sharded.save_message(conv_id, "user", f"feeling anxious about exam {user_id}", "fear")
+        sharded.save_message(conv_id, "assistant", "That sounds hard")
+        sharded.log_mood(user_id, 0.25, "fear")
+
+    for user_id, conv_id in conversations.items():
+        home = sharded.shard_for_user(user_id)
+        assert sharded.shard_for_conversation(conv_id) is home
+        assert [m["content"] for m in sharded.get_conversation_history(conv_id)][1] == "That sounds hard"
+        assert sharded.get_user_conversations(user_id)[0]["message_count"] == 2
+        assert sharded.get_emotion_statistics(user_id, 1) == {"fear": 1}
+        assert len(sharded.search_messages(user_id, "anxious")) == 1
+        for other in sharded.shards:
+            if other is not home:
+                assert other.get_conversation_history(conv_id) == []
+                assert other.get_mood_history(user_id, 1) == []
+
+    # Message ids come from per-shard blocks, so they never collide
+    ids = [row[0] for shard in sharded.shards for row in shard.conn.execute("SELECT message_id FROM messages")]
+    assert len(ids) == len(set(ids)) == 24
+    assert min(ids) > 1 << ID_BLOCK_BITS
+    assert len({message_id >> ID_BLOCK_BITS for message_id in ids}) == 3
+
+    assert sharded.check_message_counters() == []
+    assert sharded.get_message_page(10 ** 6) == ([], None)
+    with pytest.raises(LookupError):
+        sharded.save_message(10 ** 6, "user", "lost")
+
+
+def test_accounts_live_in_the_catalog(sharded):
+    user_id = sharded.create_user("alice", "alice@example.com", "pw")
+    assert sharded.authenticate_user("alice", "pw")["user_id"] == user_id
+    assert sharded.get_user_by_id(user_id)["username"] == "alice"
+    assert all(shard.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0 for shard in sharded.shards)
+
+
+def test_reopening_keeps_id_blocks(tmp_path):
+    path = str(tmp_path / "catalog.db")
+    ShardedDatabase(path, shards=2).close()
+    db = ShardedDatabase(path, shards=2)
+    try:
+        assert db.catalog.conn.execute("SELECT COUNT(*) FROM shard_id_blocks").fetchone()[0] == 2
+    finally:
+        db.close()
+
+
+def test_reshard_moves_users_and_keeps_their_history(tmp_path):
+    path = str(tmp_path / "catalog.db")
+    db = ShardedDatabase(path, shards=2)
+    user_ids = add_users(db, 20)
+    for user_id in user_ids:
+        conv_id = db.create_conversation(user_id)
+        for i in range(5):
+            db.save_message(conv_id, "user", f"message {i} from {user_id} about sleep", "sadness")
+        db.log_mood(user_id, -0.5, "sadness")
+    # Some history in the archive tier too
+    for shard in db.shards:
+        with shard.conn as conn:
+            conn.execute("UPDATE conversations SET started_at = datetime('now', '-200 days')")
+            conn.execute("UPDATE messages SET created_ms = created_ms - 200 * 86400000 "
+                         "WHERE message_id % 2 = 0")
+    db.archive_old_messages(older_than_days=100)
+    before = {conv_id: db.get_conversation_history(conv_id) for conv_id in range(1, 21)}
+    hits = {user_id: len(db.search_messages(user_id, "sleep")) for user_id in user_ids}
+    archive = db.archive_stats()
+    assert archive["rows"] > 0
+    db.close()
+
+    assert reshard(path, 2, 3, batch_rows=7) == {
+        "conversations": 20, "messages": 100 - archive["rows"], "mood_logs": 20,
+        "message_archive": archive["blobs"]}
+
+    db = open_database(path, shards=3)
+    try:
+        assert isinstance(db, ShardedDatabase)
+        for conv_id, history in before.items():
+            assert db.get_conversation_history(conv_id) == history
+        for user_id in user_ids:
+            assert db.get_emotion_statistics(user_id, 1) == {"sadness": 1}
+            assert len(db.search_messages(user_id, "sleep")) == hits[user_id]
+        assert db.check_message_counters() == []
+        assert db.archive_stats() == archive
+        # New shards hand out fresh ids above everything copied over
+        db.save_message(1, "assistant", "welcome back")
+        newest = db.get_message_page(1, limit=1)[0][0]
+        assert newest.message_id >> ID_BLOCK_BITS > 2
+    finally:
+        db.close()
+
+    with pytest.raises(ValueError):
+        reshard(path, 2, 3)
+
+
+def test_reshard_migrates_a_single_file_database(tmp_path):
+    path = str(tmp_path / "single.db")
+    db = Database(path)
+    with db.conn as conn:
+        conn.executemany("INSERT INTO users (username, email, password_hash) VALUES (?, ?, '!')",
+                         [(f"user{i}", f"user{i}@example.com") for i in range(8)])
+    for user_id in range(1, 9):
+        conv_id = db.create_conversation(user_id)
+        for i in range(3):
+            db.save_message(conv_id, "user", f"message {i} about sleep", "sadness")
+        db.log_mood(user_id, -0.5, "sadness")
+    before = {conv_id: db.get_conversation_history(conv_id) for conv_id in range(1, 9)}
+    db.close()
+
+    # Switching DB_SHARDS on without migrating would hide all of it
+    with pytest.raises(ValueError):
+        open_database(path, shards=3)
+    assert reshard(path, 1, 3) == {"conversations": 8, "messages": 24, "mood_logs": 8, "message_archive": 0}
+    with pytest.raises(ValueError):
+        reshard(path, 3, 1)
+
+    db = open_database(path, shards=3)
+    try:
+        for conv_id, history in before.items():
+            assert db.get_conversation_history(conv_id) == history
+            assert db.get_conversation_owner(conv_id) == conv_id
+        assert db.get_emotion_statistics(5, 1) == {"sadness": 1}
+        assert len(db.search_messages(5, "sleep")) == 3
+        assert db.check_message_counters() == []
+        new_conv = db.create_conversation(2)
+        assert new_conv == 9 and db.shard_for_conversation(new_conv) is db.shard_for_user(2)
+    finally:
+        db.close()
+
+    # The single file is untouched, so going back is just DB_SHARDS=1
+    single = open_database(path, shards=1)
+    try:
+        assert single.get_conversation_history(3) == before[3]
+    finally:
+        single.close()
+
+
+def test_open_database_defaults_to_single_file(tmp_path):
+    db = open_database(str(tmp_path / "single.db"), shards=1)
+    try:
+        assert isinstance(db, Database)
+        assert not os.path.exists(shard_paths(str(tmp_path / "single.db"), 2)[0])
+    finally:
+        db.close()
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+
+from single_flight import SingleFlight
+
+
+def run_concurrently(n, target):
+    results = [None] * n
+    barrier = threading.Barrier(n)
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = target()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    group = SingleFlight("test")
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.2)
+        return "reply"
+
+    results = run_concurrently(8, lambda: group.do("k", fn, timeout=2))
+    assert results == ["reply"] * 8
+    assert len(calls) == 1
+    assert group.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 7, "timeouts": 0}
+    # Nothing is remembered afterwards
+    assert group.do("k", lambda: "fresh") == "fresh"
+
+
+def test_errors_reach_every_waiter_and_followers_time_out():
+    group = SingleFlight("test")
+
+    def boom():
+        time.sleep(0.1)
+        raise ConnectionError("down")
+
+    results = run_concurrently(4, lambda: group.do("k", boom, timeout=2))
+    assert all(isinstance(r, ConnectionError) for r in results)
+
+    results = run_concurrently(2, lambda: group.do("slow", lambda: time.sleep(0.5) or "late", timeout=0.05))
+    assert sorted(map(type, results), key=str) == sorted([str, TimeoutError], key=str)
+
+
+def test_async_waiter_timeout_does_not_cancel_shared_call():
+    group = SingleFlight("test")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return "reply"
+
+    async def main():
+        impatient = group.ado("k", fetch, timeout=0.05)
+        patient = [group.ado("k", fetch, timeout=1) for _ in range(3)]
+        return await asyncio.gather(impatient, *patient, return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert isinstance(results[0], TimeoutError)
+    assert results[1:] == ["reply"] * 3
+    assert len(calls) == 1
+
+
+def test_free_ai_backend_coalesces_identical_prompts():
+    from test_free_ai_backends import FakeBackend
+    from free_ai_backends import FallbackResponses, FreeAIBackend
+
+    slow = FakeBackend("slow", 0.1, "shared reply")
+    backend = FreeAIBackend()
+    backend.backends = [slow, FallbackResponses()]
+
+    async def main():
+        return await asyncio.gather(*(backend.aget_response("hi there") for _ in range(5)))
+
+    assert asyncio.run(main()) == ["shared reply"] * 5
+    assert slow.calls == 1
+
+
+def test_crew_first_turns_share_one_completion(monkeypatch):
+    from unittest.mock import MagicMock
+
+    import crew_bot
+
+    monkeypatch.setattr(crew_bot, "has_crewai", lambda: False)
+    bots = [crew_bot.EmotionalSupportCrew() for _ in range(3)]
+    llm = MagicMock(spec=["predict"])
+
+    def predict(prompt):
+        time.sleep(0.2)
+        return '{"response": "I hear you.", "emotion": "sad", "coping_suggestion": null}'
+
+    llm.predict.side_effect = predict
+    for bot in bots:
+        bot.llm = llm
+
+    results = []
+    barrier = threading.Barrier(3)
+
+    def worker(bot):
+        barrier.wait()
+        results.append(bot.get_response("hello"))
+
+    threads = [threading.Thread(target=worker, args=(bot,)) for bot in bots]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert [r["response"] for r in results] == ["I hear you."] * 3
+    assert llm.predict.call_count == 1
+    assert all(len(bot.history) == 2 for bot in bots)